@@ -0,0 +1,86 @@
+"""
+Benchmark of all_entities_df on a response the size of the one for sample_scripts/medline_sample.zip.
+
+The legacy implementation walked the response twice: all_entities built every payload record to list the entity
+types, then get_entity_hits_from_json / get_entity_hits_from_docjsonx summarised the hits, the doc.JSONx branch
+rebuilding the records. It is reproduced below for comparison with the single pass EntityHitAggregator.
+
+Usage: python bench_all_entities_df.py
+"""
+
+import copy
+import time
+
+import pandas as pd
+
+from termite_toolkit import termite
+
+from synthetic import medline_sample_response
+
+
+def legacy_records(response):
+    records = []
+    if "RESP_MULTIDOC_PAYLOAD" in response:
+        for payload in response['RESP_MULTIDOC_PAYLOAD'].values():
+            records = records + [hit for hits in payload.values() for hit in hits if termite._keep_hit(hit)]
+    else:
+        for doc in response:
+            for hit in doc.get('termiteTags', []):
+                hit.update(doc)
+                if termite._keep_hit(hit):
+                    records.append(hit)
+    return records
+
+
+def legacy_all_entities_df(response):
+    entities_used = []
+    for hit in legacy_records(response):
+        if hit['entityType'] not in entities_used:
+            entities_used.append(hit['entityType'])
+
+    filtered_hits = {}
+    if "RESP_MULTIDOC_PAYLOAD" in response:
+        hits = [(doc_id, hit) for doc_id, payload in response['RESP_MULTIDOC_PAYLOAD'].items()
+                for hits in payload.values() for hit in hits if termite._keep_hit(hit)]
+    else:
+        hits = [(hit['docID'], hit) for hit in legacy_records(response)]
+    for doc_id, hit in hits:
+        if hit['entityType'] not in entities_used:
+            continue
+        entity_id = hit['entityType'] + '$' + hit['hitID']
+        summary = filtered_hits.get(entity_id)
+        if summary is None:
+            filtered_hits[entity_id] = {"id": hit['hitID'], "type": hit['entityType'], "name": hit['name'],
+                                        "hit_count": hit['hitCount'], "max_relevance_score": hit['score'],
+                                        "doc_id": [doc_id], "doc_count": 1}
+            continue
+        summary['hit_count'] += hit['hitCount']
+        summary['max_relevance_score'] = max(summary['max_relevance_score'], hit['score'])
+        if doc_id not in summary['doc_id']:
+            summary['doc_id'].append(doc_id)
+            summary['doc_count'] += 1
+    return pd.DataFrame(filtered_hits).T
+
+
+def best_of(fn, response, repeat, copy_input):
+    times = []
+    for _ in range(repeat):
+        # the legacy doc.JSONx path modifies its input, give it a fresh copy outside of the timing
+        data = copy.deepcopy(response) if copy_input else response
+        start = time.perf_counter()
+        fn(data)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main(repeat=5):
+    for output in ('json', 'doc.jsonx'):
+        response = medline_sample_response(output)
+        legacy = best_of(legacy_all_entities_df, response, repeat, copy_input=output != 'json')
+        current = best_of(termite.all_entities_df, response, repeat, copy_input=False)
+        print('{:<10} legacy {:>8.1f} ms   single pass {:>8.1f} ms   {:>5.1f}x'.format(
+            output, legacy * 1000, current * 1000, legacy / current))
+
+
+if __name__ == '__main__':
+    main()
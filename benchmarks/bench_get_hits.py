@@ -0,0 +1,76 @@
+"""
+Benchmark of scibiteai.get_hits on dense full-text documents.
+
+The legacy implementation compared every hit location with all of the hits accepted so far and deleted the losers
+from the list by index, O(n^2) per document. It is reproduced below for comparison with the priority ordered
+selection over bisected spans.
+
+Usage: python bench_get_hits.py
+"""
+
+import time
+
+from termite_toolkit import scibiteai
+
+from synthetic import ENTITY_TYPES, docjsonx_response
+
+
+def legacy_get_hits(termiteTags, hierarchy=None, vocabs=None):
+    hits = []
+    for hit in termiteTags:
+        if not vocabs:
+            if hit['entityType'] not in hierarchy:
+                hierarchy[hit['entityType']] = len(hierarchy)
+        elif hit['entityType'] not in vocabs:
+            continue
+
+        if 'fls' in hit['exact_array'][0]:
+            hitLocs, subsumeStates = hit['exact_array'], hit['subsume']
+        else:
+            hitLocs = [{'fls': [loc['sentence'], loc['start'], loc['end']]} for loc in hit['exact_array']]
+            subsumeStates = [loc['subsumed'] for loc in hit['exact_array']]
+
+        for idx, hitLoc in enumerate(hitLocs):
+            if hitLoc['fls'][0] < 1:
+                continue
+            hitInfo = {'entityType': hit['entityType'], 'entityID': hit['hitID'], 'entityName': hit['name'],
+                       'startLoc': hitLoc['fls'][1], 'endLoc': hitLoc['fls'][2]}
+            breakBool = False
+            if subsumeStates[idx] == False:
+                for hitIdx, hit_ in enumerate(hits):
+                    if ((hit_['endLoc'] >= hitInfo['startLoc'] and hit_['endLoc'] <= hitInfo['endLoc']) or
+                            (hit_['startLoc'] >= hitInfo['startLoc'] and hit_['startLoc'] <= hitInfo['endLoc'])):
+                        if hierarchy[hit_['entityType']] >= hierarchy[hitInfo['entityType']]:
+                            del hits[hitIdx]
+                            break
+                        else:
+                            breakBool = True
+                            break
+            if not breakBool:
+                hits.append(hitInfo)
+    return hits
+
+
+def best_of(fn, docs, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for doc in docs:
+            fn(doc['termiteTags'], hierarchy={vocab: idx for idx, vocab in enumerate(ENTITY_TYPES)},
+               vocabs=ENTITY_TYPES)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main(repeat=3):
+    for hits_per_doc, body_chars in ((100, 5000), (500, 20000), (2000, 80000)):
+        docs = docjsonx_response(n_docs=5, hits_per_doc=hits_per_doc, body_chars=body_chars)
+        locations = sum(len(hit['exact_array']) for doc in docs for hit in doc['termiteTags']) // len(docs)
+        legacy = best_of(legacy_get_hits, docs, repeat)
+        current = best_of(scibiteai.get_hits, docs, repeat)
+        print('{:>6} locations/doc   legacy {:>9.1f} ms   current {:>7.1f} ms   {:>6.1f}x'.format(
+            locations, legacy * 1000, current * 1000, legacy / current))
+
+
+if __name__ == '__main__':
+    main()
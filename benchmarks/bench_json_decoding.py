@@ -0,0 +1,36 @@
+"""
+Benchmark of JSON response decoding on a representative doc.JSONx response.
+
+Compares the two paths the toolkit used before decoding was made pluggable (json.loads on the decoded text, as
+scibiteai did, and json.loads on the raw bytes, as response.json() does for UTF-8) with termite_toolkit.decoding,
+which uses orjson when it is installed.
+
+Usage: python bench_json_decoding.py [n_docs]
+"""
+
+import json
+import sys
+import timeit
+
+from termite_toolkit import decoding
+
+from synthetic import docjsonx_response
+
+
+def main(n_docs=2000, repeat=5):
+    raw = json.dumps(docjsonx_response(n_docs=n_docs)).encode('utf-8')
+    print('doc.JSONx response: {} documents, {:.1f} MB'.format(n_docs, len(raw) / 1e6))
+    print('decoder: {}'.format(decoding.get_json_decoder()))
+
+    candidates = [('json.loads(text)', lambda: json.loads(raw.decode('utf-8'))),
+                  ('json.loads(bytes)', lambda: json.loads(raw)),
+                  ('decoding.loads(bytes)', lambda: decoding.loads(raw))]
+    baseline = None
+    for name, fn in candidates:
+        best = min(timeit.repeat(fn, number=1, repeat=repeat))
+        baseline = baseline or best
+        print('{:<24}{:>10.1f} ms{:>8.2f}x'.format(name, best * 1000, baseline / best))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,79 @@
+"""
+Benchmark of scibiteai.markup on long full-text documents.
+
+The legacy implementation rebuilt the whole document string for every substitution and ran the normalisation
+if/elif chain for every hit. It is reproduced below, on top of the current get_hits, for comparison with the
+single pass rewrite using replacement templates compiled once per call.
+
+Usage: python bench_markup.py
+"""
+
+import time
+
+from termite_toolkit import scibiteai
+
+from synthetic import ENTITY_TYPES, docjsonx_response
+
+
+def legacy_markup(docjsonx, normalisation='id', substitute=True, wrap=False, wrapChars=('{!', '!}'), vocabs=None,
+                  replacementDict=None):
+    results = {}
+    hierarchy = {}
+    if vocabs:
+        for idx, vocab in enumerate(vocabs):
+            hierarchy[vocab] = idx
+
+    for docIdx, doc in enumerate(docjsonx):
+        text = doc['body']
+        substitutions = scibiteai.get_hits(doc['termiteTags'], hierarchy=hierarchy, vocabs=vocabs)
+        substitutions = reversed(sorted(substitutions, key=lambda x: x['startLoc']))
+        prefix, postfix = wrapChars if wrap else ('', '')
+
+        for sub in substitutions:
+            if replacementDict:
+                subText = replacementDict[sub['entityType']].replace(
+                    '~TYPE~', sub['entityType']).replace('~ID~', sub['entityID']).replace('~NAME~', sub['entityName'])
+            else:
+                if normalisation == 'id':
+                    subText = '_'.join([sub['entityType'], sub['entityID']])
+                elif normalisation == 'type':
+                    subText = sub['entityType']
+                elif normalisation == 'name':
+                    subText = sub['entityName']
+                elif normalisation == 'typeplusname':
+                    subText = '%s %s' % (sub['entityType'], sub['entityName'])
+                else:
+                    subText = '%s %s' % (sub['entityType'], '_'.join([sub['entityType'], sub['entityID']]))
+                if not substitute:
+                    subText += ' %s' % text[sub['startLoc']:sub['endLoc']]
+            text = text[:sub['startLoc']] + prefix + subText + postfix + text[sub['endLoc']:]
+
+        results[docIdx] = {'termited_text': text}
+    return results
+
+
+def best_of(fn, docs, repeat, **kwargs):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(docs, **kwargs)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main(repeat=3):
+    for hits_per_doc, body_chars in ((100, 5000), (500, 50000), (2000, 500000)):
+        docs = docjsonx_response(n_docs=5, hits_per_doc=hits_per_doc, body_chars=body_chars)
+        for kwargs in ({'normalisation': 'typeplusid', 'substitute': False, 'wrap': True},
+                       {'replacementDict': {vocab: 'ENTITY_~TYPE~_~ID~' for vocab in ENTITY_TYPES}}):
+            assert legacy_markup(docs, vocabs=ENTITY_TYPES, **kwargs) == scibiteai.markup(docs, vocabs=ENTITY_TYPES,
+                                                                                          **kwargs)
+            legacy = best_of(legacy_markup, docs, repeat, vocabs=ENTITY_TYPES, **kwargs)
+            current = best_of(scibiteai.markup, docs, repeat, vocabs=ENTITY_TYPES, **kwargs)
+            print('{:>7} chars/doc {:<16} legacy {:>8.1f} ms   single pass {:>8.1f} ms   {:>5.1f}x'.format(
+                body_chars, 'replacementDict' if 'replacementDict' in kwargs else kwargs['normalisation'],
+                legacy * 1000, current * 1000, legacy / current))
+
+
+if __name__ == '__main__':
+    main()
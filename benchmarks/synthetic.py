@@ -0,0 +1,135 @@
+"""
+Synthetic TERMite responses for the benchmarks in this directory.
+
+The responses mimic the shape of real TERMite 6.4 output: every hit carries its synonym list, fragment vectors and
+exact_array locations, and doc.JSONx documents carry their full body. Generation is seeded so runs are comparable.
+"""
+
+import random
+
+ENTITY_TYPES = ['GENE', 'DRUG', 'INDICATION', 'SPECIES', 'CELLTYPE', 'GOONTOL']
+
+WORDS = ['patients', 'treated', 'with', 'showed', 'reduced', 'expression', 'of', 'in', 'the', 'cohort', 'and',
+         'significant', 'response', 'tumour', 'cells', 'were', 'observed', 'after', 'weeks', 'dose']
+
+
+def _body(rng, n_chars):
+    words = []
+    length = 0
+    while length < n_chars:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return ' '.join(words)[:n_chars]
+
+
+def _hit(rng, doc_id, entity_type, entity_idx, n_locations, body_len, sentences=20):
+    exact_array = []
+    for _ in range(n_locations):
+        start = rng.randrange(0, max(1, body_len - 20))
+        exact_array.append({'sentence': rng.randrange(1, sentences + 1), 'start': start,
+                            'end': start + rng.randrange(3, 20), 'subsumed': rng.random() < 0.05})
+    name = '{} entity {}'.format(entity_type.lower(), entity_idx)
+    return {'hitID': '{}{:06d}'.format(entity_type[0], entity_idx),
+            'entityType': entity_type,
+            'name': name,
+            'score': rng.randrange(0, 6),
+            'realSynList': [name, name.upper()],
+            'totnosyns': rng.randrange(1, 4),
+            'nonambigsyns': rng.randrange(0, 3),
+            'frag_vector_array': ['{}#{}#{}#{}'.format(e['sentence'], e['start'], e['end'], name)
+                                  for e in exact_array],
+            'hitCount': n_locations,
+            'exact_array': exact_array,
+            'subsume': [e['subsumed'] for e in exact_array],
+            'docID': doc_id}
+
+
+def docjsonx_response(n_docs=100, hits_per_doc=30, body_chars=2000, n_entities=5000, seed=0):
+    """
+    A doc.JSONx response: a list of documents, each with its body and termiteTags
+    """
+    rng = random.Random(seed)
+    docs = []
+    for d in range(n_docs):
+        doc_id = 'PMID{:08d}'.format(d)
+        body = _body(rng, body_chars)
+        tags = []
+        seen = set()
+        for _ in range(hits_per_doc):
+            entity_type = rng.choice(ENTITY_TYPES)
+            entity_idx = rng.randrange(n_entities)
+            if (entity_type, entity_idx) in seen:
+                continue
+            seen.add((entity_type, entity_idx))
+            tags.append(_hit(rng, doc_id, entity_type, entity_idx, rng.randrange(1, 6), len(body)))
+        docs.append({'docID': doc_id, 'title': 'Document {}'.format(d), 'body': body, 'termiteTags': tags})
+    return docs
+
+
+def json_response(n_docs=100, hits_per_doc=30, body_chars=2000, n_entities=5000, seed=0):
+    """
+    A JSON response with RESP_MULTIDOC_PAYLOAD, holding the same hits as docjsonx_response with the same arguments
+    """
+    payload = {}
+    for doc in docjsonx_response(n_docs, hits_per_doc, body_chars, n_entities, seed):
+        doc_payload = {}
+        for hit in doc['termiteTags']:
+            doc_payload.setdefault(hit['entityType'], []).append(hit)
+        payload[doc['docID']] = doc_payload
+    return {'RESP_META': {'termite_version': '6.4'}, 'RESP_MULTIDOC_PAYLOAD': payload}
+
+
+# number of MEDLINE abstracts in sample_scripts/medline_sample.zip
+MEDLINE_SAMPLE_DOCS = 743
+
+
+def medline_sample_response(output='json', seed=0):
+    """
+    A response the size of the one TERMite returns for sample_scripts/medline_sample.zip
+
+    :param output: json or doc.jsonx
+    """
+    kwargs = dict(n_docs=MEDLINE_SAMPLE_DOCS, hits_per_doc=25, body_chars=1500, seed=seed)
+    if output == 'json':
+        return json_response(**kwargs)
+    return docjsonx_response(**kwargs)
+
+
+def _pattern_hits(rng, n_matches, n_entities):
+    matches = []
+    for _ in range(n_matches):
+        sentence = rng.randrange(0, 20)
+        entities = ['{}#{}{:06d}'.format(t, t[0], rng.randrange(n_entities))
+                    for t in rng.sample(ENTITY_TYPES[:3], rng.randrange(2, 4))]
+        fragment = ' and '.join(e.split('#')[1] for e in entities)
+        matches.append({'originalFragment': fragment, 'matchEntities': entities,
+                        'originalSentence': '{} {}'.format(fragment, _body(rng, 120)), 'sentence': sentence,
+                        'subsumed': rng.random() < 0.1, 'start': rng.randrange(0, 1000)})
+    return {'matches': matches, 'meta': {'patternName': 'gene-indication', 'version': '1'}, 'hitCount': n_matches}
+
+
+def texpress_json_response(n_docs=100, patterns=('USR_1', 'USR_2'), matches_per_pattern=5, n_entities=5000, seed=0):
+    """
+    A TExpress JSON response with RESP_TEXPRESS
+    """
+    rng = random.Random(seed)
+    resp = {}
+    for d in range(n_docs):
+        resp['PMID{:08d}'.format(d)] = {p: [_pattern_hits(rng, rng.randrange(0, matches_per_pattern + 1), n_entities)]
+                                        for p in patterns}
+    return {'RESP_META': {'texpress_version': '6.4'}, 'RESP_TEXPRESS': resp}
+
+
+def texpress_docjsonx_response(n_docs=100, patterns=('USR_1', 'USR_2'), matches_per_pattern=5, body_chars=2000,
+                               n_entities=5000, seed=0):
+    """
+    A TExpress doc.JSONx response: a list of documents, each with its body and texpressTags
+    """
+    rng = random.Random(seed)
+    docs = []
+    for d in range(n_docs):
+        tags = {p: [_pattern_hits(rng, rng.randrange(0, matches_per_pattern + 1), n_entities)] for p in patterns}
+        docs.append({'docID': 'PMID{:08d}'.format(d), 'title': 'Document {}'.format(d),
+                     'body': _body(rng, body_chars), 'texpressTags': tags})
+    return docs
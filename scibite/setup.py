@@ -16,6 +16,12 @@ setuptools.setup(name='termite_toolkit',
                  install_requires=[
                      "requests>=2.8.1"
                  ],
+                 extras_require={
+                     "async": ["aiohttp>=3.6"],
+                     "fast-json": ["orjson"],
+                     "sparse": ["scipy"],
+                     "parquet": ["pyarrow"],
+                 },
                  author='SciBite DataScience',
                  author_email='joe@scibite.com',
                  long_description=long_description,
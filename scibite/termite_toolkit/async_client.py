@@ -0,0 +1,265 @@
+"""
+
+  ____       _ ____  _ _         _____ _____ ____  __  __ _ _         _____           _ _    _ _
+ / ___|  ___(_) __ )(_) |_ ___  |_   _| ____|  _ \|  \/  (_) |_ ___  |_   _|__   ___ | | | _(_) |_
+ \___ \ / __| |  _ \| | __/ _ \   | | |  _| | |_) | |\/| | | __/ _ \   | |/ _ \ / _ \| | |/ / | __|
+  ___) | (__| | |_) | | ||  __/   | | | |___|  _ <| |  | | | ||  __/   | | (_) | (_) | |   <| | |_
+ |____/ \___|_|____/|_|\__\___|   |_| |_____|_| \_\_|  |_|_|\__\___|   |_|\___/ \___/|_|_|\_\_|\__|
+
+
+
+AsyncTermiteClient- make concurrent requests to the TERMite API from asyncio code.
+
+"""
+
+__author__ = 'SciBite DataScience'
+__version__ = '0.2'
+__copyright__ = '(c) 2019, SciBite Ltd'
+__license__ = 'Creative Commons Attribution-NonCommercial-ShareAlike 4.0 International License'
+
+import asyncio
+import os
+import ssl
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from .decoding import loads
+from .retry import RetryPolicy, CircuitBreaker
+from .termite import TermiteRequestBuilder
+
+
+class AsyncTermiteClient():
+    """
+    Asyncio counterpart of TermiteRequestBuilder. Requests are sent over a single pooled aiohttp session and the number
+    of requests in flight is bounded by a semaphore, so one process can keep a TERMite cluster busy without the caller
+    having to manage thread pools. The URL, credentials and SSL verification are read on every request, so they can be
+    changed at any time.
+
+    Requires the optional aiohttp dependency (pip install termite_toolkit[async]).
+    """
+
+    def __init__(self, url='http://localhost:9090/termite', concurrency=10, retry_policy=None, breaker_threshold=5,
+                 breaker_reset_timeout=30):
+        """
+        :param url: the URL of the TERMite instance to be hit
+        :param concurrency: maximum number of requests in flight at any time
+        :param retry_policy: RetryPolicy deciding which requests are retried, RetryPolicy(total=0) disables retrying
+        :param breaker_threshold: consecutive failures after which the circuit to TERMite opens, None disables it
+        :param breaker_reset_timeout: seconds an open circuit waits before letting a trial request through
+        """
+        if aiohttp is None:
+            raise ImportError("AsyncTermiteClient requires aiohttp, install it with: pip install aiohttp")
+        self.url = url
+        self.concurrency = concurrency
+        self.basic_auth = ()
+        self.verify_request = True
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_reset_timeout) if breaker_threshold else None
+        self._session = None
+        self._semaphore = None
+        self._ssl_contexts = {}
+
+    def set_url(self, url):
+        """
+        Set the URL of the TERMite instance e.g. for local instance http://localhost:9090/termite
+
+        :param url: the URL of the TERMite instance to be hit
+        """
+        self.url = url
+
+    def set_basic_auth(self, username='', password='', verification=True):
+        """
+        Pass basic authentication credentials
+        **ONLY change verification if you are calling a known source**
+
+        :param username: username to be used for basic authentication
+        :param password: password to be used for basic authentication
+        :param verification: if set to False the SSL certificate will not be verified, can also pass the path
+        to a certificate file
+        """
+        self.basic_auth = (username, password)
+        self.verify_request = verification
+
+    def _get_session(self):
+        """
+        Create the aiohttp session on first use, it has to be created from inside the running event loop
+
+        :return: aiohttp.ClientSession
+        """
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.concurrency)
+            self._session = aiohttp.ClientSession(connector=connector)
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._session
+
+    def _request_options(self):
+        """
+        Credentials and SSL verification of a request, taken from the current settings of the client
+
+        :return: dictionary of keyword arguments for aiohttp.ClientSession.post
+        """
+        if self.verify_request is True or self.verify_request is False:
+            ssl_option = self.verify_request
+        else:
+            ssl_option = self._ssl_contexts.get(self.verify_request)
+            if ssl_option is None:
+                ssl_option = self._ssl_contexts[self.verify_request] = ssl.create_default_context(
+                    cafile=self.verify_request)
+        auth = aiohttp.BasicAuth(*self.basic_auth) if self.basic_auth else None
+        return {'auth': auth, 'ssl': ssl_option}
+
+    async def _post_once(self, payload, file_path=None):
+        """
+        Make a single attempt at POSTing a TERMite payload, optionally with a file
+
+        :param payload: request payload built by a TermiteRequestBuilder
+        :param file_path: path to a file to be sent as binary content
+        :return: tuple of the aiohttp.ClientResponse, released once its body was read, and the body bytes
+        """
+        session = self._get_session()
+        options = self._request_options()
+        async with self._semaphore:
+            if file_path:
+                with open(file_path, 'rb') as file_obj:
+                    data = aiohttp.FormData()
+                    for k, v in payload.items():
+                        data.add_field(k, str(v))
+                    data.add_field('binary', file_obj, filename=os.path.basename(file_path))
+                    async with session.post(self.url, data=data, **options) as response:
+                        return response, await response.read()
+            else:
+                async with session.post(self.url, data=payload, **options) as response:
+                    return response, await response.read()
+
+    async def _post(self, payload, file_path=None):
+        """
+        POST a TERMite payload, optionally with a file, and decode the response as TermiteRequestBuilder.execute does.
+        Failed attempts are retried following the client's retry policy.
+
+        :param payload: request payload built by a TermiteRequestBuilder
+        :param file_path: path to a file to be sent as binary content
+        :return: request response
+        :raises: aiohttp.ClientResponseError if TERMite kept answering with an error status
+        """
+        policy = self.retry_policy
+        attempt = 0
+        while True:
+            if self.breaker is not None:
+                self.breaker.before_request(self.url)
+            try:
+                response, body = await self._post_once(payload, file_path)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if self.breaker is not None:
+                    self.breaker.record_failure()
+                if not policy.can_retry('POST', attempt):
+                    raise
+                await asyncio.sleep(policy.wait_time(attempt))
+                attempt += 1
+                continue
+            except Exception:
+                # any other error, e.g. a truncated payload, still resolves a half-open circuit's trial request
+                if self.breaker is not None:
+                    self.breaker.record_failure()
+                raise
+            except BaseException:
+                # cancelled, asyncio.CancelledError is not an Exception
+                if self.breaker is not None:
+                    self.breaker.record_abort()
+                raise
+
+            if not policy.is_retryable_status(response.status):
+                if self.breaker is not None:
+                    self.breaker.record_success()
+                break
+            if self.breaker is not None:
+                self.breaker.record_failure()
+            if not policy.can_retry('POST', attempt):
+                break
+            await asyncio.sleep(policy.wait_time(attempt, response.headers))
+            attempt += 1
+
+        # an error status is raised, its body must never be decoded as a result
+        response.raise_for_status()
+        if "json" in payload["output"]:
+            return loads(body)
+        else:
+            return body.decode(response.get_encoding())
+
+    async def annotate_text(self, text, options_dict):
+        """
+        Annotate a string of text
+
+        :param text: text to be annotated
+        :param options_dict: dictionary of options to be used during annotation
+        :return: result of request
+        """
+        t = TermiteRequestBuilder()
+        t.set_text(text)
+        t.set_options(options_dict)
+        return await self._post(t.payload)
+
+    async def annotate_files(self, input_file_path, options_dict):
+        """
+        Annotate an individual file or a zip archive
+
+        :param input_file_path: path to file to be annotated
+        :param options_dict: dictionary of options to be used during annotation
+        :return: result of request
+        """
+        t = TermiteRequestBuilder()
+        t.set_options(options_dict)
+        return await self._post(t.payload, file_path=input_file_path)
+
+    async def annotate_many(self, texts, options_dict, concurrency=None):
+        """
+        Annotate an iterable of texts, yielding (index, result) tuples as soon as each request completes. Results are
+        therefore not in input order, use the index to match them to their text. Texts are pulled from the iterable
+        lazily so generators of any size can be passed.
+
+        :param texts: iterable of texts to be annotated
+        :param options_dict: dictionary of options to be used during annotation
+        :param concurrency: maximum number of requests in flight, defaults to the concurrency of the client. It cannot
+        exceed the concurrency of the client, which bounds all requests of the client together
+        :return: async generator of (index, result) tuples
+        """
+        limit = min(concurrency or self.concurrency, self.concurrency)
+        pending = set()
+        try:
+            for index, text in enumerate(texts):
+                if len(pending) >= limit:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        yield task.result()
+                pending.add(asyncio.ensure_future(self._indexed(index, text, options_dict)))
+
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+        finally:
+            # the caller stopped consuming early or a request failed, don't leave requests running
+            for task in pending:
+                task.cancel()
+
+    async def _indexed(self, index, text, options_dict):
+        """
+        Annotate a text and return it alongside its position in the input
+        """
+        return index, await self.annotate_text(text, options_dict)
+
+    async def close(self):
+        """
+        Close the underlying connections
+        """
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
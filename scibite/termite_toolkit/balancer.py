@@ -0,0 +1,319 @@
+"""
+
+  ____       _ ____  _ _         _____ _____ ____  __  __ _ _         _____           _ _    _ _
+ / ___|  ___(_) __ )(_) |_ ___  |_   _| ____|  _ \|  \/  (_) |_ ___  |_   _|__   ___ | | | _(_) |_
+ \___ \ / __| |  _ \| | __/ _ \   | | |  _| | |_) | |\/| | | __/ _ \   | |/ _ \ / _ \| | |/ / | __|
+  ___) | (__| | |_) | | ||  __/   | | | |___|  _ <| |  | | | ||  __/   | | (_) | (_) | |   <| | |_
+ |____/ \___|_|____/|_|\__\___|   |_| |_____|_| \_\_|  |_|_|\__\___|   |_|\___/ \___/|_|_|\_\_|\__|
+
+
+
+EndpointPool- spread TERMite requests over several servers.
+
+"""
+
+__author__ = 'SciBite DataScience'
+__version__ = '0.2'
+__copyright__ = '(c) 2019, SciBite Ltd'
+__license__ = 'Creative Commons Attribution-NonCommercial-ShareAlike 4.0 International License'
+
+import collections
+import contextlib
+import random
+import threading
+import time
+import weakref
+
+import requests
+
+from .retry import CircuitOpenError, body_positions, rewind_body
+from .session import get_default_session
+
+
+class Endpoint():
+    """
+    Load and health statistics of a single TERMite server
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.outstanding = 0
+        self.latency = None
+        self.failures = 0
+        self.healthy = True
+        self.ejected_at = None
+
+    def score(self):
+        """
+        Expected wait for a new request: requests already queued on the server times its average latency.
+        Servers that have not answered yet score 0 so that they are tried first.
+
+        :return: float
+        """
+        return (self.outstanding + 1) * (self.latency or 0.0)
+
+    def __repr__(self):
+        return "Endpoint({!r}, outstanding={}, latency={}, healthy={})".format(
+            self.url, self.outstanding, self.latency, self.healthy)
+
+
+class EndpointPool():
+    """
+    Routes each request to the least-loaded healthy server of a pool. Load is the number of outstanding requests
+    weighted by an exponentially weighted moving average (EWMA) of the server's latency. A server failing eject_after
+    requests in a row is taken out of rotation and probed in the background every probe_interval seconds until it
+    answers again.
+
+    Pass an EndpointPool wherever a TERMite URL is expected, e.g. TermiteRequestBuilder.set_url or annotate_text.
+    Share a single instance between all builders of a process so that they all see the same load.
+
+    Health probes are sent over the pooled connections of a TermiteSession, with the credentials and SSL verification
+    of the last request routed through the pool.
+    """
+
+    def __init__(self, urls, ewma_alpha=0.3, eject_after=3, probe_interval=10, probe_timeout=5, session=None,
+                 auth=None, verify=None):
+        """
+        :param urls: list of URLs of TERMite instances e.g. ['http://termite1:9090/termite', ...]
+        :param ewma_alpha: weight of the latest latency in the moving average, between 0 and 1
+        :param eject_after: number of consecutive failures after which a server is taken out of rotation
+        :param probe_interval: seconds between health probes of servers taken out of rotation
+        :param probe_timeout: timeout in seconds of a single health probe
+        :param session: TermiteSession the health probes are sent through, the process-wide default session is used
+        until a request has been routed through the pool
+        :param auth: basic authentication credentials of the health probes, a (username, password) tuple
+        :param verify: SSL verification of the health probes, None for the session's default
+        """
+        if isinstance(urls, str):
+            urls = [urls]
+        if not urls:
+            raise ValueError("EndpointPool needs at least one URL")
+        self.endpoints = [Endpoint(url) for url in urls]
+        self.ewma_alpha = ewma_alpha
+        self.eject_after = eject_after
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self.session = session
+        self.auth = auth
+        self.verify = verify
+        self._lock = threading.Lock()
+        self._prober = None
+        self._stop = threading.Event()
+
+    def __len__(self):
+        return len(self.endpoints)
+
+    def __str__(self):
+        return ','.join(endpoint.url for endpoint in self.endpoints)
+
+    def select(self, exclude=()):
+        """
+        Pick the endpoint a new request should be sent to and count the request as outstanding on it.
+        If every server is out of rotation, the one ejected longest ago is used rather than failing outright.
+
+        :param exclude: URLs not to be picked, e.g. servers that already failed this request
+        :return: Endpoint
+        """
+        with self._lock:
+            candidates = [e for e in self.endpoints if e.url not in exclude] or self.endpoints
+            healthy = [e for e in candidates if e.healthy]
+            if healthy:
+                # random tie-breaking spreads the load while latencies are still unknown
+                endpoint = min(healthy, key=lambda e: (e.score(), e.outstanding, random.random()))
+            else:
+                endpoint = min(candidates, key=lambda e: e.ejected_at)
+            endpoint.outstanding += 1
+        return endpoint
+
+    def release(self, endpoint, latency=None, failed=False):
+        """
+        Record the outcome of a request sent to an endpoint picked by select
+
+        :param endpoint: Endpoint the request was sent to
+        :param latency: seconds the request took, only used for successful requests
+        :param failed: True if the request failed with a connection error, a timeout or a server error
+        """
+        eject = False
+        with self._lock:
+            endpoint.outstanding -= 1
+            if failed:
+                endpoint.failures += 1
+                if endpoint.healthy and endpoint.failures >= self.eject_after:
+                    endpoint.healthy = False
+                    endpoint.ejected_at = time.monotonic()
+                    eject = True
+            else:
+                endpoint.failures = 0
+                endpoint.healthy = True
+                if latency is not None:
+                    if endpoint.latency is None:
+                        endpoint.latency = latency
+                    else:
+                        endpoint.latency = self.ewma_alpha * latency + (1 - self.ewma_alpha) * endpoint.latency
+        if eject:
+            self._start_prober()
+
+    @contextlib.contextmanager
+    def acquire(self, exclude=()):
+        """
+        Context manager yielding the URL of the least-loaded healthy server and recording the request's outcome.
+        Exceptions raised inside the block count as failures of the server.
+
+        :param exclude: URLs not to be picked
+        :return: URL of the selected server
+        """
+        endpoint = self.select(exclude)
+        start = time.monotonic()
+        try:
+            yield endpoint.url
+        except Exception:
+            self.release(endpoint, failed=True)
+            raise
+        self.release(endpoint, latency=time.monotonic() - start)
+
+    def use_credentials(self, session, auth=None, verify=None):
+        """
+        Send the health probes through a session with the given credentials, send calls this for every request it
+        routes through the pool
+
+        :param session: TermiteSession the health probes are sent through
+        :param auth: basic authentication credentials, a (username, password) tuple
+        :param verify: SSL verification, None for the session's default
+        """
+        with self._lock:
+            self.session = session
+            self.auth = auth
+            self.verify = verify
+
+    def _start_prober(self):
+        """
+        Start the background health probes unless they are already running
+        """
+        with self._lock:
+            if self._prober is not None and self._prober.is_alive():
+                return
+            self._stop.clear()
+            # the thread only holds a weak reference, so it stops once the pool is garbage collected
+            self._prober = threading.Thread(target=_probe_loop, args=(weakref.ref(self), self._stop), daemon=True)
+            self._prober.start()
+
+    def _probe(self):
+        """
+        Probe the servers out of rotation once
+
+        :return: False if every server is healthy and probing can stop
+        """
+        ejected = [e for e in self.endpoints if not e.healthy]
+        if not ejected:
+            return False
+        with self._lock:
+            session = self.session or get_default_session()
+            kwargs = {'timeout': self.probe_timeout}
+            if self.auth:
+                kwargs['auth'] = self.auth
+            if self.verify is not None:
+                kwargs['verify'] = self.verify
+        for endpoint in ejected:
+            try:
+                # probes bypass the session's retries and circuit breakers so they are not held back by them
+                response = session.probe(endpoint.url, **kwargs)
+            except requests.exceptions.RequestException:
+                continue
+            response.close()
+            if response.status_code < 500:
+                with self._lock:
+                    endpoint.failures = 0
+                    endpoint.healthy = True
+        return True
+
+    def close(self):
+        """
+        Stop the background health probes
+        """
+        self._stop.set()
+
+    def __del__(self):
+        self._stop.set()
+
+
+def _probe_loop(pool_ref, stop):
+    """
+    Probe servers out of rotation until all of them are healthy again or the pool is closed or garbage collected
+
+    :param pool_ref: weak reference to the EndpointPool
+    :param stop: the pool's stop event
+    """
+    while True:
+        pool = pool_ref()
+        if pool is None:
+            return
+        interval = pool.probe_interval
+        del pool
+        if stop.wait(interval):
+            return
+        pool = pool_ref()
+        if pool is None or not pool._probe():
+            return
+        del pool
+
+
+# pools are only weakly referenced once they drop out of the most recently used ones, so a pool no builder holds
+# any more is garbage collected and its background probes stop
+_pools = weakref.WeakValueDictionary()
+_recent_pools = collections.OrderedDict()
+_pools_lock = threading.Lock()
+MAX_RECENT_POOLS = 16
+
+
+def get_endpoint_pool(urls):
+    """
+    Return the process-wide EndpointPool of a list of URLs, creating it on first use. Builders given the same list of
+    URLs share one pool, so its load and health statistics and its background probes persist between requests.
+    The MAX_RECENT_POOLS most recently used pools are kept alive between requests, older ones only as long as a
+    builder still holds them.
+
+    :param urls: list of URLs of TERMite instances
+    :return: EndpointPool
+    """
+    key = tuple(urls)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = EndpointPool(list(key))
+        _recent_pools[key] = pool
+        _recent_pools.move_to_end(key)
+        while len(_recent_pools) > MAX_RECENT_POOLS:
+            _recent_pools.popitem(last=False)
+    return pool
+
+
+def send(session, method, url, **kwargs):
+    """
+    Send a request to a single URL, or to the least-loaded server of an EndpointPool. With a pool, a request failing
+    with a connection error, a timeout or an open circuit is resent to the next best server until every server has
+    been tried.
+
+    :param session: TermiteSession used to send the request
+    :param method: HTTP method e.g. 'POST'
+    :param url: URL string or EndpointPool
+    :return: requests.Response
+    """
+    if not isinstance(url, EndpointPool):
+        return session.request(method, url, **kwargs)
+
+    url.use_credentials(session, kwargs.get('auth'), kwargs.get('verify'))
+    positions = body_positions(kwargs)
+    tried = []
+    while True:
+        endpoint = url.select(exclude=tried)
+        start = time.monotonic()
+        try:
+            response = session.request(method, endpoint.url, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, CircuitOpenError):
+            url.release(endpoint, failed=True)
+            tried.append(endpoint.url)
+            if len(tried) >= len(url) or not rewind_body(positions):
+                raise
+            continue
+        url.release(endpoint, latency=time.monotonic() - start, failed=response.status_code >= 500)
+        return response
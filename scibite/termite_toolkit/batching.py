@@ -0,0 +1,232 @@
+"""
+
+  ____       _ ____  _ _         _____ _____ ____  __  __ _ _         _____           _ _    _ _
+ / ___|  ___(_) __ )(_) |_ ___  |_   _| ____|  _ \|  \/  (_) |_ ___  |_   _|__   ___ | | | _(_) |_
+ \___ \ / __| |  _ \| | __/ _ \   | | |  _| | |_) | |\/| | | __/ _ \   | |/ _ \ / _ \| | |/ / | __|
+  ___) | (__| | |_) | | ||  __/   | | | |___|  _ <| |  | | | ||  __/   | | (_) | (_) | |   <| | |_
+ |____/ \___|_|____/|_|\__\___|   |_| |_____|_| \_\_|  |_|_|\__\___|   |_|\___/ \___/|_|_|\_\_|\__|
+
+
+
+TermiteBatcher- pack many short texts into multi-document TERMite requests.
+
+"""
+
+__author__ = 'SciBite DataScience'
+__version__ = '0.2'
+__copyright__ = '(c) 2019, SciBite Ltd'
+__license__ = 'Creative Commons Attribution-NonCommercial-ShareAlike 4.0 International License'
+
+import io
+import os
+import threading
+import time
+import zipfile
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from .balancer import get_endpoint_pool
+from .termite import TermiteRequestBuilder
+
+
+class TermiteBatcher():
+    """
+    Collects texts submitted from any number of threads and sends them to TERMite as a single zip archive, one text
+    file per document. The RESP_MULTIDOC_PAYLOAD (json) or doc.jsonx response is split back out by docID so every
+    caller receives the same shape of result as a single annotate_text call would return. The docIDs inside those
+    results are the names given to the documents within their batch e.g. '12.txt'.
+
+    A batch is sent as soon as it reaches max_docs documents or max_bytes of text, or max_wait seconds after its
+    first document was submitted, whichever comes first.
+    """
+
+    def __init__(self, url='http://localhost:9090/termite', options_dict=None, max_docs=100, max_bytes=1048576,
+                 max_wait=0.5, max_in_flight=4, session=None):
+        """
+        :param url: the URL of the TERMite instance to be hit, a list of URLs or an EndpointPool
+        :param options_dict: dictionary of options to be used during annotation, output must be json or doc.jsonx
+        :param max_docs: maximum number of documents per request
+        :param max_bytes: maximum number of bytes of (utf-8 encoded) text per request
+        :param max_wait: maximum number of seconds a document waits for its batch to fill up
+        :param max_in_flight: maximum number of batch requests sent concurrently
+        :param session: optional TermiteSession, the process-wide default session is used if not provided
+        """
+        if isinstance(url, (list, tuple)):
+            # resolved once so every batch is routed with the same load and health statistics
+            url = get_endpoint_pool(url)
+        self.url = url
+        self.options_dict = dict(options_dict or {})
+        self.options_dict.setdefault('output', 'json')
+        self.options_dict['format'] = 'txt'
+        if self.options_dict['output'] not in ['json', 'doc.jsonx']:
+            raise ValueError("TermiteBatcher only supports json and doc.jsonx output")
+        self.max_docs = max_docs
+        self.max_bytes = max_bytes
+        self.max_wait = max_wait
+        self.session = session
+
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight)
+        self._condition = threading.Condition()
+        self._texts = []
+        self._futures = []
+        self._bytes = 0
+        self._deadline = None
+        self._closed = False
+        self._timer = threading.Thread(target=self._run_timer, daemon=True)
+        self._timer.start()
+
+    def submit(self, text):
+        """
+        Queue a text for annotation
+
+        :param text: text to be annotated
+        :return: concurrent.futures.Future resolving to the TERMite result for this text
+        """
+        data = text.encode('utf-8')
+        future = Future()
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Cannot submit to a closed TermiteBatcher")
+            if self._texts and self._bytes + len(data) > self.max_bytes:
+                self._flush_locked()
+            self._texts.append(data)
+            self._futures.append(future)
+            self._bytes += len(data)
+            if len(self._texts) == 1:
+                self._deadline = time.monotonic() + self.max_wait
+                self._condition.notify()
+            if len(self._texts) >= self.max_docs or self._bytes >= self.max_bytes:
+                self._flush_locked()
+        return future
+
+    def flush(self):
+        """
+        Send the current batch straight away, without waiting for it to fill up
+        """
+        with self._condition:
+            self._flush_locked()
+
+    def close(self, wait=True):
+        """
+        Send any remaining documents and stop the batcher
+
+        :param wait: if True block until all outstanding requests have completed
+        """
+        with self._condition:
+            self._flush_locked()
+            self._closed = True
+            self._condition.notify()
+        self._executor.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _flush_locked(self):
+        """
+        Hand the current batch over to the executor, must be called with the condition held
+        """
+        if not self._texts:
+            return
+        texts, futures = self._texts, self._futures
+        self._texts, self._futures, self._bytes, self._deadline = [], [], 0, None
+        self._executor.submit(self._send, texts, futures)
+
+    def _run_timer(self):
+        """
+        Background loop sending batches whose max_wait has expired
+        """
+        with self._condition:
+            while not self._closed:
+                if self._deadline is None:
+                    self._condition.wait()
+                    continue
+                remaining = self._deadline - time.monotonic()
+                if remaining <= 0:
+                    self._flush_locked()
+                else:
+                    self._condition.wait(remaining)
+
+    def _send(self, texts, futures):
+        """
+        Annotate one batch and resolve the futures of its documents
+        """
+        try:
+            buffer = io.BytesIO()
+            with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+                for idx, data in enumerate(texts):
+                    archive.writestr('%d.txt' % idx, data)
+            buffer.seek(0)
+
+            t = TermiteRequestBuilder()
+            t.set_url(self.url)
+            t.set_session(self.session)
+            t.set_binary_content(buffer, file_name='batch.zip')
+            t.set_options(self.options_dict)
+            response = t.execute()
+            results = split_batch_response(response, len(texts))
+        except Exception as e:
+            for future in futures:
+                future.set_exception(e)
+            return
+
+        for future, result in zip(futures, results):
+            future.set_result(result)
+
+
+def batch_doc_index(doc_id):
+    """
+    Recover the position of a document within its batch from the docID TERMite gave it, e.g. '12.txt' or 'batch/12'
+
+    :param doc_id: docID of the document in the TERMite response
+    :return: integer index, or None if the docID was not generated by TermiteBatcher
+    """
+    name = os.path.splitext(os.path.basename(str(doc_id)))[0]
+    return int(name) if name.isdigit() else None
+
+
+def split_batch_response(termite_response, n_docs):
+    """
+    Split a multi-document TERMite response into one response per document of the batch
+
+    :param termite_response: JSON or doc.JSONx TERMite response to a batch
+    :param n_docs: number of documents sent in the batch
+    :return: list of per-document responses, {"RESP_PAYLOAD": ...} for JSON and [doc] for doc.JSONx
+    """
+    if "RESP_MULTIDOC_PAYLOAD" in termite_response or "RESP_PAYLOAD" in termite_response:
+        meta = {k: v for k, v in termite_response.items() if k not in ["RESP_MULTIDOC_PAYLOAD", "RESP_PAYLOAD"]}
+        results = [dict(meta, RESP_PAYLOAD={}) for i in range(n_docs)]
+        if "RESP_PAYLOAD" in termite_response and n_docs == 1:
+            results[0]["RESP_PAYLOAD"] = termite_response["RESP_PAYLOAD"]
+        doc_results = termite_response.get("RESP_MULTIDOC_PAYLOAD", {})
+        for doc_id, response_payload in doc_results.items():
+            idx = batch_doc_index(doc_id)
+            if idx is not None and idx < n_docs:
+                results[idx]["RESP_PAYLOAD"] = response_payload
+    else:
+        results = [[] for i in range(n_docs)]
+        for doc in termite_response:
+            idx = batch_doc_index(doc.get('docID', ''))
+            if idx is not None and idx < n_docs:
+                results[idx].append(doc)
+
+    return results
+
+
+def annotate_batch(url, texts, options_dict, max_docs=100, max_bytes=1048576, session=None):
+    """
+    Wrapper function annotating a list of texts in multi-document requests
+
+    :param url: url of TERMite instance
+    :param texts: iterable of texts to be annotated
+    :param options_dict: dictionary of options to be used during annotation, output must be json or doc.jsonx
+    :param max_docs: maximum number of documents per request
+    :param max_bytes: maximum number of bytes of text per request
+    :param session: optional TermiteSession, the process-wide default session is used if not provided
+    :return: list of results in the same order as texts
+    """
+    with TermiteBatcher(url, options_dict, max_docs=max_docs, max_bytes=max_bytes, session=session) as batcher:
+        futures = [batcher.submit(text) for text in texts]
+
+    return [future.result() for future in futures]
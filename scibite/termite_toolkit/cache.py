@@ -0,0 +1,323 @@
+"""
+
+  ____       _ ____  _ _         _____ _____ ____  __  __ _ _         _____           _ _    _ _
+ / ___|  ___(_) __ )(_) |_ ___  |_   _| ____|  _ \|  \/  (_) |_ ___  |_   _|__   ___ | | | _(_) |_
+ \___ \ / __| |  _ \| | __/ _ \   | | |  _| | |_) | |\/| | | __/ _ \   | |/ _ \ / _ \| | |/ / | __|
+  ___) | (__| | |_) | | ||  __/   | | | |___|  _ <| |  | | | ||  __/   | | (_) | (_) | |   <| | |_
+ |____/ \___|_|____/|_|\__\___|   |_| |_____|_| \_\_|  |_|_|\__\___|   |_|\___/ \___/|_|_|\_\_|\__|
+
+
+
+ResponseCache- tiered cache of TERMite and TExpress responses.
+
+"""
+
+__author__ = 'SciBite DataScience'
+__version__ = '0.2'
+__copyright__ = '(c) 2019, SciBite Ltd'
+__license__ = 'Creative Commons Attribution-NonCommercial-ShareAlike 4.0 International License'
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+
+def request_key(url, payload, binary_content=None, auth=None):
+    """
+    Canonical hash of a request: the same URL, options, credentials and text or file content always give the same key,
+    whatever order the options were set in. Requests sent with different credentials never share a key, so a response
+    is only ever served to callers who could have got it themselves
+
+    :param url: URL of the TERMite instance, or an EndpointPool
+    :param payload: request payload of a request builder
+    :param binary_content: binary_content of a request builder, a dictionary of field name to UploadSource
+    :param auth: basic_auth of a request builder, a (username, password) tuple or empty
+    :return: hex digest, or None if the file content cannot be read again once hashed
+    """
+    normalized = {}
+    for k, v in payload.items():
+        if k == 'opts':
+            normalized[k] = sorted(option for option in str(v).split('&') if option)
+        else:
+            normalized[k] = str(v)
+    digest = hashlib.sha256()
+    digest.update(json.dumps({'url': str(url), 'payload': normalized, 'auth': list(auth) if auth else None},
+                             sort_keys=True).encode('utf-8'))
+
+    for field, source in sorted((binary_content or {}).items()):
+        if not source.rewindable:
+            return None
+        digest.update(('\0{}\0{}\0'.format(field, source.file_name)).encode('utf-8'))
+        for chunk in source.iter_chunks():
+            digest.update(chunk)
+        source.rewind()
+
+    return digest.hexdigest()
+
+
+class MemoryCache():
+    """
+    In-memory least recently used cache holding up to max_entries responses
+    """
+
+    def __init__(self, max_entries=1024, ttl=None):
+        """
+        :param max_entries: maximum number of responses kept
+        :param ttl: seconds after which a response expires, None to keep responses until they are evicted
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        :param key: request key
+        :return: (content, encoding) tuple or None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            created, value = entry
+            if self.ttl is not None and time.time() - created > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        """
+        :param key: request key
+        :param value: (content, encoding) tuple
+        """
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Remove all responses
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DiskCache():
+    """
+    On-disk cache storing zlib compressed responses in a SQLite database. Entries expire after ttl seconds and the
+    least recently used ones are evicted once the compressed responses take more than max_bytes.
+    """
+
+    def __init__(self, path, max_bytes=1073741824, ttl=None, compress_level=6):
+        """
+        :param path: path to the SQLite database file, created if it does not exist
+        :param max_bytes: maximum total size of the compressed responses
+        :param ttl: seconds after which a response expires, None to keep responses until they are evicted
+        :param compress_level: zlib compression level, 1 (fastest) to 9 (smallest)
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.compress_level = compress_level
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, content BLOB, "
+                           "encoding TEXT, size INTEGER, created REAL, accessed REAL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+
+    def get(self, key):
+        """
+        :param key: request key
+        :return: (content, encoding) tuple or None
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT content, encoding, created FROM responses WHERE key = ?",
+                                     (key,)).fetchone()
+            if row is None:
+                return None
+            content, encoding, created = row
+            if self.ttl is not None and now - created > self.ttl:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+        return zlib.decompress(content), encoding
+
+    def set(self, key, value):
+        """
+        :param key: request key
+        :param value: (content, encoding) tuple
+        """
+        content, encoding = value
+        compressed = zlib.compress(content, self.compress_level)
+        now = time.time()
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                               (key, compressed, encoding, len(compressed), now, now))
+            self._evict()
+
+    def _evict(self):
+        """
+        Remove expired responses, then the least recently used ones until the cache fits in max_bytes
+        """
+        if self.ttl is not None:
+            self._conn.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl,))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        cursor = self._conn.execute("SELECT key, size FROM responses ORDER BY accessed")
+        evict = []
+        for key, size in cursor:
+            if total <= self.max_bytes:
+                break
+            evict.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", evict)
+
+    def clear(self):
+        """
+        Remove all responses
+        """
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+
+    def close(self):
+        """
+        Close the database connection
+        """
+        with self._lock:
+            self._conn.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+
+class ResponseCache():
+    """
+    Two tier cache of raw TERMite and TExpress responses: an in-memory LRU in front of an optional compressed on-disk
+    store. A response found on disk is promoted to memory. Hit and miss counters are kept for sizing the tiers.
+
+    Pass it to a request builder with set_cache, or to set_default_cache to cache every request of the process.
+    """
+
+    def __init__(self, max_entries=1024, path=None, max_bytes=1073741824, ttl=None):
+        """
+        :param max_entries: maximum number of responses kept in memory, 0 disables the memory tier
+        :param path: path to the SQLite database of the disk tier, None disables the disk tier
+        :param max_bytes: maximum total size of the compressed responses on disk
+        :param ttl: seconds after which a response expires in both tiers
+        """
+        self.memory = MemoryCache(max_entries, ttl=ttl) if max_entries else None
+        self.disk = DiskCache(path, max_bytes=max_bytes, ttl=ttl) if path else None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def key(self, url, payload, binary_content=None, auth=None):
+        """
+        Canonical key of a request, see request_key
+
+        :return: hex digest, or None if the request cannot be cached
+        """
+        return request_key(url, payload, binary_content, auth)
+
+    def get(self, key):
+        """
+        Look a response up, memory first then disk
+
+        :param key: request key
+        :return: (content, encoding) tuple or None
+        """
+        value = self.memory.get(key) if self.memory is not None else None
+        if value is not None:
+            self._count('memory_hits')
+            return value
+        value = self.disk.get(key) if self.disk is not None else None
+        if value is not None:
+            self._count('disk_hits')
+            if self.memory is not None:
+                self.memory.set(key, value)
+            return value
+        self._count('misses')
+        return None
+
+    def set(self, key, content, encoding=None):
+        """
+        Store a response in every tier
+
+        :param key: request key
+        :param content: raw response body as bytes
+        :param encoding: text encoding of the response body
+        """
+        value = (content, encoding)
+        if self.memory is not None:
+            self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def stats(self):
+        """
+        Hit and miss counters of the cache
+
+        :return: dictionary of counters, the hit rate and the number of responses held in each tier
+        """
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {"memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "memory_entries": len(self.memory) if self.memory is not None else 0,
+                "disk_entries": len(self.disk) if self.disk is not None else 0}
+
+    def clear(self):
+        """
+        Empty both tiers and reset the counters
+        """
+        if self.memory is not None:
+            self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+        self.memory_hits = self.disk_hits = self.misses = 0
+
+
+_default_cache = None
+
+
+def get_default_cache():
+    """
+    Return the process-wide cache used by request builders that have not been given their own
+
+    :return: ResponseCache or None if caching is disabled, which is the default
+    """
+    return _default_cache
+
+
+def set_default_cache(cache):
+    """
+    Cache the responses of every request builder of the process
+
+    :param cache: ResponseCache to be shared, or None to disable caching
+    """
+    global _default_cache
+    _default_cache = cache
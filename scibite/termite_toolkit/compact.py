@@ -0,0 +1,372 @@
+"""
+
+  ____       _ ____  _ _         _____ _____ ____  __  __ _ _         _____           _ _    _ _
+ / ___|  ___(_) __ )(_) |_ ___  |_   _| ____|  _ \|  \/  (_) |_ ___  |_   _|__   ___ | | | _(_) |_
+ \___ \ / __| |  _ \| | __/ _ \   | | |  _| | |_) | |\/| | | __/ _ \   | |/ _ \ / _ \| | |/ / | __|
+  ___) | (__| | |_) | | ||  __/   | | | |___|  _ <| |  | | | ||  __/   | | (_) | (_) | |   <| | |_
+ |____/ \___|_|____/|_|\__\___|   |_| |_____|_| \_\_|  |_|_|\__\___|   |_|\___/ \___/|_|_|\_\_|\__|
+
+
+
+Compact- array backed storage for large sets of TERMite hits.
+
+"""
+
+__author__ = 'SciBite DataScience'
+__version__ = '0.2'
+__copyright__ = '(c) 2019, SciBite Ltd'
+__license__ = 'Creative Commons Attribution-NonCommercial-ShareAlike 4.0 International License'
+
+from array import array
+
+import numpy as np
+
+from .termite import _iter_filtered_documents, get_termite_dataframe
+
+# fixed size fields of a hit, strings are stored as codes into the intern tables of CompactHits. Scores are float32 as
+# TERMite may return fractional scores
+HIT_DTYPE = np.dtype([('doc', np.int32), ('entity_type', np.int32), ('hit_id', np.int32), ('name', np.int32),
+                      ('score', np.float32), ('hit_count', np.int32), ('nonambigsyns', np.int32),
+                      ('totnosyns', np.int32), ('flags', np.uint8)])
+
+# a location of exact_array, TERMite 6.3 fls triples are stored as sentence, start, end
+LOCATION_DTYPE = np.dtype([('sentence', np.int32), ('start', np.int32), ('end', np.int32), ('subsumed', np.bool_)])
+
+# hit fields stored in HIT_DTYPE
+FIXED_FIELDS = (('score', 'score'), ('hitCount', 'hit_count'), ('nonambigsyns', 'nonambigsyns'),
+                ('totnosyns', 'totnosyns'))
+
+# flags recording which optional fields a hit had, and in which format
+HAS_SYNONYMS = 1
+HAS_FRAGMENTS = 2
+HAS_LOCATIONS = 4
+FLS_LOCATIONS = 8
+HAS_SUBSUME = 16
+HAS_DOC_ID = 32
+FALLBACK = 64
+FLOAT_SCORE = 128
+
+_INT32 = np.iinfo(np.int32)
+# integers up to 2 ** 24 are exact in float32
+_FLOAT32_EXACT = 2 ** 24
+_LOCATION_KEYS = {'sentence', 'start', 'end', 'subsumed'}
+
+
+def _is_int32(value):
+    return type(value) is int and _INT32.min <= value <= _INT32.max
+
+
+def _is_score(value):
+    """
+    Can the score be stored as float32 and decoded back to the same value? Fractional scores are decoded from the
+    shortest representation of their float32, which gives back any score with up to 7 significant digits
+    """
+    if type(value) is int:
+        return -_FLOAT32_EXACT <= value <= _FLOAT32_EXACT
+    return type(value) is float and float(str(np.float32(value))) == value
+
+
+def _is_string_list(value):
+    return type(value) is list and all(type(item) is str for item in value)
+
+
+def _encode_locations(exact_array):
+    """
+    Encode exact_array as LOCATION_DTYPE tuples
+
+    :return: tuple of (list of tuples, boolean True for fls triples), or None if it is in neither known format
+    """
+    if type(exact_array) is not list:
+        return None
+    if exact_array and type(exact_array[0]) is dict and 'fls' in exact_array[0]:
+        locations = []
+        for location in exact_array:
+            if type(location) is not dict or len(location) != 1:
+                return None
+            fls = location.get('fls')
+            if type(fls) is not list or len(fls) != 3 or not all(_is_int32(v) for v in fls):
+                return None
+            locations.append((fls[0], fls[1], fls[2], False))
+        return locations, True
+    locations = []
+    for location in exact_array:
+        if type(location) is not dict or location.keys() != _LOCATION_KEYS or \
+                not all(_is_int32(location[k]) for k in ('sentence', 'start', 'end')) or \
+                type(location['subsumed']) is not bool:
+            return None
+        locations.append((location['sentence'], location['start'], location['end'], location['subsumed']))
+    return locations, False
+
+
+class _Interner():
+    """
+    Maps strings to dense integer codes and back
+    """
+
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+
+    def __call__(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+class CompactHits():
+    """
+    Class for holding TERMite hits compactly. The fixed fields of every hit (document, entity type, hitID, name, score,
+    hitCount, nonambigsyns, totnosyns) are held in a NumPy structured array with strings interned into tables, and
+    realSynList, frag_vector_array, exact_array and subsume in flat arrays with offsets, instead of one dict and list
+    per hit. Fields of other shapes are kept as they are, so conversion back to records and dataframes is lossless.
+    Hits are filtered as they are added, as in payload_records.
+    """
+
+    def __init__(self, reject_ambig=True, score_cutoff=0, remove_subsumed=True):
+        """
+        :param reject_ambig: boolean
+        :param score_cutoff: a numerical value between 1-5
+        :param remove_subsumed: boolean
+        """
+        self.reject_ambig = reject_ambig
+        self.score_cutoff = score_cutoff
+        self.remove_subsumed = remove_subsumed
+        # documents: docID and, for doc.JSONx, the document fields shared by all of its hits
+        self.doc_ids = []
+        self.doc_fields = []
+        self.entity_types = _Interner()
+        self.hit_ids = _Interner()
+        self.strings = _Interner()
+        # hit index -> fields kept as they are
+        self.extras = {}
+        self._chunks = []
+        self._pending = []
+        self._synonyms = array('i')
+        self._synonym_offsets = array('q', [0])
+        self._fragments = array('i')
+        self._fragment_offsets = array('q', [0])
+        self._locations = []
+        self._location_chunks = []
+        self._location_offsets = array('q', [0])
+        self._subsume = array('b')
+        self._subsume_offsets = array('q', [0])
+        self._n_hits = 0
+
+    def __len__(self):
+        return self._n_hits
+
+    @property
+    def hits(self):
+        """
+        Structured array of the fixed fields of every hit, see HIT_DTYPE
+        """
+        self._consolidate()
+        return self._chunks[0] if self._chunks else np.empty(0, dtype=HIT_DTYPE)
+
+    @property
+    def locations(self):
+        """
+        Structured array of the locations of every hit, see LOCATION_DTYPE; hit i owns
+        locations[location_offsets[i]:location_offsets[i + 1]]
+        """
+        self._consolidate()
+        return self._location_chunks[0] if self._location_chunks else np.empty(0, dtype=LOCATION_DTYPE)
+
+    @property
+    def location_offsets(self):
+        return np.frombuffer(self._location_offsets, dtype=np.int64)
+
+    @property
+    def nbytes(self):
+        """
+        Bytes held in arrays, excluding the intern tables and the extras
+        """
+        self._consolidate()
+        buffers = [self._synonyms, self._synonym_offsets, self._fragments, self._fragment_offsets,
+                   self._location_offsets, self._subsume, self._subsume_offsets]
+        return self.hits.nbytes + self.locations.nbytes + sum(b.itemsize * len(b) for b in buffers)
+
+    def _consolidate(self):
+        """
+        Move pending rows into the arrays and concatenate the chunks
+        """
+        if self._pending:
+            self._chunks.append(np.array(self._pending, dtype=HIT_DTYPE))
+            self._pending = []
+        if self._locations:
+            self._location_chunks.append(np.array(self._locations, dtype=LOCATION_DTYPE))
+            self._locations = []
+        if len(self._chunks) > 1:
+            self._chunks = [np.concatenate(self._chunks)]
+        if len(self._location_chunks) > 1:
+            self._location_chunks = [np.concatenate(self._location_chunks)]
+
+    def _add_hit(self, doc, entity_hit):
+        """
+        Encode a single hit of the document with index doc
+        """
+        index = self._n_hits
+        self._n_hits += 1
+        entity_type, hit_id, name = entity_hit.get('entityType'), entity_hit.get('hitID'), entity_hit.get('name')
+        row_codes = (doc, self.entity_types(str(entity_type)), self.hit_ids(str(hit_id)))
+        fixed = [entity_hit.get(field) for field, _ in FIXED_FIELDS]
+        if not (type(entity_type) is str and type(hit_id) is str and type(name) is str and _is_score(fixed[0]) and
+                all(_is_int32(value) for value in fixed[1:])):
+            # kept whole, only its document, entity type and hitID are indexed
+            self.extras[index] = dict(entity_hit)
+            self._pending.append(row_codes + (-1, 0, 0, 0, 0, FALLBACK))
+            for offsets in (self._synonym_offsets, self._fragment_offsets, self._location_offsets,
+                            self._subsume_offsets):
+                offsets.append(offsets[-1])
+            return
+
+        flags = FLOAT_SCORE if type(fixed[0]) is float else 0
+        n_locations = 0
+        extras = {}
+        for key, value in entity_hit.items():
+            if key in ('entityType', 'hitID', 'name', 'score', 'hitCount', 'nonambigsyns', 'totnosyns'):
+                continue
+            if key == 'realSynList' and _is_string_list(value):
+                flags |= HAS_SYNONYMS
+                self._synonyms.extend(self.strings(synonym) for synonym in value)
+            elif key == 'frag_vector_array' and _is_string_list(value):
+                flags |= HAS_FRAGMENTS
+                self._fragments.extend(self.strings(fragment) for fragment in value)
+            elif key == 'exact_array' and _encode_locations(value) is not None:
+                locations, fls = _encode_locations(value)
+                flags |= HAS_LOCATIONS | (FLS_LOCATIONS if fls else 0)
+                self._locations.extend(locations)
+                n_locations = len(locations)
+            elif key == 'subsume' and type(value) is list and all(type(v) is bool for v in value):
+                flags |= HAS_SUBSUME
+                self._subsume.extend(value)
+            elif key == 'docID' and value == self.doc_ids[doc] and type(value) is type(self.doc_ids[doc]):
+                flags |= HAS_DOC_ID
+            else:
+                extras[key] = value
+        if extras:
+            self.extras[index] = extras
+        self._synonym_offsets.append(len(self._synonyms))
+        self._fragment_offsets.append(len(self._fragments))
+        self._location_offsets.append(self._location_offsets[-1] + n_locations)
+        self._subsume_offsets.append(len(self._subsume))
+        self._pending.append(row_codes + (self.strings(name),) + tuple(fixed) + (flags,))
+
+    def add_response(self, termite_response):
+        """
+        Add the hits of a TERMite response
+
+        :param termite_response: JSON or doc.JSONx TERMite response, TermiteResponse, or an iterable of documents
+        streamed by TermiteRequestBuilder.execute_stream
+        :return: self
+        """
+        # every document of the response is a document of its own, even when its docID is missing or repeated
+        for doc_id, doc_fields, entity_hits in _iter_filtered_documents(termite_response,
+                                                                         reject_ambig=self.reject_ambig,
+                                                                         score_cutoff=self.score_cutoff,
+                                                                         remove_subsumed=self.remove_subsumed):
+            if not entity_hits:
+                continue
+            self.doc_ids.append(doc_id)
+            self.doc_fields.append({k: v for k, v in doc_fields.items() if k != 'termiteTags'}
+                                   if doc_fields is not None else None)
+            doc = len(self.doc_ids) - 1
+            for entity_hit in entity_hits:
+                self._add_hit(doc, entity_hit)
+        self._consolidate()
+        return self
+
+    def hit(self, index):
+        """
+        Decode a single hit
+
+        :param index: hit index
+        :return: the entity hit as it was added
+        """
+        row = self.hits[index]
+        flags = int(row['flags'])
+        if flags & FALLBACK:
+            return dict(self.extras[index])
+        entity_hit = {'hitID': self.hit_ids.values[row['hit_id']],
+                      'entityType': self.entity_types.values[row['entity_type']],
+                      'name': self.strings.values[row['name']]}
+        for field, column in FIXED_FIELDS:
+            entity_hit[field] = int(row[column])
+        if flags & FLOAT_SCORE:
+            entity_hit['score'] = float(str(row['score']))
+        strings = self.strings.values
+        if flags & HAS_SYNONYMS:
+            start, end = self._synonym_offsets[index], self._synonym_offsets[index + 1]
+            entity_hit['realSynList'] = [strings[code] for code in self._synonyms[start:end]]
+        if flags & HAS_FRAGMENTS:
+            start, end = self._fragment_offsets[index], self._fragment_offsets[index + 1]
+            entity_hit['frag_vector_array'] = [strings[code] for code in self._fragments[start:end]]
+        if flags & HAS_LOCATIONS:
+            start, end = self._location_offsets[index], self._location_offsets[index + 1]
+            locations = self.locations[start:end].tolist()
+            if flags & FLS_LOCATIONS:
+                entity_hit['exact_array'] = [{'fls': [sentence, first, last]}
+                                             for sentence, first, last, _ in locations]
+            else:
+                entity_hit['exact_array'] = [{'sentence': sentence, 'start': first, 'end': last, 'subsumed': subsumed}
+                                             for sentence, first, last, subsumed in locations]
+        if flags & HAS_SUBSUME:
+            start, end = self._subsume_offsets[index], self._subsume_offsets[index + 1]
+            entity_hit['subsume'] = [bool(v) for v in self._subsume[start:end]]
+        if flags & HAS_DOC_ID:
+            entity_hit['docID'] = self.doc_ids[row['doc']]
+        entity_hit.update(self.extras.get(index, {}))
+        return entity_hit
+
+    def _iter_documents(self):
+        """
+        Rebuild the documents, in the form streamed by TermiteRequestBuilder.execute_stream
+        """
+        docs = self.hits['doc']
+        boundaries = np.flatnonzero(np.diff(docs)) + 1 if len(docs) else []
+        starts = [0] + list(boundaries)
+        ends = list(boundaries) + [len(docs)]
+        for start, end in zip(starts, ends):
+            doc = int(docs[start])
+            entity_hits = [self.hit(index) for index in range(start, end)]
+            if self.doc_fields[doc] is None:
+                payload = {}
+                for entity_hit in entity_hits:
+                    payload.setdefault(entity_hit['entityType'], []).append(entity_hit)
+                yield self.doc_ids[doc], payload
+            else:
+                yield dict(self.doc_fields[doc], termiteTags=entity_hits)
+
+    def iter_records(self):
+        """
+        Decode the hits as the records of iter_payload_records
+
+        :return: generator of TERMite hit records
+        """
+        for index in range(len(self)):
+            entity_hit = self.hit(index)
+            doc_fields = self.doc_fields[self.hits[index]['doc']]
+            if doc_fields is not None:
+                entity_hit.update(doc_fields)
+            yield entity_hit
+
+    def to_records(self):
+        """
+        Decode the hits as the records of payload_records
+
+        :return: TERMite hits in records format
+        """
+        return list(self.iter_records())
+
+    def to_dataframe(self, cols_to_add=""):
+        """
+        Decode the hits as the dataframe of get_termite_dataframe
+
+        :param cols_to_add: comma separated list of additional fields to include
+        :return: dataframe of TERMite hits
+        """
+        # the hits were filtered when they were added
+        return get_termite_dataframe(self._iter_documents(), cols_to_add=cols_to_add, reject_ambig=False,
+                                     score_cutoff=float('-inf'), remove_subsumed=False)
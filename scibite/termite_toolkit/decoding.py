@@ -0,0 +1,80 @@
+"""
+
+  ____       _ ____  _ _         _____ _____ ____  __  __ _ _         _____           _ _    _ _
+ / ___|  ___(_) __ )(_) |_ ___  |_   _| ____|  _ \|  \/  (_) |_ ___  |_   _|__   ___ | | | _(_) |_
+ \___ \ / __| |  _ \| | __/ _ \   | | |  _| | |_) | |\/| | | __/ _ \   | |/ _ \ / _ \| | |/ / | __|
+  ___) | (__| | |_) | | ||  __/   | | | |___|  _ <| |  | | | ||  __/   | | (_) | (_) | |   <| | |_
+ |____/ \___|_|____/|_|\__\___|   |_| |_____|_| \_\_|  |_|_|\__\___|   |_|\___/ \___/|_|_|\_\_|\__|
+
+
+
+Decoding- one pluggable JSON decoder for every response parsed by the toolkit.
+
+"""
+
+__author__ = 'SciBite DataScience'
+__version__ = '0.2'
+__copyright__ = '(c) 2019, SciBite Ltd'
+__license__ = 'Creative Commons Attribution-NonCommercial-ShareAlike 4.0 International License'
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _orjson_loads(data):
+    """
+    Decode with orjson, falling back to the standard library for input orjson rejects but json accepts, e.g. NaN
+    or UTF-16 encoded bytes
+    """
+    try:
+        return orjson.loads(data)
+    except orjson.JSONDecodeError:
+        return json.loads(data)
+
+
+# orjson decodes straight from bytes several times faster than the standard library, use it when it is installed
+_default_decoder = _orjson_loads if orjson is not None else json.loads
+_decoder = _default_decoder
+
+
+def set_json_decoder(decoder):
+    """
+    Replace the JSON decoder used for all responses, e.g. with ujson.loads or simdjson
+
+    :param decoder: function taking bytes or str and returning the decoded object, None to restore the default
+    """
+    global _decoder
+    _decoder = decoder if decoder is not None else _default_decoder
+
+
+def get_json_decoder():
+    """
+    Return the JSON decoder currently used for all responses
+
+    :return: function
+    """
+    return _decoder
+
+
+def loads(data):
+    """
+    Decode a JSON document with the current decoder
+
+    :param data: bytes or str
+    :return: decoded object
+    """
+    return _decoder(data)
+
+
+def decode_response(response):
+    """
+    Decode the JSON body of a response straight from its raw bytes, without first decoding it to text
+
+    :param response: requests.Response
+    :return: decoded object
+    """
+    return _decoder(response.content)
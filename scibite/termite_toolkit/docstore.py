@@ -14,9 +14,11 @@ __version__ = '0.3'
 __copyright__ = '(c) 2019, SciBite Ltd'
 __license__ = 'Creative Commons Attribution-NonCommercial-ShareAlike 4.0 International License'
 
-import requests
 import pandas as pd
 
+from .decoding import decode_response
+from .session import get_default_session
+
 
 class DocStoreRequestBuilder():
     """
@@ -31,6 +33,7 @@ class DocStoreRequestBuilder():
         self.binary_content = None
         self.basic_auth = ()
         self.verify_request = True
+        self.session = None
 
     def set_basic_auth(self, username='', password='', verification=True):
         """
@@ -51,6 +54,13 @@ class DocStoreRequestBuilder():
         """
         self.url = url
 
+    def set_session(self, session):
+        """
+        Send requests through the given TermiteSession instead of the process-wide default one
+        :param session: TermiteSession holding the pooled connections to be used
+        """
+        self.session = session
+
     def get_dcc_docs(self, entity_list, source='*', options_dict=None):
         """
         Retrieve document co-occurrence of provided entities
@@ -81,8 +91,9 @@ class DocStoreRequestBuilder():
         except:
             pass
 
-        response = requests.get(query_url, params=options, auth=self.basic_auth, verify=False)
-        resp_json = response.json()
+        session = self.session or get_default_session()
+        response = session.get(query_url, params=options, auth=self.basic_auth, verify=False)
+        resp_json = decode_response(response)
 
         return resp_json
 
@@ -116,8 +127,9 @@ class DocStoreRequestBuilder():
         except:
             pass
 
-        response = requests.get(query_url, params=options, auth=self.basic_auth, verify=False)
-        resp_json = response.json()
+        session = self.session or get_default_session()
+        response = session.get(query_url, params=options, auth=self.basic_auth, verify=False)
+        resp_json = decode_response(response)
 
         return resp_json
 
@@ -151,8 +163,9 @@ class DocStoreRequestBuilder():
         except:
             pass
 
-        response = requests.get(query_url, params=options, auth=self.basic_auth, verify=False)
-        resp_json = response.json()
+        session = self.session or get_default_session()
+        response = session.get(query_url, params=options, auth=self.basic_auth, verify=False)
+        resp_json = decode_response(response)
 
         return resp_json
     def get_doc_by_id(self,doc_id, fmt='json'):
@@ -161,8 +174,9 @@ class DocStoreRequestBuilder():
                    "uid":doc_id}
         base_url = self.url
         query_url = (base_url) + "/api/ds/v1/lookup/doc"
-        response = requests.get(query_url, params=options, auth=self.basic_auth, verify=False)
-        resp_json = response.json()
+        session = self.session or get_default_session()
+        response = session.get(query_url, params=options, auth=self.basic_auth, verify=False)
+        resp_json = decode_response(response)
     
         return resp_json
 
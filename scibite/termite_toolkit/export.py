@@ -0,0 +1,370 @@
+"""
+
+  ____       _ ____  _ _         _____ _____ ____  __  __ _ _         _____           _ _    _ _
+ / ___|  ___(_) __ )(_) |_ ___  |_   _| ____|  _ \|  \/  (_) |_ ___  |_   _|__   ___ | | | _(_) |_
+ \___ \ / __| |  _ \| | __/ _ \   | | |  _| | |_) | |\/| | | __/ _ \   | |/ _ \ / _ \| | |/ / | __|
+  ___) | (__| | |_) | | ||  __/   | | | |___|  _ <| |  | | | ||  __/   | | (_) | (_) | |   <| | |_
+ |____/ \___|_|____/|_|\__\___|   |_| |_____|_| \_\_|  |_|_|\__\___|   |_|\___/ \___/|_|_|\_\_|\__|
+
+
+
+Export- streaming TERMite and TExpress hits into Arrow record batches and Parquet datasets.
+
+"""
+
+__author__ = 'SciBite DataScience'
+__version__ = '0.2'
+__copyright__ = '(c) 2019, SciBite Ltd'
+__license__ = 'Creative Commons Attribution-NonCommercial-ShareAlike 4.0 International License'
+
+import os
+import uuid
+from urllib.parse import quote
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+from .termite import _iter_filtered_hits, hit_locations
+from .texpress import _iter_texpress_matches
+
+DEFAULT_ROW_GROUP_SIZE = 65536
+
+if pa is not None:
+    # columns of get_termite_dataframe, score is a float as it may be fractional
+    TERMITE_SCHEMA = pa.schema([
+        pa.field('docID', pa.string()),
+        pa.field('entityType', pa.string()),
+        pa.field('hitID', pa.string()),
+        pa.field('name', pa.string()),
+        pa.field('score', pa.float32()),
+        pa.field('realSynList', pa.list_(pa.string())),
+        pa.field('totnosyns', pa.int32()),
+        pa.field('nonambigsyns', pa.int32()),
+        pa.field('frag_vector_array', pa.list_(pa.string())),
+        pa.field('hitCount', pa.int32()),
+    ])
+
+    # hit locations read by termite.hit_locations, from either TERMite 6.3 or 6.4 exact_array
+    LOCATIONS_FIELD = pa.field('locations', pa.list_(pa.struct([
+        pa.field('sentence', pa.int32()),
+        pa.field('start', pa.int32()),
+        pa.field('end', pa.int32()),
+        pa.field('subsumed', pa.bool_()),
+    ])))
+
+    # columns of get_texpress_dataframe
+    TEXPRESS_SCHEMA = pa.schema([
+        pa.field('docID', pa.string()),
+        pa.field('patternID', pa.string()),
+        pa.field('originalFragment', pa.string()),
+        pa.field('matchEntities', pa.list_(pa.string())),
+        pa.field('originalSentence', pa.string()),
+        pa.field('sentence', pa.int32()),
+        pa.field('subsumed', pa.bool_()),
+    ])
+else:
+    TERMITE_SCHEMA = LOCATIONS_FIELD = TEXPRESS_SCHEMA = None
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("Arrow and Parquet export requires pyarrow, install it with: pip install pyarrow")
+
+
+def termite_schema(extra_fields=(), include_locations=False):
+    """
+    Arrow schema of exported TERMite hits
+
+    :param extra_fields: pyarrow fields of additional hit or doc.JSONx document fields to include
+    :param include_locations: boolean, include the locations of each hit
+    :return: pyarrow.Schema
+    """
+    _require_pyarrow()
+    fields = list(TERMITE_SCHEMA) + ([LOCATIONS_FIELD] if include_locations else []) + list(extra_fields)
+    return pa.schema(fields)
+
+
+def texpress_schema(extra_fields=()):
+    """
+    Arrow schema of exported TExpress hits
+
+    :param extra_fields: pyarrow fields of additional match fields to include
+    :return: pyarrow.Schema
+    """
+    _require_pyarrow()
+    return pa.schema(list(TEXPRESS_SCHEMA) + list(extra_fields))
+
+
+def iter_termite_rows(termite_response, names, reject_ambig=True, score_cutoff=0, remove_subsumed=True):
+    """
+    Walks a TERMite response yielding one tuple of values per hit, in the order of names. As in payload_records,
+    doc.JSONx document fields take precedence over hit fields; docID is always the document's
+
+    :param termite_response: JSON or doc.JSONx TERMite response, TermiteResponse, or an iterable of documents streamed
+    by TermiteRequestBuilder.execute_stream
+    :param names: names of the fields to extract, 'locations' for the hit locations
+    :return: generator of tuples
+    """
+    for doc_id, doc, entity_hit in _iter_filtered_hits(termite_response, reject_ambig=reject_ambig,
+                                                       score_cutoff=score_cutoff, remove_subsumed=remove_subsumed):
+        row = []
+        for name in names:
+            if name == 'docID':
+                row.append(doc_id)
+            elif name == 'locations':
+                row.append([{'sentence': sentence, 'start': start, 'end': end, 'subsumed': subsumed}
+                            for sentence, start, end, subsumed in hit_locations(entity_hit)])
+            elif doc is not None and name in doc and name != 'termiteTags':
+                row.append(doc[name])
+            else:
+                row.append(entity_hit.get(name))
+        yield tuple(row)
+
+
+def iter_texpress_rows(texpress_response, names, remove_subsumed=True):
+    """
+    Walks a TExpress response yielding one tuple of values per pattern match, in the order of names
+
+    :param texpress_response: TExpress JSON or doc.JSONx response, or an iterable of documents streamed by
+    TexpressRequestBuilder.execute_stream
+    :param names: names of the fields to extract
+    :return: generator of tuples
+    """
+    for overrides, match in _iter_texpress_matches(texpress_response, remove_subsumed=remove_subsumed):
+        row = []
+        for name in names:
+            for layer in overrides:
+                if name in layer:
+                    row.append(layer[name])
+                    break
+            else:
+                row.append(match.get(name))
+        yield tuple(row)
+
+
+def _record_batch(rows, schema):
+    """
+    Build a record batch with the given schema from row tuples
+    """
+    columns = list(zip(*rows)) if rows else [[] for _ in schema]
+    return pa.RecordBatch.from_arrays([pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+                                      schema=schema)
+
+
+def _batches(rows, schema, batch_size):
+    """
+    Group row tuples into record batches of at most batch_size rows
+    """
+    buffer = []
+    for row in rows:
+        buffer.append(row)
+        if len(buffer) >= batch_size:
+            yield _record_batch(buffer, schema)
+            buffer = []
+    if buffer:
+        yield _record_batch(buffer, schema)
+
+
+def termite_record_batches(termite_response, batch_size=DEFAULT_ROW_GROUP_SIZE, extra_fields=(),
+                           include_locations=False, reject_ambig=True, score_cutoff=0, remove_subsumed=True):
+    """
+    Streams the hits of a TERMite response into Arrow record batches of at most batch_size rows
+
+    :param termite_response: JSON or doc.JSONx TERMite response, TermiteResponse, or an iterable of documents streamed
+    by TermiteRequestBuilder.execute_stream
+    :param batch_size: maximum number of rows per batch
+    :param extra_fields: pyarrow fields of additional hit or doc.JSONx document fields to include
+    :param include_locations: boolean, include the locations of each hit
+    :param reject_ambig: boolean
+    :param score_cutoff: a numerical value between 1-5
+    :param remove_subsumed: boolean
+    :return: generator of pyarrow.RecordBatch
+    """
+    schema = termite_schema(extra_fields, include_locations)
+    rows = iter_termite_rows(termite_response, schema.names, reject_ambig=reject_ambig, score_cutoff=score_cutoff,
+                             remove_subsumed=remove_subsumed)
+    return _batches(rows, schema, batch_size)
+
+
+def texpress_record_batches(texpress_response, batch_size=DEFAULT_ROW_GROUP_SIZE, extra_fields=(),
+                            remove_subsumed=True):
+    """
+    Streams the pattern matches of a TExpress response into Arrow record batches of at most batch_size rows
+
+    :param texpress_response: TExpress JSON or doc.JSONx response, or an iterable of documents streamed by
+    TexpressRequestBuilder.execute_stream
+    :param batch_size: maximum number of rows per batch
+    :param extra_fields: pyarrow fields of additional match fields to include
+    :param remove_subsumed: boolean
+    :return: generator of pyarrow.RecordBatch
+    """
+    schema = texpress_schema(extra_fields)
+    rows = iter_texpress_rows(texpress_response, schema.names, remove_subsumed=remove_subsumed)
+    return _batches(rows, schema, batch_size)
+
+
+class ParquetExporter():
+    """
+    Class for writing rows into a Parquet file, or a hive partitioned Parquet dataset, as they arrive. Rows are
+    buffered per partition and written as a row group whenever row_group_size rows are buffered, so memory is bounded
+    by the number of partitions times the row group size. Use TermiteParquetExporter or TexpressParquetExporter to write
+    responses.
+    """
+
+    def __init__(self, path, schema, partition_cols=None, row_group_size=DEFAULT_ROW_GROUP_SIZE,
+                 compression='snappy'):
+        """
+        :param path: Parquet file, or dataset directory when partitioning
+        :param schema: pyarrow.Schema of the rows
+        :param partition_cols: list of columns to partition by, e.g. ['entityType'], None to write a single file
+        :param row_group_size: maximum number of rows per row group
+        :param compression: Parquet compression codec
+        """
+        _require_pyarrow()
+        self.path = path
+        self.schema = schema
+        self.partition_cols = list(partition_cols or [])
+        missing = [col for col in self.partition_cols if col not in schema.names]
+        if missing:
+            raise ValueError("Partition columns {} are not in the schema".format(missing))
+        self.row_group_size = row_group_size
+        self.compression = compression
+        # partitioned files hold the other columns, partition values are encoded in the directory names
+        self._partition_idx = [schema.names.index(col) for col in self.partition_cols]
+        self._file_idx = [i for i in range(len(schema)) if i not in self._partition_idx]
+        self._file_schema = pa.schema([schema.field(i) for i in self._file_idx])
+        # unique per export so that repeated exports into a dataset add files rather than overwrite them
+        self._basename = 'part-{}.parquet'.format(uuid.uuid4().hex)
+        self._buffers = {}
+        self._writers = {}
+        self.n_rows = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _writer(self, key):
+        writer = self._writers.get(key)
+        if writer is None:
+            if self.partition_cols:
+                directory = os.path.join(self.path, *['{}={}'.format(col, quote(str(value), safe=''))
+                                                      for col, value in zip(self.partition_cols, key)])
+                os.makedirs(directory, exist_ok=True)
+                file_path = os.path.join(directory, self._basename)
+            else:
+                file_path = self.path
+            writer = self._writers[key] = pq.ParquetWriter(file_path, self._file_schema,
+                                                           compression=self.compression)
+        return writer
+
+    def _flush(self, key):
+        rows = self._buffers.pop(key, None)
+        if rows:
+            self._writer(key).write_batch(_record_batch(rows, self._file_schema),
+                                          row_group_size=self.row_group_size)
+
+    def add_rows(self, rows):
+        """
+        Buffer row tuples, in schema order, writing full row groups
+
+        :param rows: iterable of tuples
+        :return: number of rows added
+        """
+        n_rows = 0
+        partition_idx, file_idx = self._partition_idx, self._file_idx
+        for row in rows:
+            key = tuple(row[i] for i in partition_idx)
+            buffer = self._buffers.setdefault(key, [])
+            buffer.append(tuple(row[i] for i in file_idx) if partition_idx else row)
+            if len(buffer) >= self.row_group_size:
+                self._flush(key)
+            n_rows += 1
+        self.n_rows += n_rows
+        return n_rows
+
+    def close(self):
+        """
+        Write the remaining buffered rows and close the files
+        """
+        for key in list(self._buffers):
+            self._flush(key)
+        if not self._writers and not self.partition_cols:
+            # an export without rows still produces a readable, empty file
+            self._writer(())
+        for writer in self._writers.values():
+            writer.close()
+        self._writers = {}
+
+
+class TermiteParquetExporter(ParquetExporter):
+    """
+    Class for exporting the hits of a stream of TERMite responses to Parquet, see ParquetExporter
+    """
+
+    def __init__(self, path, partition_cols=None, extra_fields=(), include_locations=False, reject_ambig=True,
+                 score_cutoff=0, remove_subsumed=True, row_group_size=DEFAULT_ROW_GROUP_SIZE, compression='snappy'):
+        """
+        :param path: Parquet file, or dataset directory when partitioning
+        :param partition_cols: list of columns to partition by, e.g. ['entityType'], None to write a single file
+        :param extra_fields: pyarrow fields of additional hit or doc.JSONx document fields to include
+        :param include_locations: boolean, include the locations of each hit
+        :param reject_ambig: boolean
+        :param score_cutoff: a numerical value between 1-5
+        :param remove_subsumed: boolean
+        :param row_group_size: maximum number of rows per row group
+        :param compression: Parquet compression codec
+        """
+        super().__init__(path, termite_schema(extra_fields, include_locations), partition_cols=partition_cols,
+                         row_group_size=row_group_size, compression=compression)
+        self.reject_ambig = reject_ambig
+        self.score_cutoff = score_cutoff
+        self.remove_subsumed = remove_subsumed
+
+    def add_response(self, termite_response):
+        """
+        Export the hits of a TERMite response
+
+        :param termite_response: JSON or doc.JSONx TERMite response, TermiteResponse, or an iterable of documents
+        streamed by TermiteRequestBuilder.execute_stream
+        :return: number of hits exported
+        """
+        return self.add_rows(iter_termite_rows(termite_response, self.schema.names, reject_ambig=self.reject_ambig,
+                                               score_cutoff=self.score_cutoff,
+                                               remove_subsumed=self.remove_subsumed))
+
+
+class TexpressParquetExporter(ParquetExporter):
+    """
+    Class for exporting the pattern matches of a stream of TExpress responses to Parquet, see ParquetExporter
+    """
+
+    def __init__(self, path, partition_cols=None, extra_fields=(), remove_subsumed=True,
+                 row_group_size=DEFAULT_ROW_GROUP_SIZE, compression='snappy'):
+        """
+        :param path: Parquet file, or dataset directory when partitioning
+        :param partition_cols: list of columns to partition by, e.g. ['patternID'], None to write a single file
+        :param extra_fields: pyarrow fields of additional match fields to include
+        :param remove_subsumed: boolean
+        :param row_group_size: maximum number of rows per row group
+        :param compression: Parquet compression codec
+        """
+        super().__init__(path, texpress_schema(extra_fields), partition_cols=partition_cols,
+                         row_group_size=row_group_size, compression=compression)
+        self.remove_subsumed = remove_subsumed
+
+    def add_response(self, texpress_response):
+        """
+        Export the pattern matches of a TExpress response
+
+        :param texpress_response: TExpress JSON or doc.JSONx response, or an iterable of documents streamed by
+        TexpressRequestBuilder.execute_stream
+        :return: number of matches exported
+        """
+        return self.add_rows(iter_texpress_rows(texpress_response, self.schema.names,
+                                                remove_subsumed=self.remove_subsumed))
@@ -0,0 +1,353 @@
+"""
+
+  ____       _ ____  _ _         _____ _____ ____  __  __ _ _         _____           _ _    _ _
+ / ___|  ___(_) __ )(_) |_ ___  |_   _| ____|  _ \|  \/  (_) |_ ___  |_   _|__   ___ | | | _(_) |_
+ \___ \ / __| |  _ \| | __/ _ \   | | |  _| | |_) | |\/| | | __/ _ \   | |/ _ \ / _ \| | |/ / | __|
+  ___) | (__| | |_) | | ||  __/   | | | |___|  _ <| |  | | | ||  __/   | | (_) | (_) | |   <| | |_
+ |____/ \___|_|____/|_|\__\___|   |_| |_____|_| \_\_|  |_|_|\__\___|   |_|\___/ \___/|_|_|\_\_|\__|
+
+
+
+Hit store- persistent, append-only, memory-mapped columnar storage of TERMite hits for corpus-scale results.
+
+"""
+
+__author__ = 'SciBite DataScience'
+__version__ = '0.2'
+__copyright__ = '(c) 2019, SciBite Ltd'
+__license__ = 'Creative Commons Attribution-NonCommercial-ShareAlike 4.0 International License'
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from .decoding import loads
+from .termite import _iter_filtered_hits
+
+FORMAT_VERSION = 2
+
+# fixed size hit columns, strings are stored as codes into the store's vocabularies
+HIT_COLUMNS = (('doc', np.int64), ('entity_type', np.int32), ('hit_id', np.int32), ('name', np.int32),
+               ('score', np.float32), ('hit_count', np.int32), ('nonambigsyns', np.int32), ('totnosyns', np.int32),
+               ('blob_end', np.int64))
+
+# document columns, the hits of document i are rows doc_start[i] to doc_start[i + 1]
+DOC_COLUMNS = (('doc_start', np.int64),)
+
+# append-only string tables, one JSON string per line
+VOCABULARIES = ('doc_ids', 'entity_types', 'hit_ids', 'names')
+
+# hit fields held in the numeric columns, scores are float32 as TERMite may return fractional scores
+VALUE_FIELDS = (('score', 'score'), ('hitCount', 'hit_count'), ('nonambigsyns', 'nonambigsyns'),
+                ('totnosyns', 'totnosyns'))
+
+
+class HitStore():
+    """
+    Class for a persistent, append-only store of TERMite hits in a directory of columnar files. Fixed size hit fields
+    are memory-mapped, so scans and filters by entity type or score read only the columns they need, and reader
+    processes opening the same store share its pages zero-copy. Every hit is also kept whole, as JSON, for lookups.
+
+    A store has a single writer, opened with mode 'a', adding hits response by response. Each add_response is committed
+    atomically by rewriting meta.json; readers, opened with mode 'r', see the hits committed when they were opened or
+    last refreshed and never a partially written batch.
+    """
+
+    def __init__(self, path, mode='r', reject_ambig=True, score_cutoff=0, remove_subsumed=True):
+        """
+        :param path: directory of the store, created when opened for appending
+        :param mode: 'r' to read, 'a' to append
+        :param reject_ambig: boolean, filter applied when hits are added
+        :param score_cutoff: a numerical value between 1-5, filter applied when hits are added
+        :param remove_subsumed: boolean, filter applied when hits are added
+        """
+        if mode not in ('r', 'a'):
+            raise ValueError("mode must be 'r' or 'a', got {!r}".format(mode))
+        self.path = path
+        self.mode = mode
+        self.reject_ambig = reject_ambig
+        self.score_cutoff = score_cutoff
+        self.remove_subsumed = remove_subsumed
+        if mode == 'a':
+            os.makedirs(path, exist_ok=True)
+            if not os.path.exists(self._file('meta.json')):
+                self._write_meta(self._empty_meta())
+        self.refresh()
+        if mode == 'a':
+            self._recover()
+            self._load_interners()
+
+    def __len__(self):
+        return self.meta['n_hits']
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def n_docs(self):
+        return self.meta['n_docs']
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    @staticmethod
+    def _empty_meta():
+        meta = {'version': FORMAT_VERSION, 'n_hits': 0, 'n_docs': 0, 'blob_bytes': 0}
+        meta.update({'n_' + name: 0 for name in VOCABULARIES})
+        meta.update({name + '_bytes': 0 for name in VOCABULARIES})
+        return meta
+
+    def _write_meta(self, meta):
+        """
+        Commit by atomically replacing meta.json
+        """
+        tmp = self._file('meta.json.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(meta, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._file('meta.json'))
+
+    def refresh(self):
+        """
+        Read the latest commit and map the committed part of the columns
+        """
+        with open(self._file('meta.json')) as f:
+            self.meta = json.load(f)
+        if self.meta['version'] != FORMAT_VERSION:
+            raise ValueError("Unsupported hit store version {}".format(self.meta['version']))
+        self._columns = {}
+        self._vocabularies = {}
+        self._doc_index = None
+
+    def _recover(self):
+        """
+        Drop anything written after the last commit, e.g. by a writer that was interrupted
+        """
+        sizes = {name + '.bin': self.meta['n_hits'] * np.dtype(dtype).itemsize for name, dtype in HIT_COLUMNS}
+        sizes.update({name + '.bin': self.meta['n_docs'] * np.dtype(dtype).itemsize for name, dtype in DOC_COLUMNS})
+        sizes.update({name + '.jsonl': self.meta[name + '_bytes'] for name in VOCABULARIES})
+        sizes['hits.jsonl'] = self.meta['blob_bytes']
+        for name, size in sizes.items():
+            with open(self._file(name), 'ab') as f:
+                f.truncate(size)
+
+    def column(self, name):
+        """
+        Memory-mapped, read-only view of a hit or document column, see HIT_COLUMNS and DOC_COLUMNS
+
+        :param name: column name
+        :return: numpy array
+        """
+        if name not in self._columns:
+            dtype = dict(HIT_COLUMNS + DOC_COLUMNS)[name]
+            length = self.meta['n_docs'] if name in dict(DOC_COLUMNS) else self.meta['n_hits']
+            if length == 0:
+                self._columns[name] = np.empty(0, dtype=dtype)
+            else:
+                self._columns[name] = np.memmap(self._file(name + '.bin'), dtype=dtype, mode='r', shape=(length,))
+        return self._columns[name]
+
+    def vocabulary(self, name):
+        """
+        Committed strings of a vocabulary, see VOCABULARIES
+
+        :param name: vocabulary name
+        :return: list, indexed by code
+        """
+        if name not in self._vocabularies:
+            with open(self._file(name + '.jsonl'), 'rb') as f:
+                data = f.read(self.meta[name + '_bytes'])
+            self._vocabularies[name] = [loads(line) for line in data.splitlines()]
+        return self._vocabularies[name]
+
+    def _load_interners(self):
+        """
+        Code of every committed string of the vocabularies that are interned
+        """
+        self._interners = {name: {value: code for code, value in enumerate(self.vocabulary(name))}
+                           for name in VOCABULARIES if name != 'doc_ids'}
+
+    def _code(self, name, value, new_codes):
+        """
+        Code of a string, new strings are given codes in new_codes, merged into the interners once committed
+        """
+        code = self._interners[name].get(value)
+        if code is None:
+            code = new_codes.get(value)
+            if code is None:
+                code = new_codes[value] = len(self._interners[name]) + len(new_codes)
+        return code
+
+    def add_response(self, termite_response):
+        """
+        Append and commit the hits of a TERMite response
+
+        :param termite_response: JSON or doc.JSONx TERMite response, TermiteResponse, or an iterable of documents
+        streamed by TermiteRequestBuilder.execute_stream
+        :return: number of hits added
+        """
+        if self.mode != 'a':
+            raise IOError("HitStore {} is open for reading only".format(self.path))
+        try:
+            n_added, new_codes = self._append(termite_response)
+        except BaseException:
+            # nothing of the batch was committed, drop what was written of it
+            self.refresh()
+            self._recover()
+            self._load_interners()
+            raise
+        for name, codes in new_codes.items():
+            self._interners[name].update(codes)
+        return n_added
+
+    def _append(self, termite_response):
+        """
+        Write and commit a batch, the interners are left untouched
+
+        :return: (number of hits added, codes of the new interned strings by vocabulary)
+        """
+        meta = dict(self.meta)
+        rows = {name: [] for name, _ in HIT_COLUMNS}
+        doc_starts = []
+        doc_ids = []
+        new_codes = {name: {} for name in self._interners}
+        blobs = []
+        blob_end = meta['blob_bytes']
+        current_doc = current_doc_id = None
+
+        for doc_id, doc, entity_hit in _iter_filtered_hits(termite_response, reject_ambig=self.reject_ambig,
+                                                           score_cutoff=self.score_cutoff,
+                                                           remove_subsumed=self.remove_subsumed):
+            if not doc_starts or doc is not current_doc or (doc is None and doc_id != current_doc_id):
+                current_doc, current_doc_id = doc, doc_id
+                doc_starts.append(meta['n_hits'] + len(rows['doc']))
+                doc_ids.append(doc_id)
+            record = entity_hit
+            if doc is not None:
+                record = dict(entity_hit)
+                record.update({k: v for k, v in doc.items() if k not in ('termiteTags', 'body')})
+            blob = json.dumps(record, separators=(',', ':')).encode('utf-8') + b'\n'
+            blobs.append(blob)
+            blob_end += len(blob)
+
+            rows['doc'].append(meta['n_docs'] + len(doc_starts) - 1)
+            rows['entity_type'].append(self._code('entity_types', entity_hit['entityType'], new_codes['entity_types']))
+            rows['hit_id'].append(self._code('hit_ids', entity_hit['hitID'], new_codes['hit_ids']))
+            rows['name'].append(self._code('names', entity_hit['name'], new_codes['names']))
+            for field, column in VALUE_FIELDS:
+                rows[column].append(entity_hit[field])
+            rows['blob_end'].append(blob_end)
+
+        n_added = len(rows['doc'])
+        if n_added == 0:
+            return 0, {}
+        new_values = {name: list(codes) for name, codes in new_codes.items()}
+        new_values['doc_ids'] = doc_ids
+        for name, dtype in HIT_COLUMNS:
+            with open(self._file(name + '.bin'), 'ab') as f:
+                f.write(np.asarray(rows[name], dtype=dtype).tobytes())
+        with open(self._file('doc_start.bin'), 'ab') as f:
+            f.write(np.asarray(doc_starts, dtype=np.int64).tobytes())
+        with open(self._file('hits.jsonl'), 'ab') as f:
+            f.write(b''.join(blobs))
+        for name in VOCABULARIES:
+            data = b''.join(json.dumps(value).encode('utf-8') + b'\n' for value in new_values[name])
+            with open(self._file(name + '.jsonl'), 'ab') as f:
+                f.write(data)
+            meta[name + '_bytes'] += len(data)
+            meta['n_' + name] += len(new_values[name])
+
+        meta['n_hits'] += n_added
+        meta['n_docs'] += len(doc_starts)
+        meta['blob_bytes'] = blob_end
+        self._write_meta(meta)
+        self.refresh()
+        return n_added, new_codes
+
+    def select(self, entity_types=None, min_score=None, max_score=None):
+        """
+        Scan the store for the hits of the given entity types and score range, reading only the columns needed
+
+        :param entity_types: comma separated list or iterable of entity types, None for all
+        :param min_score: lowest score to include, None for no bound
+        :param max_score: highest score to include, None for no bound
+        :return: numpy array of hit indices
+        """
+        mask = np.ones(len(self), dtype=bool)
+        if entity_types is not None:
+            if isinstance(entity_types, str):
+                entity_types = entity_types.replace(" ", "").split(",")
+            vocabulary = self.vocabulary('entity_types')
+            codes = [vocabulary.index(entity_type) for entity_type in entity_types if entity_type in vocabulary]
+            mask &= np.isin(self.column('entity_type'), codes)
+        if min_score is not None:
+            mask &= self.column('score') >= min_score
+        if max_score is not None:
+            mask &= self.column('score') <= max_score
+        return np.flatnonzero(mask)
+
+    def document_hits(self, doc_id):
+        """
+        Look up the hits of a document without scanning the store
+
+        :param doc_id: docID
+        :return: numpy array of hit indices
+        """
+        if self._doc_index is None:
+            # a docID added in several batches has several documents
+            self._doc_index = {}
+            for doc, value in enumerate(self.vocabulary('doc_ids')):
+                self._doc_index.setdefault(value, []).append(doc)
+        doc_start = self.column('doc_start')
+        ranges = [np.arange(doc_start[doc], doc_start[doc + 1] if doc + 1 < len(doc_start) else len(self))
+                  for doc in self._doc_index.get(doc_id, ())]
+        return np.concatenate(ranges) if ranges else np.empty(0, dtype=np.int64)
+
+    def hit(self, index):
+        """
+        Read a hit as it was added, with the fields of its doc.JSONx document other than the body
+
+        :param index: hit index
+        :return: dict
+        """
+        blob_end = self.column('blob_end')
+        start = int(blob_end[index - 1]) if index > 0 else 0
+        with open(self._file('hits.jsonl'), 'rb') as f:
+            f.seek(start)
+            return loads(f.read(int(blob_end[index]) - start))
+
+    def to_dataframe(self, indices=None):
+        """
+        Decode hits into a dataframe of docID, entityType, hitID, name, score, hitCount, nonambigsyns and totnosyns,
+        entityType and hitID are categorical
+
+        :param indices: hit indices, e.g. from select or document_hits, None for all hits
+        :return: pandas dataframe
+        """
+        def take(name):
+            column = self.column(name)
+            return np.asarray(column if indices is None else column[indices])
+
+        doc_ids = np.array(self.vocabulary('doc_ids'), dtype=object)
+        names = np.array(self.vocabulary('names'), dtype=object)
+        data = {'docID': doc_ids[take('doc')] if len(doc_ids) else [],
+                'entityType': pd.Categorical.from_codes(take('entity_type'), self.vocabulary('entity_types')),
+                'hitID': pd.Categorical.from_codes(take('hit_id'), self.vocabulary('hit_ids')),
+                'name': names[take('name')] if len(names) else []}
+        for field, column in VALUE_FIELDS:
+            data[field] = take(column)
+        return pd.DataFrame(data)
+
+    def close(self):
+        """
+        Release the memory maps
+        """
+        self._columns = {}
+        self._vocabularies = {}
+        self._doc_index = None
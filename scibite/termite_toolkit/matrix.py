@@ -0,0 +1,306 @@
+"""
+
+  ____       _ ____  _ _         _____ _____ ____  __  __ _ _         _____           _ _    _ _
+ / ___|  ___(_) __ )(_) |_ ___  |_   _| ____|  _ \|  \/  (_) |_ ___  |_   _|__   ___ | | | _(_) |_
+ \___ \ / __| |  _ \| | __/ _ \   | | |  _| | |_) | |\/| | | __/ _ \   | |/ _ \ / _ \| | |/ / | __|
+  ___) | (__| | |_) | | ||  __/   | | | |___|  _ <| |  | | | ||  __/   | | (_) | (_) | |   <| | |_
+ |____/ \___|_|____/|_|\__\___|   |_| |_____|_| \_\_|  |_|_|\__\___|   |_|\___/ \___/|_|_|\_\_|\__|
+
+
+
+Matrix- document x entity and entity co-occurrence sparse matrices built straight from TERMite responses.
+
+"""
+
+__author__ = 'SciBite DataScience'
+__version__ = '0.2'
+__copyright__ = '(c) 2019, SciBite Ltd'
+__license__ = 'Creative Commons Attribution-NonCommercial-ShareAlike 4.0 International License'
+
+from array import array
+
+import numpy as np
+import pandas as pd
+
+try:
+    import scipy.sparse as sp
+except ImportError:
+    sp = None
+
+from .termite import _iter_filtered_documents, _iter_filtered_hits, hit_locations
+
+# hit fields that can be used as matrix values
+VALUE_FIELDS = ("hitCount", "score")
+
+# units within which entities co-occur
+COOCCURRENCE_LEVELS = ("document", "sentence")
+
+
+class EntityMatrixBuilder():
+    """
+    Class for building a sparse document x entity matrix from one or more TERMite responses. Rows are docIDs and
+    columns entityType$hitID, both indexed in the order they are first seen so that the vocabularies stay stable as
+    further batches are appended. Entries are held as compact coordinate arrays until the matrix is requested.
+
+    Requires the optional scipy dependency (pip install termite_toolkit[sparse]).
+    """
+
+    def __init__(self, value="hitCount", filter_entity_types=None, reject_ambig=True, score_cutoff=0,
+                 remove_subsumed=True):
+        """
+        :param value: hit field used for the matrix values, hitCount or score
+        :param filter_entity_types: comma separated list or iterable of entity types to keep, None to keep all
+        :param reject_ambig: boolean
+        :param score_cutoff: a numerical value between 1-5
+        :param remove_subsumed: boolean
+        """
+        if value not in VALUE_FIELDS:
+            raise ValueError("value must be one of {}, got {!r}".format(VALUE_FIELDS, value))
+        if sp is None:
+            raise ImportError("EntityMatrixBuilder requires scipy, install it with: pip install scipy")
+        if isinstance(filter_entity_types, str):
+            filter_entity_types = filter_entity_types.replace(" ", "").split(",")
+        self.value = value
+        self.filter_entity_types = set(filter_entity_types) if filter_entity_types is not None else None
+        self.reject_ambig = reject_ambig
+        self.score_cutoff = score_cutoff
+        self.remove_subsumed = remove_subsumed
+        self.doc_index = {}
+        self.entity_index = {}
+        self._rows = array('q')
+        self._cols = array('q')
+        self._data = array('d')
+
+    @property
+    def doc_ids(self):
+        """
+        docIDs of the matrix rows, in row order
+        """
+        return list(self.doc_index)
+
+    @property
+    def entity_ids(self):
+        """
+        entityType$hitID of the matrix columns, in column order
+        """
+        return list(self.entity_index)
+
+    @property
+    def shape(self):
+        return len(self.doc_index), len(self.entity_index)
+
+    def add_response(self, termite_response):
+        """
+        Append the hits of a TERMite response. Documents already seen keep their row, new documents and entities are
+        appended to the vocabularies
+
+        :param termite_response: JSON or doc.JSONx TERMite response, or an iterable of documents streamed by
+        TermiteRequestBuilder.execute_stream
+        :return: self
+        """
+        doc_index = self.doc_index
+        entity_index = self.entity_index
+        filter_entity_types = self.filter_entity_types
+        value = self.value
+        for doc_id, _, entity_hit in _iter_filtered_hits(termite_response, reject_ambig=self.reject_ambig,
+                                                         score_cutoff=self.score_cutoff,
+                                                         remove_subsumed=self.remove_subsumed):
+            entity_type = entity_hit['entityType']
+            if filter_entity_types is not None and entity_type not in filter_entity_types:
+                continue
+            row = doc_index.setdefault(doc_id, len(doc_index))
+            col = entity_index.setdefault(entity_type + '$' + entity_hit['hitID'], len(entity_index))
+            self._rows.append(row)
+            self._cols.append(col)
+            self._data.append(entity_hit[value])
+        return self
+
+    def to_csr(self):
+        """
+        Build the matrix from the hits added so far. Entries repeated for a document and entity, e.g. when a docID
+        occurs in several batches, are summed
+
+        :return: scipy.sparse.csr_matrix of shape (documents, entities)
+        """
+        rows = np.frombuffer(self._rows, dtype=np.int64) if len(self._rows) else np.empty(0, dtype=np.int64)
+        cols = np.frombuffer(self._cols, dtype=np.int64) if len(self._cols) else np.empty(0, dtype=np.int64)
+        data = np.frombuffer(self._data, dtype=np.float64) if len(self._data) else np.empty(0, dtype=np.float64)
+        matrix = sp.csr_matrix((data, (rows, cols)), shape=self.shape)
+        matrix.sum_duplicates()
+        return matrix
+
+
+def termite_entity_matrix(*termite_responses, value="hitCount", filter_entity_types=None, reject_ambig=True,
+                          score_cutoff=0, remove_subsumed=True):
+    """
+    Parses one or more TERMite JSON or doc.JSONx responses into a sparse document x entity matrix
+
+    :param termite_responses: JSON or doc.JSONx TERMite responses
+    :param value: hit field used for the matrix values, hitCount or score
+    :param filter_entity_types: comma separated list of entity types to keep, None to keep all
+    :param reject_ambig: boolean
+    :param score_cutoff: a numerical value between 1-5
+    :param remove_subsumed: boolean
+    :return: tuple of (scipy.sparse.csr_matrix, list of docIDs, list of entityType$hitID)
+    """
+    builder = EntityMatrixBuilder(value=value, filter_entity_types=filter_entity_types, reject_ambig=reject_ambig,
+                                  score_cutoff=score_cutoff, remove_subsumed=remove_subsumed)
+    for termite_response in termite_responses:
+        builder.add_response(termite_response)
+
+    return builder.to_csr(), builder.doc_ids, builder.entity_ids
+
+
+class CooccurrenceBuilder():
+    """
+    Class for counting entity co-occurrence in TERMite responses, within documents or within sentences. The entities of
+    each unit are buffered as rows of a sparse unit x entity incidence matrix X and every chunk_size units the counts
+    are accumulated as X.T * X, so memory is bounded by the chunk and the entity vocabulary.
+    Sentence level co-occurrence uses the sentence index of each hit location, sentences below 1 are skipped as in
+    scibiteai.get_hits.
+
+    Requires the optional scipy dependency (pip install termite_toolkit[sparse]).
+    """
+
+    def __init__(self, level="document", filter_entity_types=None, reject_ambig=True, score_cutoff=0,
+                 remove_subsumed=True, chunk_size=100000):
+        """
+        :param level: unit of co-occurrence, document or sentence
+        :param filter_entity_types: comma separated list or iterable of entity types to keep, None to keep all
+        :param reject_ambig: boolean
+        :param score_cutoff: a numerical value between 1-5
+        :param remove_subsumed: boolean
+        :param chunk_size: number of units buffered before their counts are accumulated
+        """
+        if level not in COOCCURRENCE_LEVELS:
+            raise ValueError("level must be one of {}, got {!r}".format(COOCCURRENCE_LEVELS, level))
+        if sp is None:
+            raise ImportError("CooccurrenceBuilder requires scipy, install it with: pip install scipy")
+        if isinstance(filter_entity_types, str):
+            filter_entity_types = filter_entity_types.replace(" ", "").split(",")
+        self.level = level
+        self.filter_entity_types = set(filter_entity_types) if filter_entity_types is not None else None
+        self.reject_ambig = reject_ambig
+        self.score_cutoff = score_cutoff
+        self.remove_subsumed = remove_subsumed
+        self.chunk_size = chunk_size
+        self.entity_index = {}
+        self.n_units = 0
+        self._counts = None
+        self._indptr = array('q', [0])
+        self._indices = array('q')
+
+    @property
+    def entity_ids(self):
+        """
+        entityType$hitID of the matrix rows and columns, in index order
+        """
+        return list(self.entity_index)
+
+    def _add_units(self, units):
+        """
+        Buffer the entity sets of the units of one document
+        """
+        for entities in units.values():
+            self._indices.extend(sorted(entities))
+            self._indptr.append(len(self._indices))
+        if len(self._indptr) > self.chunk_size:
+            self._flush()
+
+    def _flush(self):
+        """
+        Accumulate the co-occurrence counts of the buffered units
+        """
+        n_units = len(self._indptr) - 1
+        if n_units == 0:
+            return
+        n_entities = len(self.entity_index)
+        indices = np.frombuffer(self._indices, dtype=np.int64) if len(self._indices) else np.empty(0, dtype=np.int64)
+        incidence = sp.csr_matrix((np.ones(len(indices), dtype=np.int64), indices,
+                                   np.frombuffer(self._indptr, dtype=np.int64)), shape=(n_units, n_entities))
+        counts = (incidence.T @ incidence).tocsr()
+        if self._counts is None:
+            self._counts = counts
+        else:
+            self._counts.resize((n_entities, n_entities))
+            self._counts = self._counts + counts
+        self.n_units += n_units
+        self._indptr = array('q', [0])
+        self._indices = array('q')
+
+    def add_response(self, termite_response):
+        """
+        Count the co-occurrences in a TERMite response
+
+        :param termite_response: JSON or doc.JSONx TERMite response, or an iterable of documents streamed by
+        TermiteRequestBuilder.execute_stream
+        :return: self
+        """
+        entity_index = self.entity_index
+        filter_entity_types = self.filter_entity_types
+        sentence_level = self.level == "sentence"
+        for _, _, entity_hits in _iter_filtered_documents(termite_response, reject_ambig=self.reject_ambig,
+                                                          score_cutoff=self.score_cutoff,
+                                                          remove_subsumed=self.remove_subsumed):
+            # unit key -> entity indices of this document, documents are never merged even if their docIDs match
+            units = {}
+            for entity_hit in entity_hits:
+                entity_type = entity_hit['entityType']
+                if filter_entity_types is not None and entity_type not in filter_entity_types:
+                    continue
+                col = entity_index.setdefault(entity_type + '$' + entity_hit['hitID'], len(entity_index))
+                if sentence_level:
+                    for sentence, _, _, _ in hit_locations(entity_hit):
+                        if sentence >= 1:
+                            units.setdefault(sentence, set()).add(col)
+                else:
+                    units.setdefault(None, set()).add(col)
+            self._add_units(units)
+        return self
+
+    def to_csr(self):
+        """
+        Build the symmetric entity x entity co-occurrence matrix. Off-diagonal entries count the units in which both
+        entities occur, the diagonal counts the units in which each entity occurs
+
+        :return: scipy.sparse.csr_matrix of shape (entities, entities)
+        """
+        self._flush()
+        n_entities = len(self.entity_index)
+        if self._counts is None:
+            return sp.csr_matrix((n_entities, n_entities), dtype=np.int64)
+        self._counts.resize((n_entities, n_entities))
+        return self._counts.copy()
+
+    def to_dataframe(self):
+        """
+        List the co-occurring entity pairs, most frequent first
+
+        :return: pandas dataframe with entity_a, entity_b and count columns
+        """
+        pairs = sp.triu(self.to_csr(), k=1).tocoo()
+        order = np.lexsort((pairs.col, pairs.row, -pairs.data))
+        entity_ids = np.array(self.entity_ids, dtype=object)
+        return pd.DataFrame({"entity_a": entity_ids[pairs.row[order]], "entity_b": entity_ids[pairs.col[order]],
+                             "count": pairs.data[order]})
+
+
+def termite_cooccurrence(*termite_responses, level="document", filter_entity_types=None, reject_ambig=True,
+                         score_cutoff=0, remove_subsumed=True):
+    """
+    Counts entity co-occurrence within documents or sentences of one or more TERMite JSON or doc.JSONx responses
+
+    :param termite_responses: JSON or doc.JSONx TERMite responses
+    :param level: unit of co-occurrence, document or sentence
+    :param filter_entity_types: comma separated list of entity types to keep, None to keep all
+    :param reject_ambig: boolean
+    :param score_cutoff: a numerical value between 1-5
+    :param remove_subsumed: boolean
+    :return: tuple of (scipy.sparse.csr_matrix, list of entityType$hitID)
+    """
+    builder = CooccurrenceBuilder(level=level, filter_entity_types=filter_entity_types, reject_ambig=reject_ambig,
+                                  score_cutoff=score_cutoff, remove_subsumed=remove_subsumed)
+    for termite_response in termite_responses:
+        builder.add_response(termite_response)
+
+    return builder.to_csr(), builder.entity_ids
@@ -0,0 +1,237 @@
+"""
+
+  ____       _ ____  _ _         _____ _____ ____  __  __ _ _         _____           _ _    _ _
+ / ___|  ___(_) __ )(_) |_ ___  |_   _| ____|  _ \|  \/  (_) |_ ___  |_   _|__   ___ | | | _(_) |_
+ \___ \ / __| |  _ \| | __/ _ \   | | |  _| | |_) | |\/| | | __/ _ \   | |/ _ \ / _ \| | |/ / | __|
+  ___) | (__| | |_) | | ||  __/   | | | |___|  _ <| |  | | | ||  __/   | | (_) | (_) | |   <| | |_
+ |____/ \___|_|____/|_|\__\___|   |_| |_____|_| \_\_|  |_|_|\__\___|   |_|\___/ \___/|_|_|\_\_|\__|
+
+
+
+Retry- retry policies with exponential backoff and per-endpoint circuit breakers for toolkit HTTP calls.
+
+"""
+
+__author__ = 'SciBite DataScience'
+__version__ = '0.2'
+__copyright__ = '(c) 2019, SciBite Ltd'
+__license__ = 'Creative Commons Attribution-NonCommercial-ShareAlike 4.0 International License'
+
+import email.utils
+import random
+import threading
+import time
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of sending a request to an endpoint whose circuit breaker is open
+    """
+    pass
+
+
+class RetryPolicy():
+    """
+    Decides which failed requests are retried and how long to wait before each retry.
+
+    Waits grow exponentially (backoff_factor * 2 ** attempt, capped at max_backoff) with full jitter so that many
+    workers hitting the same overloaded server do not retry in lock step. A Retry-After header sent with a 429 or 503
+    takes precedence over the computed wait.
+    """
+
+    def __init__(self, total=3, backoff_factor=0.5, max_backoff=30, jitter=True,
+                 status_forcelist=(429, 500, 502, 503, 504),
+                 allowed_methods=('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE', 'POST'),
+                 respect_retry_after=True, max_retry_after=300):
+        """
+        :param total: maximum number of retries, 0 disables retrying
+        :param backoff_factor: wait in seconds before the first retry, doubled for every further retry
+        :param max_backoff: upper limit in seconds of the computed wait
+        :param jitter: if True, wait a random time between 0 and the computed wait
+        :param status_forcelist: HTTP status codes that are retried
+        :param allowed_methods: HTTP methods that are safe to retry. POST is included by default because the SciBite
+        annotation and search APIs do not change server state
+        :param respect_retry_after: if True, wait as long as the server's Retry-After header asks for
+        :param max_retry_after: upper limit in seconds of a Retry-After wait
+        """
+        self.total = total
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.status_forcelist = frozenset(status_forcelist)
+        self.allowed_methods = frozenset(m.upper() for m in allowed_methods)
+        self.respect_retry_after = respect_retry_after
+        self.max_retry_after = max_retry_after
+
+    def can_retry(self, method, attempt):
+        """
+        Is another attempt allowed?
+
+        :param method: HTTP method of the request
+        :param attempt: number of retries already made
+        :return: boolean
+        """
+        return attempt < self.total and method.upper() in self.allowed_methods
+
+    def is_retryable_status(self, status_code):
+        """
+        Should a response with this status code be retried?
+
+        :param status_code: HTTP status code
+        :return: boolean
+        """
+        return status_code in self.status_forcelist
+
+    def backoff(self, attempt):
+        """
+        Seconds to wait before the given retry
+
+        :param attempt: number of retries already made
+        :return: float
+        """
+        delay = min(self.max_backoff, self.backoff_factor * (2 ** attempt))
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        return delay
+
+    def retry_after(self, headers):
+        """
+        Parse a Retry-After header, given either in seconds or as an HTTP date
+
+        :param headers: response headers
+        :return: seconds to wait, or None if there is no usable header
+        """
+        if not self.respect_retry_after:
+            return None
+        value = headers.get('Retry-After')
+        if not value:
+            return None
+        try:
+            delay = float(value)
+        except ValueError:
+            try:
+                delay = email.utils.parsedate_to_datetime(value).timestamp() - time.time()
+            except (TypeError, ValueError, OverflowError):
+                return None
+        return min(max(delay, 0), self.max_retry_after)
+
+    def wait_time(self, attempt, headers=None):
+        """
+        Seconds to wait before the given retry, honouring Retry-After if the server sent it
+
+        :param attempt: number of retries already made
+        :param headers: headers of the failed response, if there was one
+        :return: float
+        """
+        delay = self.retry_after(headers) if headers is not None else None
+        if delay is None:
+            delay = self.backoff(attempt)
+        return delay
+
+
+class CircuitBreaker():
+    """
+    Stops calling an endpoint after failure_threshold consecutive failures, so that an overloaded server gets room to
+    recover rather than being hammered by retries. After reset_timeout seconds a single trial request is let through;
+    if it succeeds the circuit closes again, otherwise it stays open for another reset_timeout.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        """
+        :param failure_threshold: number of consecutive failures that opens the circuit
+        :param reset_timeout: seconds to wait before letting a trial request through an open circuit
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def before_request(self, name=''):
+        """
+        Call before sending a request, raises CircuitOpenError if the request must not be sent
+
+        :param name: endpoint name used in the error message
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return
+            raise CircuitOpenError("Circuit breaker for {} is open after {} consecutive failures".format(
+                name, self.failures))
+
+    def record_success(self):
+        """
+        Call after a request succeeded
+        """
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        """
+        Call after a request failed with a connection error, a timeout, a retryable status code or any other error
+        """
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def record_abort(self):
+        """
+        Call after a request was interrupted before its outcome was known, e.g. by KeyboardInterrupt or cancellation.
+        An interrupted trial request does not count as a failure, the next request is let through as a new trial
+        """
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+
+
+def rewind_body(positions):
+    """
+    Seek any file objects of a request back to where they were before the first attempt, so it can be resent
+
+    :param positions: list of (file object, position) recorded by body_positions
+    :return: False if the body cannot be rewound and the request must not be retried
+    """
+    if positions is None:
+        return False
+    for file_obj, position in positions:
+        file_obj.seek(position)
+    return True
+
+
+def body_positions(kwargs):
+    """
+    Record the current position of every file object sent with a request
+
+    :param kwargs: keyword arguments of the request
+    :return: list of (file object, position), or None if part of the body is a stream that cannot be rewound
+    """
+    bodies = []
+    files = kwargs.get('files') or {}
+    for value in (files.values() if isinstance(files, dict) else [f[1] for f in files]):
+        bodies.append(value[1] if isinstance(value, (tuple, list)) else value)
+    bodies.append(kwargs.get('data'))
+
+    positions = []
+    for body in bodies:
+        if body is None or isinstance(body, (str, bytes, dict, list, tuple)):
+            continue
+        if hasattr(body, 'seek') and hasattr(body, 'tell'):
+            try:
+                positions.append((body, body.tell()))
+                continue
+            except (OSError, ValueError):
+                pass
+        return None
+    return positions
@@ -17,11 +17,14 @@ __copyright__ = '(c) 2020, SciBite Ltd'
 __license__ = 'Creative Commons Attribution-NonCommercial-ShareAlike 4.0 International License'
 
 
-import json
-import requests
+from bisect import bisect_right
+
 import nltk.data
 from requests.auth import HTTPBasicAuth
 import termite_toolkit.termite as termite
+from termite_toolkit.decoding import decode_response, loads
+from termite_toolkit.session import get_default_session
+from termite_toolkit.upload import MultipartStream, UploadSource
 
 
 scibite_ai_credentials = {
@@ -45,12 +48,13 @@ docstore_credentials = {
 
 class SciBiteAIClient():
 	def __init__(self, scibite_ai_credentials=scibite_ai_credentials, 
-		termite_credentials=termite_credentials, docstore_credentials=docstore_credentials):
+		termite_credentials=termite_credentials, docstore_credentials=docstore_credentials, session=None):
 
 		self.scibite_ai_credentials = scibite_ai_credentials
 		self.termite_credentials = termite_credentials
 		self.docstore_credentials = docstore_credentials
 		self.models = None
+		self.session = session
 		self.sent_detector = nltk.data.load('tokenizers/punkt/english.pickle')
 
 		if scibite_ai_credentials['scibite_ai_addr']:
@@ -80,6 +84,24 @@ class SciBiteAIClient():
 			self.models[type_] = models['results']
 
 
+	def set_session(self, session):
+		'''
+		Send requests through the given TermiteSession instead of the process-wide default one.
+
+		:param TermiteSession session: Session holding the pooled connections to be used
+		'''
+
+		self.session = session
+
+
+	def get_session(self):
+		'''
+		Return the TermiteSession used for all HTTP calls made by this client.
+		'''
+
+		return self.session or get_default_session()
+
+
 	def set_scibite_ai_credentials(self, scibite_ai_addr, scibite_ai_user=None, 
 		scibite_ai_pass=None):
 		'''
@@ -158,13 +180,13 @@ class SciBiteAIClient():
 			req = '/api/models'
 
 		if not scibite_ai_user:
-			r = requests.get('http://' + scibite_ai_addr + req)
+			r = self.get_session().get('http://' + scibite_ai_addr + req)
 		else:
 			print('Shouldnt get here...')
-			r = requests.get('https://' + scibite_ai_addr + req, 
+			r = self.get_session().get('https://' + scibite_ai_addr + req, 
 				auth=HTTPBasicAuth(scibite_ai_user, scibite_ai_pass))
 
-		j = json.loads(r.text)
+		j = decode_response(r)
 
 		return j
 
@@ -198,12 +220,12 @@ class SciBiteAIClient():
 			req = '/api/models/%s' % type_
 
 		if not scibite_ai_user:
-			r = requests.get('http://' + scibite_ai_addr + req)
+			r = self.get_session().get('http://' + scibite_ai_addr + req)
 		else:
-			r = requests.get('https://' + scibite_ai_addr + req, 
+			r = self.get_session().get('https://' + scibite_ai_addr + req, 
 				auth=HTTPBasicAuth(scibite_ai_user, scibite_ai_pass))
 
-		j = json.loads(r.text)
+		j = decode_response(r)
 
 		return j
 
@@ -243,12 +265,12 @@ class SciBiteAIClient():
 		data = {'model': model}
 
 		if not scibite_ai_user:
-			r = requests.post('http://' + scibite_ai_addr + req, data=data)
+			r = self.get_session().post('http://' + scibite_ai_addr + req, data=data)
 		else:
-			r = requests.post('https://' + scibite_ai_addr + req, data=data,
+			r = self.get_session().post('https://' + scibite_ai_addr + req, data=data,
 				auth=HTTPBasicAuth(scibite_ai_user, scibite_ai_pass))
 
-		j = json.loads(r.text)
+		j = decode_response(r)
 
 		return j
 
@@ -288,9 +310,9 @@ class SciBiteAIClient():
 		data = {'model': model}
 
 		if not scibite_ai_user:
-			r = requests.post('http://' + scibite_ai_addr + req, data=data)
+			r = self.get_session().post('http://' + scibite_ai_addr + req, data=data)
 		else:
-			r = requests.post('https://' + scibite_ai_addr + req, data=data,
+			r = self.get_session().post('https://' + scibite_ai_addr + req, data=data,
 				auth=HTTPBasicAuth(scibite_ai_user, scibite_ai_pass))
 
 		return j
@@ -353,12 +375,12 @@ class SciBiteAIClient():
 			data['termite_http_pass'] = termite_pass
 
 		if not scibite_ai_user:
-			r = requests.get('http://' + scibite_ai_addr + req, data=data)
+			r = self.get_session().get('http://' + scibite_ai_addr + req, data=data)
 		else:
-			r = requests.get('https://' + scibite_ai_addr + req, data=data, 
+			r = self.get_session().get('https://' + scibite_ai_addr + req, data=data, 
 				auth=HTTPBasicAuth(scibite_ai_user, scibite_ai_pass))
 
-		j = json.loads(r.text)['results']
+		j = decode_response(r)['results']
 		j['sentence'] = sent
 
 		return j
@@ -418,16 +440,16 @@ class SciBiteAIClient():
 
 		if termite_addr:
 			#Call TERMite to split sentences...
-			binary = open(os.path.join(document), 'rb').read()
-
+			#The document is streamed from disk rather than read into memory
 			if termite_user:
-				data = {'binary': binary, 'format': doctype, 'termite_user': termite_user,
-				'termite_pass': termite_pass}
+				fields = {'format': doctype, 'termite_user': termite_user, 'termite_pass': termite_pass}
 			else:
-				data = {'binary': binary, 'format': doctype}
+				fields = {'format': doctype}
+			body = MultipartStream(fields, {'binary': UploadSource(document)})
 
-			r = requests.post(termite_addr+'/toolkit/docxsent.api', data=data)
-			j = r.json()
+			r = self.get_session().post(termite_addr+'/toolkit/docxsent.api', data=body,
+				headers={'Content-Type': body.content_type})
+			j = decode_response(r)
 			for sent in j['sentences'][0]:
 				sents.append(sent['sentence'])
 		else:
@@ -505,12 +527,12 @@ class SciBiteAIClient():
 		data = {'model': models, 'sentence': sent, 'hits_only': hits_only, 'format': format_}
 
 		if not scibite_ai_user:
-			r = requests.get('http://' + scibite_ai_addr + req, data=data)
+			r = self.get_session().get('http://' + scibite_ai_addr + req, data=data)
 		else:
-			r = requests.get('https://' + scibite_ai_addr + req, data=data, 
+			r = self.get_session().get('https://' + scibite_ai_addr + req, data=data, 
 				auth=HTTPBasicAuth(scibite_ai_user, scibite_ai_pass))
 
-		j = json.loads(r.text)
+		j = decode_response(r)
 
 		return j
 
@@ -565,16 +587,16 @@ class SciBiteAIClient():
 
 		if termite_addr:
 			#Call TERMite to split sentences...
-			binary = open(os.path.join(document), 'rb').read()
-
+			#The document is streamed from disk rather than read into memory
 			if termite_user:
-				data = {'binary': binary, 'format': doctype, 'termite_user': termite_user, 
-				'termite_pass': termite_pass}
+				fields = {'format': doctype, 'termite_user': termite_user, 'termite_pass': termite_pass}
 			else:
-				data = {'binary': binary, 'format': doctype}
+				fields = {'format': doctype}
+			body = MultipartStream(fields, {'binary': UploadSource(document)})
 
-			r = requests.post(termite_addr+'/toolkit/docxsent.api', data=data)
-			j = r.json()
+			r = self.get_session().post(termite_addr+'/toolkit/docxsent.api', data=body,
+				headers={'Content-Type': body.content_type})
+			j = decode_response(r)
 			for sent in j['sentences'][0]:
 				sents.append(sent['sentence'])
 		else:
@@ -639,12 +661,12 @@ class SciBiteAIClient():
 		data = {'file': binary, 'model': model}
 
 		if not scibite_ai_user:
-			r = requests.get('http://' + scibite_ai_addr + req, data=data)
+			r = self.get_session().get('http://' + scibite_ai_addr + req, data=data)
 		else:
-			r = requests.get('https://' + scibite_ai_addr + req, data=data, 
+			r = self.get_session().get('https://' + scibite_ai_addr + req, data=data, 
 				auth=HTTPBasicAuth(scibite_ai_user, scibite_ai_pass))
 
-		j = json.loads(r.text)
+		j = decode_response(r)
 
 		return j
 
@@ -713,12 +735,12 @@ class SciBiteAIClient():
 			data['termite_http_pass'] = termite_pass
 		
 		if not scibite_ai_user:
-			r = requests.get('http://' + scibite_ai_addr + req, data=data)
+			r = self.get_session().get('http://' + scibite_ai_addr + req, data=data)
 		else:
-			r = requests.get('https://' + scibite_ai_addr + req, data=data, 
+			r = self.get_session().get('https://' + scibite_ai_addr + req, data=data, 
 				auth=HTTPBasicAuth(scibite_ai_user, scibite_ai_pass))
 
-		j = json.loads(r.text)
+		j = decode_response(r)
 
 		return j
 
@@ -784,12 +806,12 @@ class SciBiteAIClient():
 			data['filters'] = filters
 
 		if not scibite_ai_user:
-			r = requests.get('http://' + scibite_ai_addr + req, data=data)
+			r = self.get_session().get('http://' + scibite_ai_addr + req, data=data)
 		else:
-			r = requests.get('https://' + scibite_ai_addr + req, data=data, 
+			r = self.get_session().get('https://' + scibite_ai_addr + req, data=data, 
 				auth=HTTPBasicAuth(scibite_ai_user, scibite_ai_pass))
 
-		j = json.loads(r.text)
+		j = decode_response(r)
 
 		return j
 
@@ -850,68 +872,74 @@ class SciBiteAIClient():
 			data['termite_http_pass'] = termite_pass
 
 		if not scibite_ai_user:
-			r = requests.get('http://' + scibite_ai_addr + req, data=data)
+			r = self.get_session().get('http://' + scibite_ai_addr + req, data=data)
 		else:
-			r = requests.get('https://' + scibite_ai_addr + req, data=data, 
+			r = self.get_session().get('https://' + scibite_ai_addr + req, data=data, 
 				auth=HTTPBasicAuth(scibite_ai_user, scibite_ai_pass))
 
-		j = json.loads(r.text)
+		j = decode_response(r)
 
 		return j
 
 
+_NORMALISATION_TEMPLATES = {
+	'id': '~TYPE~_~ID~',
+	'type': '~TYPE~',
+	'name': '~NAME~',
+	'typeplusname': '~TYPE~ ~NAME~',
+	'typeplusid': '~TYPE~ ~TYPE~_~ID~'
+	}
+
+
 def get_hits(termiteTags, hierarchy=None, vocabs=None):
 	'''
 	Helper function. Uses termiteTags and hierarchy to collect info on the highest priority hits.
 
+	Overlaps are resolved by taking the hit locations in order of priority and keeping each one that does not overlap
+	a location already kept. The kept spans are found by bisection, O(log n) comparisons per location; inserting into
+	the sorted lists of kept spans is O(n) in the worst case, but only moves pointers. Priority goes to hits that are
+	not subsumed, then to the vocab higher in the hierarchy, then to the longer span, then to the earlier start,
+	remaining ties keeping the order of termiteTags. Spans are half-open, hits that only touch do not overlap, and a
+	subsumed hit is only kept where it does not overlap any other kept hit.
+
 	:param array termiteTags: Locations of TERMite hits found, extracted from the TERMite json
 	:param dict hierarchy: Dictionary with a hierarchy of vocabs to prioritise in case of overlap
 	:param array(str) vocabs: List of vocabs to be substituted, ordered by priority. These vocabs MUST be in the TERMite results. If left
 	empty, all vocabs found will be used with random priority where overlaps are found.
-	:return array(dict):
+	:return array(dict): hits ordered by startLoc
 	'''
-	hits = []
+	if hierarchy is None:
+		hierarchy = {vocab: idx for idx, vocab in enumerate(vocabs or [])}
+
+	candidates = []
 	for hit in termiteTags:
+		entityType = hit['entityType']
 		if not vocabs:
-			if hit['entityType'] not in hierarchy:
-				hierarchy[hit['entityType']] = len(hierarchy)
-		else:
-			if hit['entityType'] not in vocabs:
-				continue
+			if entityType not in hierarchy:
+				hierarchy[entityType] = len(hierarchy)
+		elif entityType not in vocabs:
+			continue
+		rank = hierarchy[entityType]
 
-		if 'fls' in hit['exact_array'][0]: #TERMite 6.3...
-			hitLocs, subsumeStates = hit['exact_array'], hit['subsume']
-		else: #TERMite 6.4...
-			hitLocs = []
-			subsumeStates = []
-			for hit_array in hit['exact_array']:
-				hitLocs.append({'fls': [hit_array['sentence'], hit_array['start'], hit_array['end']]})
-				subsumeStates.append(hit_array['subsumed'])
+		for sentence, startLoc, endLoc, subsumed in termite.hit_locations(hit):
+			if sentence < 1:
+				continue
+			candidates.append((bool(subsumed), rank, startLoc - endLoc, startLoc, len(candidates), endLoc, hit))
 
-		assert len(hitLocs) == len(subsumeStates)
+	candidates.sort()
 
-		for idx, hitLoc in enumerate(hitLocs):
-			if hitLoc['fls'][0] < 1:
-				continue
-			hitInfo = {}
-			hitInfo['entityType'], hitInfo['entityID'], hitInfo['entityName'] = hit['entityType'], hit['hitID'], hit[
-				'name']
-			breakBool = False
-			hitInfo['startLoc'], hitInfo['endLoc'] = hitLoc['fls'][1], hitLoc['fls'][2]
-			if subsumeStates[idx] == False:  # If hit is not subsumed...
-				for hitIdx, hit_ in enumerate(hits):
-					# Compare to already found hits to check there's no conflict
-					if ((hit_['endLoc'] >= hitInfo['startLoc'] and hit_['endLoc'] <= hitInfo['endLoc']) or
-							(hit_['startLoc'] >= hitInfo['startLoc'] and hit_['startLoc'] <= hitInfo['endLoc'])):
-						# If they overlap, check their position in the hierarchy
-						if hierarchy[hit_['entityType']] >= hierarchy[hitInfo['entityType']]:
-							del hits[hitIdx]
-							break
-						else:
-							breakBool = True
-							break
-			if not breakBool:
-				hits.append(hitInfo)
+	# kept spans, ordered by start and never overlapping each other
+	starts, ends, hits = [], [], []
+	for _, _, _, startLoc, _, endLoc, hit in candidates:
+		idx = bisect_right(starts, startLoc)
+		if idx > 0 and ends[idx - 1] > startLoc:
+			continue
+		if idx < len(starts) and starts[idx] < endLoc:
+			continue
+		starts.insert(idx, startLoc)
+		ends.insert(idx, endLoc)
+		hits.insert(idx, {'entityType': hit['entityType'], 'entityID': hit['hitID'], 'entityName': hit['name'],
+						  'startLoc': startLoc, 'endLoc': endLoc})
 	return hits
 
 
@@ -950,8 +978,17 @@ def markup(docjsonx, normalisation='id', substitute=True, wrap=False,
 		for idx, vocab in enumerate(vocabs):
 			hierarchy[vocab] = idx
 
+	if wrap:
+		prefix = wrapChars[0]
+		postfix = wrapChars[1]
+	else:
+		prefix, postfix = '', ''
+
+	# replacement format string of each vocab, compiled on first use
+	templates = {}
+
 	if isinstance(docjsonx, str):
-		j = json.loads(docjsonx)
+		j = loads(docjsonx)
 	else:
 		j = docjsonx
 
@@ -964,48 +1001,46 @@ def markup(docjsonx, normalisation='id', substitute=True, wrap=False,
 			results[docIdx] = {'termited_text': text}
 			continue
 
-		if len(substitutions) > 0:
-			substitutions.sort(key=lambda x: x['startLoc'])
-			substitutions = reversed(substitutions)
-
-		if wrap:
-			prefix = wrapChars[0]
-			postfix = wrapChars[1]
-		else:
-			prefix, postfix = '', ''
-
+		# get_hits returns non-overlapping hits ordered by startLoc, the text is rebuilt in one pass
+		pieces = []
+		cursor = 0
 		for sub in substitutions:
-			subText = ''
-			if replacementDict:
-				subText = replacementDict[sub['entityType']].replace(
-					'~TYPE~', sub['entityType']).replace('~ID~', sub['entityID']).replace('~NAME~', sub['entityName'])
-			elif normalisation == 'id':
-				subText = '_'.join([sub['entityType'], sub['entityID']])
-				if not substitute:
-					subText += ' %s' % text[sub['startLoc']:sub['endLoc']]
-			elif normalisation == 'type':
-				subText = sub['entityType']
-				if not substitute:
-					subText += ' %s' % text[sub['startLoc']:sub['endLoc']]
-			elif normalisation == 'name':
-				subText = sub['entityName']
-				if not substitute:
-					subText += ' %s' % text[sub['startLoc']:sub['endLoc']]
-			elif normalisation == 'typeplusname':
-				subText = '%s %s' % (sub['entityType'], sub['entityName'])
-				if not substitute:
-					subText += ' %s' % text[sub['startLoc']:sub['endLoc']]
-			elif normalisation == 'typeplusid':
-				subText = '%s %s' % (sub['entityType'], '_'.join([sub['entityType'], sub['entityID']]))
-				if not substitute:
-					subText += ' %s' % text[sub['startLoc']:sub['endLoc']]
-			text = text[:sub['startLoc']] + prefix + subText + postfix + text[sub['endLoc']:]
-
-		results[docIdx] = {'termited_text': text}
+			template = templates.get(sub['entityType'])
+			if template is None:
+				template = templates[sub['entityType']] = _markup_template(
+					sub['entityType'], normalisation, substitute, prefix, postfix, replacementDict)
+			pieces.append(text[cursor:sub['startLoc']])
+			pieces.append(template.format(id=sub['entityID'], name=sub['entityName'],
+										  text=text[sub['startLoc']:sub['endLoc']]))
+			cursor = sub['endLoc']
+		pieces.append(text[cursor:])
+
+		results[docIdx] = {'termited_text': ''.join(pieces)}
 
 	return results
 
 
+def _markup_template(entityType, normalisation, substitute, prefix, postfix, replacementDict):
+	'''
+	Helper function. Compiles the text replacing the hits of a vocab into a format string with the fields id, name and
+	text (the original hit text).
+
+	:return str:
+	'''
+	def escape(string):
+		return string.replace('{', '{{').replace('}', '}}')
+
+	if replacementDict:
+		template = replacementDict[entityType]
+	else:
+		template = _NORMALISATION_TEMPLATES[normalisation]
+	template = escape(template).replace('~TYPE~', escape(entityType)).replace('~ID~', '{id}').replace('~NAME~', '{name}')
+	if not replacementDict and not substitute:
+		template += ' {text}'
+
+	return escape(prefix) + template + escape(postfix)
+
+
 def text_markup(text, termiteAddr='http://localhost:9090/termite', vocabs=['GENE', 'INDICATION', 'DRUG'],
 				normalisation='id', wrap=False, wrapChars=('{!', '!}'), substitute=True, replacementDict=None,
 				termite_http_user=None, termite_http_pass=None):
@@ -1057,7 +1092,7 @@ def label(docjsonx, vocabs, labelLevel='word'):
 		hierarchy[vocab] = idx
 
 	if isinstance(docjsonx, str):
-		j = json.loads(docjsonx)
+		j = loads(docjsonx)
 	else:
 		j = docjsonx
 
@@ -0,0 +1,242 @@
+"""
+
+  ____       _ ____  _ _         _____ _____ ____  __  __ _ _         _____           _ _    _ _
+ / ___|  ___(_) __ )(_) |_ ___  |_   _| ____|  _ \|  \/  (_) |_ ___  |_   _|__   ___ | | | _(_) |_
+ \___ \ / __| |  _ \| | __/ _ \   | | |  _| | |_) | |\/| | | __/ _ \   | |/ _ \ / _ \| | |/ / | __|
+  ___) | (__| | |_) | | ||  __/   | | | |___|  _ <| |  | | | ||  __/   | | (_) | (_) | |   <| | |_
+ |____/ \___|_|____/|_|\__\___|   |_| |_____|_| \_\_|  |_|_|\__\___|   |_|\___/ \___/|_|_|\_\_|\__|
+
+
+
+Session- pooled, keep-alive HTTP connections shared by all toolkit request builders.
+
+"""
+
+__author__ = 'SciBite DataScience'
+__version__ = '0.2'
+__copyright__ = '(c) 2019, SciBite Ltd'
+__license__ = 'Creative Commons Attribution-NonCommercial-ShareAlike 4.0 International License'
+
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .retry import RetryPolicy, CircuitBreaker, body_positions, rewind_body
+
+
+class TermiteSession():
+    """
+    Pooled HTTP transport for TERMite, TExpress and the other SciBite APIs.
+
+    Connections are kept alive and reused between requests, so only the first call to an instance pays for the
+    TCP/TLS handshake. A single instance can be shared between threads: each thread gets its own requests.Session
+    (cookies and headers are not thread-safe) but all of them are mounted on the same connection pools.
+
+    Connection errors, timeouts and overload responses (429, 5xx) are retried according to a RetryPolicy, and every
+    endpoint (scheme, host and port) gets its own CircuitBreaker so a failing server is not kept busy with requests.
+    """
+
+    def __init__(self, pool_connections=10, pool_maxsize=10, pool_block=False, keep_alive=True, verify=True,
+                 cert=None, timeout=None, retry_policy=None, breaker_threshold=5, breaker_reset_timeout=30):
+        """
+        :param pool_connections: number of hosts to keep a connection pool for
+        :param pool_maxsize: maximum number of connections kept open per host, set this to at least the number of
+        threads calling TERMite concurrently
+        :param pool_block: if True, callers wait for a free connection instead of opening a throwaway one when the
+        pool is exhausted
+        :param keep_alive: if False, connections are closed after every request
+        :param verify: default SSL verification, True/False or the path to a certificate bundle
+        :param cert: client side certificate, a path or a (cert, key) tuple
+        :param timeout: default timeout in seconds, a float or a (connect, read) tuple
+        :param retry_policy: RetryPolicy deciding which requests are retried, RetryPolicy(total=0) disables retrying
+        :param breaker_threshold: consecutive failures after which an endpoint's circuit opens, None disables the
+        circuit breakers
+        :param breaker_reset_timeout: seconds an open circuit waits before letting a trial request through
+        """
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self.keep_alive = keep_alive
+        self.verify = verify
+        self.cert = cert
+        self.timeout = timeout
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset_timeout = breaker_reset_timeout
+        self._breakers = {}
+        self._adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                                    pool_block=pool_block)
+        self._local = threading.local()
+        self._sessions = []
+        self._lock = threading.Lock()
+
+    def _get_session(self):
+        """
+        Return the requests.Session of the calling thread, creating it on first use
+
+        :return: requests.Session mounted on the shared connection pools
+        """
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.mount('http://', self._adapter)
+            session.mount('https://', self._adapter)
+            session.verify = self.verify
+            session.cert = self.cert
+            if not self.keep_alive:
+                session.headers['Connection'] = 'close'
+            self._local.session = session
+            with self._lock:
+                self._sessions.append(session)
+        return session
+
+    def get_breaker(self, url):
+        """
+        Return the circuit breaker of the endpoint serving the given URL
+
+        :param url: URL of a request
+        :return: CircuitBreaker, or None if circuit breakers are disabled
+        """
+        if self.breaker_threshold is None:
+            return None
+        parts = urlsplit(url)
+        endpoint = '{}://{}'.format(parts.scheme, parts.netloc)
+        breaker = self._breakers.get(endpoint)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.setdefault(endpoint, CircuitBreaker(self.breaker_threshold,
+                                                                             self.breaker_reset_timeout))
+        return breaker
+
+    def request(self, method, url, **kwargs):
+        """
+        Send a request over the pooled connections, takes the same keyword arguments as requests.request.
+        Failed attempts are retried following the retry policy; once retries are exhausted the last error is raised,
+        or the last response returned if the server kept answering with a retryable status code.
+
+        :param method: HTTP method e.g. 'GET' or 'POST'
+        :param url: URL to be requested
+        :return: requests.Response
+        """
+        if self.timeout is not None:
+            kwargs.setdefault('timeout', self.timeout)
+        policy = self.retry_policy
+        breaker = self.get_breaker(url)
+        positions = body_positions(kwargs)
+        attempt = 0
+        while True:
+            if breaker is not None:
+                breaker.before_request(url)
+            try:
+                response = self._get_session().request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if breaker is not None:
+                    breaker.record_failure()
+                if not policy.can_retry(method, attempt) or not rewind_body(positions):
+                    raise
+                time.sleep(policy.wait_time(attempt))
+                attempt += 1
+                continue
+            except Exception:
+                # any other error, e.g. a broken chunked body, still resolves a half-open circuit's trial request
+                if breaker is not None:
+                    breaker.record_failure()
+                raise
+            except BaseException:
+                if breaker is not None:
+                    breaker.record_abort()
+                raise
+
+            if not policy.is_retryable_status(response.status_code):
+                if breaker is not None:
+                    breaker.record_success()
+                return response
+
+            if breaker is not None:
+                breaker.record_failure()
+            if not policy.can_retry(method, attempt) or not rewind_body(positions):
+                return response
+            delay = policy.wait_time(attempt, response.headers)
+            response.close()
+            time.sleep(delay)
+            attempt += 1
+
+    def probe(self, url, **kwargs):
+        """
+        Send a single GET request over the pooled connections, bypassing the retry policy and the circuit breakers,
+        e.g. to check whether a server is back up
+
+        :param url: URL to be requested
+        :return: requests.Response
+        """
+        if self.timeout is not None:
+            kwargs.setdefault('timeout', self.timeout)
+        return self._get_session().get(url, **kwargs)
+
+    def get(self, url, **kwargs):
+        """
+        Send a GET request over the pooled connections
+
+        :param url: URL to be requested
+        :return: requests.Response
+        """
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        """
+        Send a POST request over the pooled connections
+
+        :param url: URL to be requested
+        :return: requests.Response
+        """
+        return self.request('POST', url, **kwargs)
+
+    def close(self):
+        """
+        Close all pooled connections. The session can still be used afterwards, new connections are opened on demand
+        """
+        with self._lock:
+            sessions, self._sessions = self._sessions, []
+        for session in sessions:
+            session.close()
+        self._adapter = HTTPAdapter(pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize,
+                                    pool_block=self.pool_block)
+        self._local = threading.local()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+_default_session = None
+_default_session_lock = threading.Lock()
+
+
+def get_default_session():
+    """
+    Return the process-wide session used by request builders that have not been given their own
+
+    :return: TermiteSession
+    """
+    global _default_session
+    if _default_session is None:
+        with _default_session_lock:
+            if _default_session is None:
+                _default_session = TermiteSession()
+    return _default_session
+
+
+def set_default_session(session):
+    """
+    Replace the process-wide session, e.g. to raise the pool size for a heavily threaded annotation job
+
+    :param session: TermiteSession to be shared by all request builders
+    """
+    global _default_session
+    with _default_session_lock:
+        _default_session = session
@@ -0,0 +1,193 @@
+"""
+
+  ____       _ ____  _ _         _____ _____ ____  __  __ _ _         _____           _ _    _ _
+ / ___|  ___(_) __ )(_) |_ ___  |_   _| ____|  _ \|  \/  (_) |_ ___  |_   _|__   ___ | | | _(_) |_
+ \___ \ / __| |  _ \| | __/ _ \   | | |  _| | |_) | |\/| | | __/ _ \   | |/ _ \ / _ \| | |/ / | __|
+  ___) | (__| | |_) | | ||  __/   | | | |___|  _ <| |  | | | ||  __/   | | (_) | (_) | |   <| | |_
+ |____/ \___|_|____/|_|\__\___|   |_| |_____|_| \_\_|  |_|_|\__\___|   |_|\___/ \___/|_|_|\_\_|\__|
+
+
+
+Streaming- parse large TERMite and TExpress responses one document at a time.
+
+"""
+
+__author__ = 'SciBite DataScience'
+__version__ = '0.2'
+__copyright__ = '(c) 2019, SciBite Ltd'
+__license__ = 'Creative Commons Attribution-NonCommercial-ShareAlike 4.0 International License'
+
+import codecs
+import json
+
+DEFAULT_CHUNK_SIZE = 65536
+
+# top level keys holding a {docID: payload} object, documents are yielded one by one from these
+MULTIDOC_KEYS = ("RESP_MULTIDOC_PAYLOAD", "RESP_TEXPRESS")
+
+_WHITESPACE = ' \t\n\r'
+
+
+class _Reader():
+    """
+    Text buffer filled on demand from an iterable of bytes chunks. Consumed text is dropped from the buffer, so memory
+    use is bounded by the largest single JSON value being decoded rather than by the size of the response.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._json = json.JSONDecoder()
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self, min_size=0):
+        """
+        Read chunks until at least min_size characters are waiting to be parsed, or at least one more chunk
+
+        :return: False if the end of the input had already been reached
+        """
+        if self.eof:
+            return False
+        self.buf = self.buf[self.pos:]
+        self.pos = 0
+        while True:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                self.buf += self._decoder.decode(b'', final=True)
+                self.eof = True
+                return True
+            self.buf += self._decoder.decode(chunk) if isinstance(chunk, bytes) else chunk
+            if len(self.buf) >= min_size:
+                return True
+
+    def peek(self):
+        """
+        Skip whitespace and return the next character without consuming it
+
+        :return: the next character, or '' at the end of the input
+        """
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, chars):
+        """
+        Consume the next non-whitespace character, which must be one of chars
+
+        :return: the character consumed
+        """
+        ch = self.peek()
+        if not ch or ch not in chars:
+            raise ValueError("Malformed JSON response: expected one of {!r} but found {!r} at offset {}".format(
+                chars, ch, self.pos))
+        self.pos += 1
+        return ch
+
+    def value(self):
+        """
+        Decode the next complete JSON value
+
+        :return: decoded value
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self._json.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+                # read ahead geometrically so that a large value is not re-parsed once per chunk
+                self.fill(2 * (len(self.buf) - self.pos))
+                continue
+            if end == len(self.buf) and not self.eof:
+                # a number or literal at the very end of the buffer may continue in the next chunk
+                self.fill(2 * (len(self.buf) - self.pos))
+                continue
+            self.pos = end
+            return value
+
+
+def _iter_object(reader):
+    """
+    Generate the (key, value) pairs of the JSON object starting at the reader's position, one at a time
+    """
+    reader.expect('{')
+    if reader.peek() == '}':
+        reader.pos += 1
+        return
+    while True:
+        key = reader.value()
+        reader.expect(':')
+        yield key, reader
+        if reader.expect(',}') == '}':
+            return
+
+
+def iter_json_documents(chunks):
+    """
+    Incrementally parse a TERMite or TExpress response body, given as an iterable of bytes (or str) chunks.
+
+    For JSON output, one (docID, payload) tuple is generated per document of RESP_MULTIDOC_PAYLOAD or RESP_TEXPRESS,
+    and a single ('', payload) tuple for a RESP_PAYLOAD response. For doc.JSONx output, one document object is
+    generated per document. Only one document is held in memory at a time.
+
+    :param chunks: iterable of bytes chunks of the response body
+    :return: generator of (docID, payload) tuples or of doc.JSONx documents
+    """
+    reader = _Reader(chunks)
+    start = reader.peek()
+    if start == '[':
+        reader.pos += 1
+        if reader.peek() == ']':
+            return
+        while True:
+            yield reader.value()
+            if reader.expect(',]') == ']':
+                return
+    elif start == '{':
+        for key, _ in _iter_object(reader):
+            if key in MULTIDOC_KEYS:
+                for doc_id, _ in _iter_object(reader):
+                    yield doc_id, reader.value()
+            elif key == "RESP_PAYLOAD":
+                yield '', reader.value()
+            else:
+                reader.value()
+    else:
+        raise ValueError("Malformed JSON response: expected an object or an array but found {!r}".format(start))
+
+
+def _read_chunks(file_obj, chunk_size):
+    """
+    Generate chunks read from a file until it is exhausted
+    """
+    while True:
+        chunk = file_obj.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_documents(source, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Generate the documents of a TERMite or TExpress JSON or doc.JSONx response one at a time, see iter_json_documents
+
+    :param source: a streamed requests.Response, an open binary file, bytes, str or an iterable of bytes chunks
+    :param chunk_size: number of bytes read at a time from responses and files
+    :return: generator of (docID, payload) tuples for JSON output or of documents for doc.JSONx output
+    """
+    if hasattr(source, 'iter_content'):
+        chunks = source.iter_content(chunk_size=chunk_size)
+    elif hasattr(source, 'read'):
+        chunks = _read_chunks(source, chunk_size)
+    elif isinstance(source, (bytes, str)):
+        chunks = [source]
+    else:
+        chunks = source
+    return iter_json_documents(chunks)
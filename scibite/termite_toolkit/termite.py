@@ -16,10 +16,19 @@ __version__ = '0.2'
 __copyright__ = '(c) 2019, SciBite Ltd'
 __license__ = 'Creative Commons Attribution-NonCommercial-ShareAlike 4.0 International License'
 
-import requests
-import os
+import heapq
+from collections import Counter
+
 import pandas as pd
 
+from .balancer import EndpointPool, get_endpoint_pool, send
+from .cache import get_default_cache, request_key
+from .decoding import decode_response, loads
+from .session import get_default_session
+from .singleflight import get_default_group
+from .streaming import iter_documents
+from .upload import DEFAULT_CHUNK_SIZE, MultipartStream, UploadSource
+
 
 class TermiteRequestBuilder():
     """
@@ -34,6 +43,9 @@ class TermiteRequestBuilder():
         self.binary_content = None
         self.basic_auth = ()
         self.verify_request = True
+        self.session = None
+        self.cache = None
+        self.singleflight = get_default_group()
 
     def set_basic_auth(self, username='', password='', verification=True):
         """
@@ -51,21 +63,52 @@ class TermiteRequestBuilder():
     def set_url(self, url):
         """
         Set the URL of the TERMite instance e.g. for local instance http://localhost:9090/termite
+        To spread requests over several TERMite instances pass a list of URLs or a shared EndpointPool, the same list
+        of URLs always maps to the same process-wide pool
 
-        :param url: the URL of the TERMite instance to be hit
+        :param url: the URL of the TERMite instance to be hit, a list of URLs or an EndpointPool
         """
+        if isinstance(url, (list, tuple)):
+            url = get_endpoint_pool(url)
         self.url = url
 
-    def set_binary_content(self, input_file_path):
+    def set_session(self, session):
+        """
+        Send requests through the given TermiteSession instead of the process-wide default one
+
+        :param session: TermiteSession holding the pooled connections to be used
+        """
+        self.session = session
+
+    def set_cache(self, cache):
+        """
+        Look responses up in the given ResponseCache before calling TERMite, and store new responses in it
+
+        :param cache: ResponseCache to be used instead of the process-wide default one, if any
+        """
+        self.cache = cache
+
+    def set_singleflight(self, group):
+        """
+        Identical text requests sent concurrently by several builders sharing the same SingleFlight group are sent to
+        TERMite only once, and all of them receive its response. By default all builders share one group.
+
+        :param group: SingleFlight group to be used, None to always send the request
+        """
+        self.singleflight = group
+
+    def set_binary_content(self, input_file_path, file_name=None, chunk_size=DEFAULT_CHUNK_SIZE):
         """
         For annotating file content, send file path string and process file as a binary
         multiple files of the same type can be scanned at once if placed in a zip archive
+        The content is streamed to TERMite in chunks, a file given by path is only opened while it is being sent
 
-        :param input_file_path: file path to the file to be sent to TERMite
+        :param input_file_path: file path to the file to be sent to TERMite, an open binary file-like object or an
+        iterable of bytes
+        :param file_name: name the file is sent under, defaults to the base name of the file
+        :param chunk_size: number of bytes read and sent at a time
         """
-        file_obj = open(input_file_path, 'rb')
-        file_name = os.path.basename(input_file_path)
-        self.binary_content = {"binary": (file_name, file_obj)}
+        self.binary_content = {"binary": UploadSource(input_file_path, file_name=file_name, chunk_size=chunk_size)}
 
     def set_text(self, string):
         """
@@ -175,35 +218,97 @@ class TermiteRequestBuilder():
         input = bool_to_string(bool)
         self.payload["noEmpty"] = input
 
-    def execute(self, display_request=False, return_text=False):
+    def _post(self, **request_kwargs):
+        """
+        POST the request to TERMite through the session
+
+        :param request_kwargs: additional keyword arguments for the request e.g. stream=True
+        :return: requests.Response
+        :raises: requests.HTTPError if TERMite still answered with an error status once retries were exhausted
+        """
+        session = self.session or get_default_session()
+        if self.binary_content:
+            body = MultipartStream(self.payload, self.binary_content)
+            kwargs = {"data": body, "headers": {"Content-Type": body.content_type}}
+        else:
+            kwargs = {"data": self.payload}
+        if bool(self.basic_auth):
+            kwargs["auth"] = self.basic_auth
+            kwargs["verify"] = self.verify_request
+        kwargs.update(request_kwargs)
+        try:
+            response = send(session, "POST", self.url, **kwargs)
+            # an error status is raised, its body must never be decoded, cached or shared as a result
+            if not response.ok:
+                response.close()
+                response.raise_for_status()
+        except Exception as e:
+            # retries are handled by the session, anything reaching here is a hard failure the caller has to see
+            print(
+                "Failed with the following error {}\n\nPlease check that TERMite can be accessed via the following URL {}\nAnd that the necessary credentials have been provided (done so using the set_basic_auth() function)".format(
+                    e, self.url))
+            raise
+
+        return response
+
+    def execute(self, display_request=False, return_text=False, lazy=False):
         """
         Once all settings are done, POST the parameters to the TERMite RESTful API
 
         :param display_request: if True request will be printed out before being submitted
+        :param lazy: if True json and doc.jsonx output is returned as a TermiteResponse, decoded on first use and
+        memoizing the views the analysis functions derive from it
         :return: request response
+        :raises: the last connection error, timeout or CircuitOpenError once the session's retries are exhausted, or
+        requests.HTTPError if TERMite kept answering with an error status
         """
         if display_request:
             print("REQUEST: ", self.url, self.payload)
-        try:
-            if self.binary_content and bool(self.basic_auth):
-                response = requests.post(self.url, data=self.payload, files=self.binary_content, auth=self.basic_auth,
-                                         verify=self.verify_request)
-            elif self.binary_content and bool(self.basic_auth) == False:
-                response = requests.post(self.url, data=self.payload, files=self.binary_content)
-            elif not self.binary_content and bool(self.basic_auth):
-                response = requests.post(self.url, data=self.payload, verify=self.verify_request, auth=self.basic_auth)
+        cache = self.cache or get_default_cache()
+        # credentials are part of the key so that callers never share a response they could not get themselves, the
+        # same key is used for the cache and for coalescing identical requests in flight
+        key = cache.key(self.url, self.payload, self.binary_content, self.basic_auth) if cache is not None else None
+        cached = cache.get(key) if key is not None else None
+        if cached is not None:
+            content, encoding = cached
+            if "json" in self.payload["output"] and not return_text:
+                return TermiteResponse(content) if lazy else loads(content)
             else:
-                response = requests.post(self.url, data=self.payload)
-        except Exception as e:
-            return print(
-                "Failed with the following error {}\n\nPlease check that TERMite can be accessed via the following URL {}\nAnd that the necessary credentials have been provided (done so using the set_basic_auth() function)".format(
-                    e, self.url))
+                return content.decode(encoding or "utf-8", errors="replace")
+
+        if self.singleflight is not None and not self.binary_content:
+            flight_key = key or request_key(self.url, self.payload, auth=self.basic_auth)
+            response = self.singleflight.do(flight_key, self._post)
+        else:
+            response = self._post()
+
+        if key is not None and response.ok:
+            cache.set(key, response.content, response.encoding or response.apparent_encoding)
 
         if "json" in self.payload["output"] and not return_text:
-            return response.json()
+            return TermiteResponse(response.content) if lazy else decode_response(response)
         else:
             return response.text
 
+    def execute_stream(self, display_request=False, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        POST the parameters to the TERMite RESTful API and parse the json or doc.jsonx response incrementally, so that
+        neither the raw body nor the decoded response is ever held in memory as a whole. The request is sent when
+        iteration starts; the cache and request coalescing are not used.
+
+        :param display_request: if True request will be printed out before being submitted
+        :param chunk_size: number of bytes read from the connection at a time
+        :return: generator of (docID, payload) tuples for json output, or of documents for doc.jsonx output
+        """
+        if display_request:
+            print("REQUEST: ", self.url, self.payload)
+        response = self._post(stream=True)
+        try:
+            for document in iter_documents(response, chunk_size=chunk_size):
+                yield document
+        finally:
+            response.close()
+
 
 def bool_to_string(bool):
     """
@@ -218,17 +323,19 @@ def bool_to_string(bool):
     return string
 
 
-def annotate_files(url, input_file_path, options_dict):
+def annotate_files(url, input_file_path, options_dict, session=None):
     """
     Wrapper function to execute a TERMite request for annotating individual files or a zip archive
 
-    :param url: url of TERMite instance
+    :param url: url of TERMite instance, a list of URLs or an EndpointPool
     :param input_file_path: path to file to be annotated
     :param options_dict: dictionary of options to be used during annotation
+    :param session: optional TermiteSession, the process-wide default session is used if not provided
     :return: result of request
     """
     t = TermiteRequestBuilder()
     t.set_url(url)
+    t.set_session(session)
     t.set_binary_content(input_file_path)
     t.set_options(options_dict)
     result = t.execute()
@@ -236,17 +343,19 @@ def annotate_files(url, input_file_path, options_dict):
     return result
 
 
-def annotate_text(url, text, options_dict):
+def annotate_text(url, text, options_dict, session=None):
     """
     Wrapper function to execute a TERMite request for annotating strings of text
 
-    :param url: url of TERMite instance
+    :param url: url of TERMite instance, a list of URLs or an EndpointPool
     :param text: text to be annotated
     :param options_dict: dictionary of options to be used during annotation
+    :param session: optional TermiteSession, the process-wide default session is used if not provided
     :return: result of request
     """
     t = TermiteRequestBuilder()
     t.set_url(url)
+    t.set_session(session)
     t.set_text(text)
     t.set_options(options_dict)
     result = t.execute()
@@ -299,6 +408,112 @@ def process_payload(filtered_hits, response_payload, filter_entity_types, doc_id
     return filtered_hits
 
 
+class EntityHitAggregator():
+    """
+    Class for summarising entity hits across TERMite responses, fed incrementally one response, batch of streamed
+    documents or hit at a time. Every update is O(1); aggregators built separately, e.g. by worker processes over shards
+    of a corpus, can be combined with merge
+    """
+
+    def __init__(self, filter_entity_types=None, reject_ambig=True, score_cutoff=0, remove_subsumed=True):
+        """
+        :param filter_entity_types: comma separated list or iterable of entity types to keep, None to keep all
+        :param reject_ambig: boolean
+        :param score_cutoff: a numerical value between 1-5
+        :param remove_subsumed: boolean
+        """
+        if isinstance(filter_entity_types, str):
+            filter_entity_types = filter_entity_types.replace(" ", "").split(",")
+        self.filter_entity_types = set(filter_entity_types) if filter_entity_types is not None else None
+        self.reject_ambig = reject_ambig
+        self.score_cutoff = score_cutoff
+        self.remove_subsumed = remove_subsumed
+        # entity_id -> summary, doc ids are kept as dict keys: an insertion ordered set
+        self.entities = {}
+
+    def __len__(self):
+        return len(self.entities)
+
+    def add_hit(self, entity_hit, doc_id=''):
+        """
+        Add a single entity hit, the hit is not filtered
+
+        :param entity_hit: entity hit from a TERMite response
+        :param doc_id: id of the document the hit belongs to
+        """
+        entity_type = entity_hit['entityType']
+        if self.filter_entity_types is not None and entity_type not in self.filter_entity_types:
+            return
+        entity_id = entity_type + '$' + entity_hit['hitID']
+        summary = self.entities.get(entity_id)
+        if summary is None:
+            self.entities[entity_id] = {"id": entity_hit['hitID'], "type": entity_type, "name": entity_hit['name'],
+                                        "hit_count": entity_hit['hitCount'],
+                                        "max_relevance_score": entity_hit['score'], "doc_id": {doc_id: None}}
+            return
+        summary['hit_count'] += entity_hit['hitCount']
+        if entity_hit['score'] > summary['max_relevance_score']:
+            summary['max_relevance_score'] = entity_hit['score']
+        summary['doc_id'][doc_id] = None
+
+    def add_response(self, termite_response, doc_id=None):
+        """
+        Add the hits of a TERMite response, applying the filters of the aggregator
+        Single-document responses, e.g. from annotate_text, have an empty docID: pass a doc_id for each of them,
+        otherwise they are all counted as the same document
+
+        :param termite_response: JSON or doc.JSONx TERMite response, or an iterable of documents streamed by
+        TermiteRequestBuilder.execute_stream
+        :param doc_id: id given to the documents of the response that have no docID of their own
+        :return: the aggregator
+        """
+        for hit_doc_id, _, entity_hit in _iter_filtered_hits(termite_response, reject_ambig=self.reject_ambig,
+                                                             score_cutoff=self.score_cutoff,
+                                                             remove_subsumed=self.remove_subsumed):
+            if doc_id is not None and not hit_doc_id:
+                hit_doc_id = doc_id
+            self.add_hit(entity_hit, hit_doc_id)
+        return self
+
+    def merge(self, other):
+        """
+        Merge the summaries of another aggregator into this one
+
+        :param other: EntityHitAggregator
+        :return: the aggregator
+        """
+        for entity_id, other_summary in other.entities.items():
+            summary = self.entities.get(entity_id)
+            if summary is None:
+                self.entities[entity_id] = dict(other_summary, doc_id=dict(other_summary['doc_id']))
+                continue
+            summary['hit_count'] += other_summary['hit_count']
+            if other_summary['max_relevance_score'] > summary['max_relevance_score']:
+                summary['max_relevance_score'] = other_summary['max_relevance_score']
+            summary['doc_id'].update(other_summary['doc_id'])
+        return self
+
+    def to_dict(self):
+        """
+        Render the summaries in the format of get_entity_hits_from_json
+
+        :return: dictionary of filtered hits keyed by entityType$hitID
+        """
+        return {entity_id: {"id": summary['id'], "type": summary['type'], "name": summary['name'],
+                            "hit_count": summary['hit_count'], "max_relevance_score": summary['max_relevance_score'],
+                            "doc_id": list(summary['doc_id']), "doc_count": len(summary['doc_id'])}
+                for entity_id, summary in self.entities.items()}
+
+    def to_dataframe(self):
+        """
+        Render the summaries as a dataframe with one row per entity, indexed by entityType$hitID
+
+        :return: pandas dataframe
+        """
+        columns = ["id", "type", "name", "hit_count", "max_relevance_score", "doc_id", "doc_count"]
+        return pd.DataFrame.from_dict(self.to_dict(), orient='index', columns=columns)
+
+
 def get_entity_hits_from_json(termite_json_response, filter_entity_types, reject_ambig=True, score_cutoff=0):
     """
     Extract entity hits from TERMite JSON
@@ -309,24 +524,119 @@ def get_entity_hits_from_json(termite_json_response, filter_entity_types, reject
     :param score_cutoff: a numeric value between 1-5
     :return: dictionary of filtered hits
     """
-    filtered_hits = {}
-    if "RESP_MULTIDOC_PAYLOAD" in termite_json_response:
-        doc_results = termite_json_response["RESP_MULTIDOC_PAYLOAD"]
-        for doc_id, response_payload in doc_results.items():
-            filtered_hits = process_payload(filtered_hits, response_payload, filter_entity_types,
-                                            reject_ambig=reject_ambig, score_cutoff=score_cutoff, doc_id=doc_id)
+    termite_json_response = _unwrap(termite_json_response)
+    aggregator = EntityHitAggregator(filter_entity_types, reject_ambig=reject_ambig, score_cutoff=score_cutoff)
+    if "RESP_MULTIDOC_PAYLOAD" in termite_json_response or "RESP_PAYLOAD" in termite_json_response:
+        aggregator.add_response(termite_json_response)
 
-    elif "RESP_PAYLOAD" in termite_json_response:
-        response_payload = termite_json_response["RESP_PAYLOAD"]
-        filtered_hits = process_payload(filtered_hits, response_payload, filter_entity_types, reject_ambig=reject_ambig,
-                                        score_cutoff=score_cutoff)
+    return aggregator.to_dict()
+
+
+def hit_locations(entity_hit):
+    """
+    Returns the locations of an entity hit as (sentence, start, end, subsumed) tuples, reading both the TERMite 6.3
+    exact_array of 'fls' triples with its separate subsume list and the TERMite 6.4 exact_array of location objects
+
+    :param entity_hit: entity hit from a TERMite response
+    :return: list of tuples
+    """
+    exact_array = entity_hit.get('exact_array') or []
+    if exact_array and 'fls' in exact_array[0]:
+        subsume = entity_hit.get('subsume') or [False] * len(exact_array)
+        return [(loc['fls'][0], loc['fls'][1], loc['fls'][2], subsumed) for loc, subsumed in zip(exact_array, subsume)]
+    return [(loc['sentence'], loc['start'], loc['end'], loc.get('subsumed', False)) for loc in exact_array]
+
+
+def _keep_hit(entity_hit, reject_ambig=True, score_cutoff=0, remove_subsumed=True):
+    """
+    Applies the ambiguity, subsumption and relevance score filters to a single entity hit
+
+    :param entity_hit: entity hit from a TERMite response
+    :param reject_ambig: boolean
+    :param score_cutoff: a numerical value between 1-5
+    :param remove_subsumed: boolean
+    :return: boolean, True if the hit should be kept
+    """
+    if reject_ambig is True and entity_hit['nonambigsyns'] == 0:
+        return False
+    if remove_subsumed is True and True in entity_hit.get('subsume', ()):
+        return False
+    return entity_hit['score'] >= score_cutoff
+
+
+def _iter_filtered_hits(termiteResponse, reject_ambig=True, score_cutoff=0, remove_subsumed=True):
+    """
+    Walks a TERMite JSON or doc.JSONx response once, yielding every entity hit that passes the filters together with
+    its docID and its doc.JSONx document (None for JSON responses). Nothing is copied and the response is not modified.
+    Documents streamed by TermiteRequestBuilder.execute_stream are accepted in place of a response
+
+    :param termiteResponse: JSON or doc.JSONx TERMite response, or an iterable of streamed documents
+    :param reject_ambig: boolean
+    :param score_cutoff: a numerical value between 1-5
+    :param remove_subsumed: boolean
+    :return: generator of (docID, document, entity_hit) tuples
+    """
+    for doc in _documents(termiteResponse):
+        if isinstance(doc, tuple):
+            # (docID, RESP_PAYLOAD) of a JSON response
+            doc_id, response_payload = doc
+            for entity_hits in response_payload.values():
+                for entity_hit in entity_hits:
+                    if _keep_hit(entity_hit, reject_ambig, score_cutoff, remove_subsumed):
+                        yield doc_id, None, entity_hit
+        else:
+            doc_id = doc.get('docID')
+            for entity_hit in doc.get('termiteTags', ()):
+                if _keep_hit(entity_hit, reject_ambig, score_cutoff, remove_subsumed):
+                    yield doc_id, doc, entity_hit
+
+
+def _iter_filtered_documents(termiteResponse, reject_ambig=True, score_cutoff=0, remove_subsumed=True):
+    """
+    Walks a TERMite JSON or doc.JSONx response once, yielding the entity hits that pass the filters document by
+    document, for callers that need the document boundaries of the response rather than its docIDs, which may be
+    missing or repeated
+
+    :param termiteResponse: JSON or doc.JSONx TERMite response, or an iterable of streamed documents
+    :param reject_ambig: boolean
+    :param score_cutoff: a numerical value between 1-5
+    :param remove_subsumed: boolean
+    :return: generator of (docID, document, list of entity hits) tuples, document is None for JSON responses
+    """
+    for doc in _documents(termiteResponse):
+        if isinstance(doc, tuple):
+            doc_id, response_payload = doc
+            yield doc_id, None, [entity_hit for entity_hits in response_payload.values() for entity_hit in entity_hits
+                                 if _keep_hit(entity_hit, reject_ambig, score_cutoff, remove_subsumed)]
+        else:
+            yield doc.get('docID'), doc, [entity_hit for entity_hit in doc.get('termiteTags', ())
+                                          if _keep_hit(entity_hit, reject_ambig, score_cutoff, remove_subsumed)]
 
-    return filtered_hits
+
+def _documents(termiteResponse):
+    """
+    The documents of a TERMite response: (docID, RESP_PAYLOAD) tuples for JSON, the documents themselves for doc.JSONx
+    and streamed documents as they come
+
+    :param termiteResponse: JSON or doc.JSONx TERMite response, TermiteResponse, or an iterable of streamed documents
+    :return: iterable of documents
+    """
+    termiteResponse = _unwrap(termiteResponse)
+    if isinstance(termiteResponse, dict):
+        if "RESP_MULTIDOC_PAYLOAD" in termiteResponse:
+            return termiteResponse['RESP_MULTIDOC_PAYLOAD'].items()
+        elif "RESP_PAYLOAD" in termiteResponse:
+            return [('', termiteResponse['RESP_PAYLOAD'])]
+        else:
+            return []
+    return termiteResponse
 
 
 def docjsonx_payload_records(docjsonx_response_payload, reject_ambig=True, score_cutoff=0, remove_subsumed=True):
     """
     Parses TERMite doc.JSONx payload into records, includes rules to filter out ambiguous and low-relevance hits
+    Each record holds the entity hit together with all fields of its document, see docjsonx_payload_tables for a
+    normalised alternative that does not repeat the document in every hit
 
     :param docjsonx_response_payload: doc.JSONx TERMite response.
     :param reject_ambig: boolean
@@ -337,23 +647,45 @@ def docjsonx_payload_records(docjsonx_response_payload, reject_ambig=True, score
     payload = []
     for doc in docjsonx_response_payload:
         if 'termiteTags' in doc.keys():
+            doc_fields = {k: v for k, v in doc.items() if k != 'termiteTags'}
             for entity_hit in doc['termiteTags']:
-                # update document record with entity hit record
-                entity_hit.update(doc)
-                del entity_hit['termiteTags']
-
                 # filtering
-                if reject_ambig is True and entity_hit['nonambigsyns'] == 0:
+                if not _keep_hit(entity_hit, reject_ambig, score_cutoff, remove_subsumed):
                     continue
-                if "subsume" in entity_hit and remove_subsumed is True:
-                    if True in entity_hit['subsume']:
-                        continue
-                if entity_hit['score'] >= score_cutoff:
-                    payload.append(entity_hit)
+                # entity hit record updated with the document record, leaving the response untouched
+                record = dict(entity_hit)
+                record.update(doc_fields)
+                payload.append(record)
 
     return (payload)
 
 
+def docjsonx_payload_tables(docjsonx_response_payload, reject_ambig=True, score_cutoff=0, remove_subsumed=True):
+    """
+    Parses TERMite doc.JSONx payload into normalised records joined by docID: one record per document with its document
+    level fields (title, body...) and one record per entity hit with the hit fields and the docID of its document.
+    Document fields are stored once rather than in every hit and the response is not modified
+
+    :param docjsonx_response_payload: doc.JSONx TERMite response
+    :param reject_ambig: boolean
+    :param score_cutoff: a numerical value between 1-5
+    :param remove_subsumed: boolean
+    :return: tuple of (document records, hit records)
+    """
+    documents = []
+    hits = []
+    for doc in docjsonx_response_payload:
+        documents.append({k: v for k, v in doc.items() if k != 'termiteTags'})
+        doc_id = doc.get('docID')
+        for entity_hit in doc.get('termiteTags', ()):
+            if _keep_hit(entity_hit, reject_ambig, score_cutoff, remove_subsumed):
+                record = dict(entity_hit)
+                record['docID'] = doc_id
+                hits.append(record)
+
+    return documents, hits
+
+
 def json_payload_records(response_payload, reject_ambig=True, score_cutoff=0, remove_subsumed=True):
     """
     Parses TERMite json payload into records, includes rules to filter out ambiguous and low-relevance hits
@@ -364,20 +696,40 @@ def json_payload_records(response_payload, reject_ambig=True, score_cutoff=0, re
     :param remove_subsumed: boolean
     :return: TERMite response in records format
     """
-    payload = []
-    for entity_type, entity_hits in response_payload.items():
-        for entity_hit in entity_hits:
-            if reject_ambig is True and entity_hit['nonambigsyns'] == 0:
-                continue
-            if "subsume" in entity_hit and remove_subsumed is True:
-                if True in entity_hit['subsume']:
-                    continue
-            if entity_hit['score'] >= score_cutoff:
-                payload.append(entity_hit)
+    payload = [entity_hit for _, _, entity_hit in _iter_filtered_hits({"RESP_PAYLOAD": response_payload},
+                                                                      reject_ambig=reject_ambig,
+                                                                      score_cutoff=score_cutoff,
+                                                                      remove_subsumed=remove_subsumed)]
 
     return (payload)
 
 
+def iter_payload_records(termiteResponse, reject_ambig=True, score_cutoff=0, remove_subsumed=True):
+    """
+    Lazily parses TERMite JSON or doc.JSONx output into records format in a single linear pass, so that consumers can
+    stop early. JSON records are the hits of the response, doc.JSONx records also hold the fields of their document.
+    Documents streamed by TermiteRequestBuilder.execute_stream are accepted in place of a response
+
+    :param termiteResponse: JSON or doc.JSONx TERMite response, or an iterable of streamed documents
+    :param reject_ambig: boolean
+    :param score_cutoff: a numerical value between 1-5
+    :param remove_subsumed: boolean
+    :return: generator of TERMite hit records
+    """
+    current_doc = doc_fields = None
+    for _, doc, entity_hit in _iter_filtered_hits(termiteResponse, reject_ambig=reject_ambig,
+                                                  score_cutoff=score_cutoff, remove_subsumed=remove_subsumed):
+        if doc is None:
+            yield entity_hit
+            continue
+        if doc is not current_doc:
+            current_doc = doc
+            doc_fields = {k: v for k, v in doc.items() if k != 'termiteTags'}
+        record = dict(entity_hit)
+        record.update(doc_fields)
+        yield record
+
+
 def payload_records(termiteResponse, reject_ambig=True, score_cutoff=0, remove_subsumed=True):
     """
     Parses TERMite JSON or doc.JSONx output into records format
@@ -388,21 +740,69 @@ def payload_records(termiteResponse, reject_ambig=True, score_cutoff=0, remove_s
     :param remove_subsumed: boolean
     :return: TERMite response in records format
     """
-    payload = []
+    if isinstance(termiteResponse, TermiteResponse):
+        return termiteResponse.records(reject_ambig=reject_ambig, score_cutoff=score_cutoff,
+                                       remove_subsumed=remove_subsumed)
+    return list(iter_payload_records(termiteResponse, reject_ambig=reject_ambig, score_cutoff=score_cutoff,
+                                     remove_subsumed=remove_subsumed))
 
-    if "RESP_MULTIDOC_PAYLOAD" in termiteResponse:
-        for docID, termite_hits in termiteResponse['RESP_MULTIDOC_PAYLOAD'].items():
-            payload = payload + json_payload_records(termite_hits, reject_ambig=reject_ambig,
-                                                     score_cutoff=score_cutoff, remove_subsumed=remove_subsumed)
-    elif "RESP_PAYLOAD" in termiteResponse:
-        payload = payload + json_payload_records(termiteResponse['RESP_PAYLOAD'], reject_ambig=reject_ambig,
-                                                 score_cutoff=score_cutoff, remove_subsumed=remove_subsumed)
 
-    else:
-        payload = docjsonx_payload_records(termiteResponse, reject_ambig=reject_ambig,
-                                           score_cutoff=score_cutoff, remove_subsumed=remove_subsumed)
+# columns holding a small set of repeated values, stored as pandas categoricals
+CATEGORICAL_COLUMNS = ("entityType", "hitID")
 
-    return (payload)
+
+def _hits_frame(termiteResponse, cols_to_add="", reject_ambig=True, score_cutoff=0, remove_subsumed=True,
+                doc_fields=True):
+    """
+    Builds the dataframe of hits of get_termite_dataframe column by column in a single pass over the response
+
+    :param termiteResponse: JSON or doc.JSONx response from TERMite
+    :param cols_to_add: comma separated list of additional fields to include
+    :param reject_ambig: boolean
+    :param score_cutoff: a numerical value between 1-5
+    :param remove_subsumed: boolean
+    :param doc_fields: boolean, take doc.JSONx document fields in preference to hit fields, otherwise only the docID
+    :return: dataframe of TERMite hits
+    """
+    cols = ["docID", "entityType", "hitID", "name", "score", "realSynList", "totnosyns", "nonambigsyns",
+            "frag_vector_array", "hitCount"]
+    if cols_to_add:
+        cols_to_add = cols_to_add.replace(" ", "").split(",")
+        cols = cols + [col for col in cols_to_add if col not in cols]
+
+    columns = {col: [] for col in cols}
+    # doc.JSONx document fields take precedence over hit fields, as in docjsonx_payload_records
+    doc_cols = set(cols) - {'termiteTags'} if doc_fields else {'docID'}
+    seen = set()
+    n_hits = 0
+    for _, doc, entity_hit in _iter_filtered_hits(termiteResponse, reject_ambig=reject_ambig,
+                                                  score_cutoff=score_cutoff, remove_subsumed=remove_subsumed):
+        n_hits += 1
+        for col, values in columns.items():
+            if doc is not None and col in doc_cols and col in doc:
+                values.append(doc[col])
+            elif col in entity_hit:
+                values.append(entity_hit[col])
+            else:
+                values.append(None)
+                continue
+            seen.add(col)
+
+    if n_hits == 0:
+        return pd.DataFrame(columns=cols)
+
+    missing = [col for col in cols if col not in seen]
+    if missing:
+        e = KeyError("{} not in index".format(missing))
+        if cols_to_add:
+            print("Invalid column selection.", e)
+            return None
+        raise e
+
+    for col in CATEGORICAL_COLUMNS:
+        columns[col] = pd.Categorical(columns[col])
+
+    return pd.DataFrame(columns, columns=cols)
 
 
 def get_termite_dataframe(termiteResponse, cols_to_add="", reject_ambig=True, score_cutoff=0,
@@ -411,6 +811,7 @@ def get_termite_dataframe(termiteResponse, cols_to_add="", reject_ambig=True, sc
     Parses TERMite JSON or doc.JSONx into a dataframe of hits, filtering out ambiguous and low-relevance hits
     By default returns docID, entityType, hitID, name, score, realSynList, totnosyns, nonambigsyns, frag_vector_array
     Additional hit information not included in the default output can be included by use of a comma separated list
+    The response is walked once and only the selected columns are collected, entityType and hitID are categorical
 
     :param termiteResponse: JSON or doc.JSONx response from TERMite
     :param cols_to_add: comma separated list of additional fields to include
@@ -419,28 +820,39 @@ def get_termite_dataframe(termiteResponse, cols_to_add="", reject_ambig=True, sc
     :param remove_subsumed: boolean
     :return: dataframe of TERMite hits
     """
+    if isinstance(termiteResponse, TermiteResponse):
+        return termiteResponse.dataframe(cols_to_add=cols_to_add, reject_ambig=reject_ambig,
+                                         score_cutoff=score_cutoff, remove_subsumed=remove_subsumed)
+    return _hits_frame(termiteResponse, cols_to_add=cols_to_add, reject_ambig=reject_ambig,
+                       score_cutoff=score_cutoff, remove_subsumed=remove_subsumed)
 
-    payload = payload_records(termiteResponse, reject_ambig=reject_ambig,
-                              score_cutoff=score_cutoff, remove_subsumed=remove_subsumed)
-
-    df = pd.DataFrame(payload)
 
-    cols = ["docID", "entityType", "hitID", "name", "score", "realSynList", "totnosyns", "nonambigsyns",
-            "frag_vector_array", "hitCount"]
+def get_termite_tables(termiteResponse, cols_to_add="", reject_ambig=True, score_cutoff=0, remove_subsumed=True):
+    """
+    Parses TERMite JSON or doc.JSONx into two normalised dataframes joined by docID: a document table with one row per
+    document and a hit table with the columns of get_termite_dataframe. For doc.JSONx the document level fields such as
+    the body are only held in the document table, for JSON the document table lists the docIDs
 
-    if cols_to_add:
-        cols_to_add = cols_to_add.replace(" ", "").split(",")
-        try:
-            cols = cols + cols_to_add
-            if df.empty:
-                return pd.DataFrame(columns=cols)
-            return (df[cols])
-        except KeyError as e:
-            print("Invalid column selection.", e)
+    :param termiteResponse: JSON or doc.JSONx response from TERMite
+    :param cols_to_add: comma separated list of additional hit fields to include
+    :param reject_ambig: boolean
+    :param score_cutoff: a numerical value between 1-5
+    :param remove_subsumed: boolean
+    :return: tuple of (documents dataframe, hits dataframe)
+    """
+    termiteResponse = _unwrap(termiteResponse)
+    if "RESP_MULTIDOC_PAYLOAD" in termiteResponse:
+        documents = pd.DataFrame({"docID": list(termiteResponse["RESP_MULTIDOC_PAYLOAD"])})
+    elif "RESP_PAYLOAD" in termiteResponse:
+        documents = pd.DataFrame({"docID": [""]})
     else:
-        if df.empty:
-            return pd.DataFrame(columns=cols)
-        return (df[cols])
+        documents = pd.DataFrame([{k: v for k, v in doc.items() if k != 'termiteTags'}
+                                  for doc in termiteResponse])
+
+    hits = _hits_frame(termiteResponse, cols_to_add=cols_to_add, reject_ambig=reject_ambig,
+                       score_cutoff=score_cutoff, remove_subsumed=remove_subsumed, doc_fields=False)
+
+    return documents, hits
 
 
 def get_entity_hits_from_docjsonx(termite_response, filter_entity_types):
@@ -451,32 +863,7 @@ def get_entity_hits_from_docjsonx(termite_response, filter_entity_types):
     :param filter_entity_types: comma separated list
     :return: dictionary of filtered hits
     """
-    processed = docjsonx_payload_records(termite_response)
-
-    filtered_hits = {}
-    for entity_hit in processed:
-        hit_id = entity_hit['hitID']
-        entityType = entity_hit['entityType']
-        entity_id = entityType + '$' + hit_id
-        entity_name = entity_hit['name']
-        hit_count = entity_hit['hitCount']
-        entity_score = entity_hit['score']
-        doc_id = entity_hit['docID']
-
-        if entityType in filter_entity_types:
-            if entity_id in filtered_hits:
-                filtered_hits[entity_id]['hit_count'] += hit_count
-                if entity_score > filtered_hits[entity_id]['max_relevance_score']:
-                    filtered_hits[entity_id]['max_relevance_score'] = entity_score
-                if doc_id not in filtered_hits[entity_id]['doc_id']:
-                    filtered_hits[entity_id]['doc_id'].append(doc_id)
-                    filtered_hits[entity_id]['doc_count'] += 1
-            else:
-                filtered_hits[entity_id] = {"id": hit_id, "type": entityType, "name": entity_name,
-                                            "hit_count": hit_count,
-                                            "max_relevance_score": entity_score, "doc_id": [doc_id], "doc_count": 1}
-
-    return (filtered_hits)
+    return EntityHitAggregator(filter_entity_types).add_response(termite_response).to_dict()
 
 
 def termite_entity_hits_df(termite_response, filter_entity_types):
@@ -489,7 +876,7 @@ def termite_entity_hits_df(termite_response, filter_entity_types):
     :param filter_entity_types: comma separated list of entities to be annotated
     :return: pandas dataframe
     """
-    payload = payload_records(termite_response)
+    payload = iter_payload_records(termite_response)
 
 
     #Magic formula that adds vocab ID header right after each vocab
@@ -511,36 +898,30 @@ def all_entities(termite_response):
     :param termite_response: JSON or doc.JSONx TERMite response
     :return: list
     """
-    payload = payload_records(termite_response)
+    if isinstance(termite_response, TermiteResponse):
+        return termite_response.entity_types()
 
-    entities_used = []
-    for entity_hit in payload:
-        if entity_hit['entityType'] not in entities_used:
-            entities_used.append(entity_hit['entityType'])
+    # dict keys keep the order in which the entity types are first seen
+    entities_used = dict.fromkeys(entity_hit['entityType'] for entity_hit in iter_payload_records(termite_response))
 
-    return (entities_used)
+    return (list(entities_used))
 
 
 def all_entities_df(termite_response):
     """
-    Parses JSON or doc.JSONx TERMite response into summary of hits dataframe
+    Parses JSON or doc.JSONx TERMite response into summary of hits dataframe, in a single pass over the response
 
     :param termite_response: JSON or doc.JSONx TERMite response
     :return: pandas dataframe
     """
 
-    # identify all entitiy hit types in the text
-    entities_used = all_entities(termite_response)
-    entities_string = (',').join(entities_used)
-
-    if "RESP_MULTIDOC_PAYLOAD" in termite_response or "RESP_PAYLOAD" in termite_response:
-        filtered_hits = get_entity_hits_from_json(termite_response, entities_string)
-    else:
-        filtered_hits = get_entity_hits_from_docjsonx(termite_response, entities_string)
+    if isinstance(termite_response, TermiteResponse):
+        return termite_response.entity_summary().to_dataframe()
 
-    df = pd.DataFrame(filtered_hits).T
+    # summarise the hits of every entity type found in the text
+    aggregator = EntityHitAggregator().add_response(termite_response)
 
-    return (df)
+    return aggregator.to_dataframe()
 
 
 def entity_freq(termite_response):
@@ -550,19 +931,110 @@ def entity_freq(termite_response):
     :param termite_response: JSON or doc.JSONx TERMite response
     :return: pandas dataframe
     """
+    if isinstance(termite_response, TermiteResponse):
+        return termite_response.entity_freq()
 
-    df = get_termite_dataframe(termite_response)
+    counts = Counter(entity_hit['entityType'] for entity_hit in iter_payload_records(termite_response))
 
-    values = pd.value_counts(df['entityType'])
+    values = pd.Series(counts, name='count', dtype='int64').sort_values(ascending=False, kind='stable')
+    values.index.name = 'entityType'
     values = pd.DataFrame(values)
     return (values)
 
 
+class TopHits():
+    """
+    Class for keeping the most frequent hits, by hitCount, of one response or of a stream of TERMite responses.
+    Only the top selection hits are held, in a bounded heap, so memory does not grow with the number of hits. Ties are
+    broken by the order in which hits were added
+    """
+
+    # columns of the rendered dataframe, entityType is only included when include_docs is set
+    columns = ["name", "realSynList", "totnosyns", "hitID", "entityType"]
+
+    def __init__(self, selection=10, entity_subset=None, per_entity_type=False, reject_ambig=True, score_cutoff=0,
+                 remove_subsumed=True):
+        """
+        :param selection: number of most frequent hits to keep
+        :param entity_subset: comma separated list of entity types to include, None to include all
+        :param per_entity_type: boolean, keep the top selection hits of every entity type rather than overall
+        :param reject_ambig: boolean
+        :param score_cutoff: a numerical value between 1-5
+        :param remove_subsumed: boolean
+        """
+        if isinstance(entity_subset, str):
+            entity_subset = entity_subset.replace(" ", "").split(",")
+        self.selection = selection
+        self.entity_subset = set(entity_subset) if entity_subset is not None else None
+        self.per_entity_type = per_entity_type
+        self.reject_ambig = reject_ambig
+        self.score_cutoff = score_cutoff
+        self.remove_subsumed = remove_subsumed
+        # min-heaps of (hitCount, -position, position, row) so the smallest, latest added hit is evicted first
+        self.heaps = {}
+        self.n_hits = 0
+
+    def add_hit(self, entity_hit):
+        """
+        Offer a single entity hit, the hit is not filtered
+
+        :param entity_hit: entity hit from a TERMite response
+        """
+        position = self.n_hits
+        self.n_hits += 1
+        entity_type = entity_hit['entityType']
+        if self.selection <= 0 or self.entity_subset is not None and entity_type not in self.entity_subset:
+            return
+
+        heap = self.heaps.setdefault(entity_type if self.per_entity_type else None, [])
+        hit_count = entity_hit['hitCount']
+        if len(heap) == self.selection:
+            # hits tied with the smallest kept hit lose to it as they were added later
+            if hit_count <= heap[0][0]:
+                return
+            push = heapq.heapreplace
+        else:
+            push = heapq.heappush
+        row = (entity_hit['name'], entity_hit['realSynList'], entity_hit['totnosyns'], entity_hit['hitID'],
+               entity_type)
+        push(heap, (hit_count, -position, position, row))
+
+    def add_response(self, termite_response):
+        """
+        Offer the hits of a TERMite response, applying the filters
+
+        :param termite_response: JSON or doc.JSONx TERMite response, or an iterable of documents streamed by
+        TermiteRequestBuilder.execute_stream
+        :return: self
+        """
+        for _, _, entity_hit in _iter_filtered_hits(termite_response, reject_ambig=self.reject_ambig,
+                                                    score_cutoff=self.score_cutoff,
+                                                    remove_subsumed=self.remove_subsumed):
+            self.add_hit(entity_hit)
+        return self
+
+    def to_dataframe(self, include_docs=False):
+        """
+        Render the kept hits, most frequent first, indexed by the position in which they were added
+
+        :param include_docs: boolean, include the entityType column
+        :return: pandas dataframe
+        """
+        entries = []
+        for heap in self.heaps.values():
+            entries.extend(sorted(heap, reverse=True))
+        columns = self.columns if include_docs is True else self.columns[:-1]
+        rows = [entry[3][:len(columns)] for entry in entries]
+        index = [entry[2] for entry in entries]
+        return pd.DataFrame(rows, index=index, columns=columns)
+
+
 def top_hits_df(termite_response, selection=10, entity_subset=None, include_docs=False):
     """
     Parses JSON or doc.JSONx TERMite response and returns a pandas dataframe of the most frequent hits. By default the
     top 10 most frequent hits are returned. The entity types to include can be set by a comma separated list
     For multidoc results the documents in which hits occur can be included
+    Use TopHits directly to keep the most frequent hits across a stream of responses
 
     :param termite_response: JSON or doc.JSONx TERMite response
     :param selection: number of most frequent hits to return
@@ -570,20 +1042,126 @@ def top_hits_df(termite_response, selection=10, entity_subset=None, include_docs
     :param include_docs: boolean
     :return: pandas dataframe
     """
+    if isinstance(termite_response, TermiteResponse):
+        return termite_response.top_hits(selection=selection, entity_subset=entity_subset, include_docs=include_docs)
+    top_hits = TopHits(selection=selection, entity_subset=entity_subset).add_response(termite_response)
+    return top_hits.to_dataframe(include_docs=include_docs)
 
-    # get entity hits and sort by hit_count
-    df = get_termite_dataframe(termite_response)
-    df.sort_values(by=['hitCount'], ascending=False, inplace=True)
-    df2 = df.copy()
 
-    # select relevant columns and filtering
-    if include_docs is True:
-        columns = [3, 5, 6, 2, 1]
-    else:
-        columns = [3, 5, 6, 2]
-    if entity_subset is not None:
-        entity_subset = entity_subset.replace(" ", "").split(",")
-        criteria = df2['entityType'].isin(entity_subset)
-        return (df2[criteria].iloc[0:selection, columns])
-    else:
-        return (df2.iloc[0:selection, columns])
+class TermiteResponse():
+    """
+    Lazy wrapper around a TERMite JSON or doc.JSONx response. The body is decoded and its format detected on first use,
+    and the records, dataframes and summaries derived from it are computed on first access and memoized, so calling
+    several analysis functions on the same response walks it once per view. Every analysis function in this module
+    accepts a TermiteResponse in place of the decoded response.
+    Dataframes are returned as copies so that modifying them leaves the memoized views intact; records and the entity
+    summary are shared and should not be modified
+    """
+
+    def __init__(self, response):
+        """
+        :param response: decoded JSON or doc.JSONx TERMite response, or its raw body as bytes or str
+        """
+        if isinstance(response, (bytes, bytearray, str)):
+            self._body, self._response = response, None
+        else:
+            self._body, self._response = None, response
+        self._views = {}
+
+    @property
+    def response(self):
+        """
+        The decoded response
+        """
+        if self._response is None:
+            self._response = loads(self._body)
+            self._body = None
+        return self._response
+
+    @property
+    def format(self):
+        """
+        json or doc.jsonx
+        """
+        return self._memo('format', lambda: 'json' if isinstance(self.response, dict) else 'doc.jsonx')
+
+    def _memo(self, key, compute):
+        """
+        Return the view stored under key, computing it on first access
+        """
+        if key not in self._views:
+            self._views[key] = compute()
+        return self._views[key]
+
+    def records(self, reject_ambig=True, score_cutoff=0, remove_subsumed=True):
+        """
+        Memoized payload_records
+
+        :return: TERMite response in records format
+        """
+        return self._memo(('records', reject_ambig, score_cutoff, remove_subsumed),
+                          lambda: list(iter_payload_records(self.response, reject_ambig=reject_ambig,
+                                                            score_cutoff=score_cutoff,
+                                                            remove_subsumed=remove_subsumed)))
+
+    def dataframe(self, cols_to_add="", reject_ambig=True, score_cutoff=0, remove_subsumed=True):
+        """
+        Memoized get_termite_dataframe
+
+        :return: dataframe of TERMite hits
+        """
+        df = self._memo(('dataframe', cols_to_add, reject_ambig, score_cutoff, remove_subsumed),
+                        lambda: _hits_frame(self.response, cols_to_add=cols_to_add, reject_ambig=reject_ambig,
+                                            score_cutoff=score_cutoff, remove_subsumed=remove_subsumed))
+        return df.copy() if df is not None else None
+
+    def entity_summary(self):
+        """
+        Memoized EntityHitAggregator of all the hits passing the default filters
+
+        :return: EntityHitAggregator
+        """
+        return self._memo('entity_summary', lambda: EntityHitAggregator().add_response(self.response))
+
+    def entity_types(self):
+        """
+        Memoized all_entities, read from the entity summary
+
+        :return: list
+        """
+        # entities are summarised in the order they are first seen, so are their types
+        return list(self._memo('entity_types', lambda: list(dict.fromkeys(
+            summary['type'] for summary in self.entity_summary().entities.values()))))
+
+    def entity_freq(self):
+        """
+        Memoized entity_freq
+
+        :return: pandas dataframe
+        """
+        return self._memo('entity_freq', lambda: entity_freq(self.response)).copy()
+
+    def top_hits(self, selection=10, entity_subset=None, include_docs=False):
+        """
+        Memoized top_hits_df
+
+        :return: pandas dataframe
+        """
+        if entity_subset is not None and not isinstance(entity_subset, str):
+            # lists of entity types are unhashable
+            entity_subset = tuple(entity_subset)
+        return self._memo(('top_hits', selection, entity_subset, include_docs),
+                          lambda: top_hits_df(self.response, selection=selection, entity_subset=entity_subset,
+                                              include_docs=include_docs)).copy()
+
+
+def _unwrap(termite_response):
+    """
+    Returns the decoded response held by a TermiteResponse, any other response is returned unchanged
+
+    :param termite_response: TermiteResponse, JSON or doc.JSONx TERMite response
+    :return: JSON or doc.JSONx TERMite response
+    """
+    if isinstance(termite_response, TermiteResponse):
+        return termite_response.response
+    return termite_response
@@ -16,10 +16,16 @@ __version__ = '0.2'
 __copyright__ = '(c) 2019, SciBite Ltd'
 __license__ = 'Creative Commons Attribution-NonCommercial-ShareAlike 4.0 International License'
 
-import requests
-import os
 import pandas as pd
 
+from .balancer import EndpointPool, get_endpoint_pool, send
+from .cache import get_default_cache, request_key
+from .decoding import decode_response, loads
+from .session import get_default_session
+from .singleflight import get_default_group
+from .streaming import iter_documents
+from .upload import DEFAULT_CHUNK_SIZE, MultipartStream, UploadSource
+
 
 class TexpressRequestBuilder():
     """
@@ -34,6 +40,9 @@ class TexpressRequestBuilder():
         self.binary_content = None
         self.basic_auth = ()
         self.verify_request = True
+        self.session = None
+        self.cache = None
+        self.singleflight = get_default_group()
 
     def set_basic_auth(self, username='', password='', verification=True):
         """
@@ -50,21 +59,52 @@ class TexpressRequestBuilder():
     def set_url(self, url):
         """
         Set the URL of the TERMite instance e.g. for local instance http://localhost:9090/termite
+        To spread requests over several TERMite instances pass a list of URLs or a shared EndpointPool, the same list
+        of URLs always maps to the same process-wide pool
 
-        :param url: the URL of the TERMite instance to be hit
+        :param url: the URL of the TERMite instance to be hit, a list of URLs or an EndpointPool
         """
+        if isinstance(url, (list, tuple)):
+            url = get_endpoint_pool(url)
         self.url = url
 
-    def set_binary_content(self, input_file_path):
+    def set_session(self, session):
+        """
+        Send requests through the given TermiteSession instead of the process-wide default one
+
+        :param session: TermiteSession holding the pooled connections to be used
+        """
+        self.session = session
+
+    def set_cache(self, cache):
+        """
+        Look responses up in the given ResponseCache before calling TERMite, and store new responses in it
+
+        :param cache: ResponseCache to be used instead of the process-wide default one, if any
+        """
+        self.cache = cache
+
+    def set_singleflight(self, group):
+        """
+        Identical text requests sent concurrently by several builders sharing the same SingleFlight group are sent to
+        TERMite only once, and all of them receive its response. By default all builders share one group.
+
+        :param group: SingleFlight group to be used, None to always send the request
+        """
+        self.singleflight = group
+
+    def set_binary_content(self, input_file_path, file_name=None, chunk_size=DEFAULT_CHUNK_SIZE):
         """
         For annotating file content, send file path string and process file as a binary
         multiple files of the same type can be scanned at once if placed in a zip archive
-        
-        :param input_file_path: file path to the file to be sent to TERMite
+        The content is streamed to TERMite in chunks, a file given by path is only opened while it is being sent
+
+        :param input_file_path: file path to the file to be sent to TERMite, an open binary file-like object or an
+        iterable of bytes
+        :param file_name: name the file is sent under, defaults to the base name of the file
+        :param chunk_size: number of bytes read and sent at a time
         """
-        file_obj = open(input_file_path, 'rb')
-        file_name = os.path.basename(input_file_path)
-        self.binary_content = {"binary": (file_name, file_obj)}
+        self.binary_content = {"binary": UploadSource(input_file_path, file_name=file_name, chunk_size=chunk_size)}
 
     def set_text(self, string):
         """
@@ -163,35 +203,95 @@ class TexpressRequestBuilder():
         input = bool_to_string(bool)
         self.payload["noEmpty"] = input
 
+    def _post(self, **request_kwargs):
+        """
+        POST the request to TERMite through the session
+
+        :param request_kwargs: additional keyword arguments for the request e.g. stream=True
+        :return: requests.Response
+        :raises: requests.HTTPError if TERMite still answered with an error status once retries were exhausted
+        """
+        session = self.session or get_default_session()
+        if self.binary_content:
+            body = MultipartStream(self.payload, self.binary_content)
+            kwargs = {"data": body, "headers": {"Content-Type": body.content_type}}
+        else:
+            kwargs = {"data": self.payload}
+        if bool(self.basic_auth):
+            kwargs["auth"] = self.basic_auth
+            kwargs["verify"] = self.verify_request
+        kwargs.update(request_kwargs)
+        try:
+            response = send(session, "POST", self.url, **kwargs)
+            # an error status is raised, its body must never be decoded, cached or shared as a result
+            if not response.ok:
+                response.close()
+                response.raise_for_status()
+        except Exception as e:
+            # retries are handled by the session, anything reaching here is a hard failure the caller has to see
+            print(
+                "Failed with the following error {}\n\nPlease check that TERMite can be accessed via the following URL {}\nAnd that the necessary credentials have been provided (done so using the set_basic_auth() function)".format(
+                    e, self.url))
+            raise
+
+        return response
+
     def execute(self, display_request=False, return_text=False):
         """
         Once all settings are done, POST the parameters to the TERMite RESTful API
 
         :param display_request: if True request will be printed out before being submitted
         :return: request response
+        :raises: the last connection error, timeout or CircuitOpenError once the session's retries are exhausted, or
+        requests.HTTPError if TERMite kept answering with an error status
         """
         if display_request:
             print("REQUEST: ", self.url, self.payload)
-        try:
-            if self.binary_content and bool(self.basic_auth):
-                response = requests.post(self.url, data=self.payload, files=self.binary_content, auth=self.basic_auth,
-                                         verify=self.verify_request)
-            elif self.binary_content and bool(self.basic_auth) == False:
-                response = requests.post(self.url, data=self.payload, files=self.binary_content)
-            elif not self.binary_content and bool(self.basic_auth):
-                response = requests.post(self.url, data=self.payload, verify=self.verify_request, auth=self.basic_auth)
+        cache = self.cache or get_default_cache()
+        # credentials are part of the key so that callers never share a response they could not get themselves, the
+        # same key is used for the cache and for coalescing identical requests in flight
+        key = cache.key(self.url, self.payload, self.binary_content, self.basic_auth) if cache is not None else None
+        cached = cache.get(key) if key is not None else None
+        if cached is not None:
+            content, encoding = cached
+            if self.payload["output"] in ["json", "doc.json", "doc.jsonx"] and not return_text:
+                return loads(content)
             else:
-                response = requests.post(self.url, data=self.payload)
-        except Exception as e:
-            return print(
-                "Failed with the following error {}\n\nPlease check that TERMite can be accessed via the following URL {}\nAnd that the necessary credentials have been provided (done so using the set_basic_auth() function)".format(
-                    e, self.url))
+                return content.decode(encoding or "utf-8", errors="replace")
+
+        if self.singleflight is not None and not self.binary_content:
+            flight_key = key or request_key(self.url, self.payload, auth=self.basic_auth)
+            response = self.singleflight.do(flight_key, self._post)
+        else:
+            response = self._post()
+
+        if key is not None and response.ok:
+            cache.set(key, response.content, response.encoding or response.apparent_encoding)
 
         if self.payload["output"] in ["json", "doc.json", "doc.jsonx"] and not return_text:
-            return response.json()
+            return decode_response(response)
         else:
             return response.text
 
+    def execute_stream(self, display_request=False, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        POST the parameters to the TERMite RESTful API and parse the json or doc.jsonx response incrementally, so that
+        neither the raw body nor the decoded response is ever held in memory as a whole. The request is sent when
+        iteration starts; the cache and request coalescing are not used.
+
+        :param display_request: if True request will be printed out before being submitted
+        :param chunk_size: number of bytes read from the connection at a time
+        :return: generator of (docID, payload) tuples for json output, or of documents for doc.jsonx output
+        """
+        if display_request:
+            print("REQUEST: ", self.url, self.payload)
+        response = self._post(stream=True)
+        try:
+            for document in iter_documents(response, chunk_size=chunk_size):
+                yield document
+        finally:
+            response.close()
+
     ######
     # Bespoke methods for TExpress
     #   |
@@ -288,16 +388,18 @@ def bool_to_string(bool):
     return string
 
 
-def annotate_files(url, input_file_path, options_dict):
+def annotate_files(url, input_file_path, options_dict, session=None):
     """
     Wrapper function to execute a TExpress request for annotating individual files or a zip archive
     
-    :param url: url of TERMite instance
+    :param url: url of TERMite instance, a list of URLs or an EndpointPool
     :param input_file_path: path to file to be annotated
     :param options_dict: dictionary of options to be used during annotation
+    :param session: optional TermiteSession, the process-wide default session is used if not provided
     """
     t = TexpressRequestBuilder()
     t.set_url(url)
+    t.set_session(session)
     t.set_binary_content(input_file_path)
     t.set_options(options_dict)
     result = t.execute()
@@ -305,16 +407,18 @@ def annotate_files(url, input_file_path, options_dict):
     return result
 
 
-def annotate_text(url, text, options_dict):
+def annotate_text(url, text, options_dict, session=None):
     """
     Wrapper function to execute a TExpress request for annotating strings of text
     
-    :param url: url of TERMite instance
+    :param url: url of TERMite instance, a list of URLs or an EndpointPool
     :param text: text to be annotated
     :param options_dict: dictionary of options to be used during annotation
+    :param session: optional TermiteSession, the process-wide default session is used if not provided
     """
     t = TexpressRequestBuilder()
     t.set_url(url)
+    t.set_session(session)
     t.set_text(text)
     t.set_options(options_dict)
     result = t.execute()
@@ -389,6 +493,88 @@ def get_entity_hits_from_json(termite_json_response, score_cutoff=0):
 #   v
 ######
 
+def _iter_texpress_matches(texpress_response, remove_subsumed=True):
+    """
+    Walks a TExpress JSON or doc.JSONx response once, yielding every pattern match with the dicts whose fields override
+    it in its record, highest precedence first. The tuple of overriding dicts is shared by all the matches of a pattern
+    hit, so fields coming from it can be resolved once per pattern hit. Nothing is copied and the response is not
+    modified. Documents streamed by TexpressRequestBuilder.execute_stream are accepted in place of a response
+
+    :param texpress_response: TExpress JSON or doc.JSONx response, or an iterable of streamed documents
+    :param remove_subsumed: boolean
+    :return: generator of (tuple of dicts, match) tuples
+    """
+    if isinstance(texpress_response, dict):
+        documents = texpress_response.get('RESP_TEXPRESS', {}).items()
+    else:
+        documents = texpress_response
+
+    for doc in documents:
+        if isinstance(doc, tuple):
+            # (docID, patterns) of a JSON response, pattern fields and their meta override the match
+            doc_id, patterns = doc
+            doc_fields = None
+        else:
+            # doc.JSONx, document fields override the pattern fields which override the match
+            patterns = doc['texpressTags']
+            doc_fields = {k: v for k, v in doc.items() if k != 'texpressTags'}
+        for pattern_id, pattern_matches in patterns.items():
+            for pattern_hits in pattern_matches:
+                if doc_fields is None:
+                    pattern_fields = {}
+                    for x, value in pattern_hits.items():
+                        if x == "meta":
+                            pattern_fields.update(value)
+                        elif x != "matches":
+                            pattern_fields[x] = value
+                    overrides = (pattern_fields, {'docID': doc_id, 'patternID': pattern_id})
+                else:
+                    pattern_fields = {k: v for k, v in pattern_hits.items() if k != 'matches'}
+                    overrides = (doc_fields, pattern_fields, {'patternID': pattern_id})
+                for match in pattern_hits['matches']:
+                    if remove_subsumed is True and _lookup(overrides, match, 'subsumed') is True:
+                        continue
+                    yield overrides, match
+
+
+def _lookup(overrides, match, key):
+    """
+    Value of key in the record of a pattern match
+
+    :raises KeyError: if neither the match nor its overrides hold the key
+    """
+    for layer in overrides:
+        if key in layer:
+            return layer[key]
+    return match[key]
+
+
+def _record(overrides, match):
+    """
+    Merge a pattern match and its overrides into its record
+    """
+    record = dict(match)
+    for layer in reversed(overrides):
+        record.update(layer)
+    record.pop('matches', None)
+    record.pop('texpressTags', None)
+    return record
+
+
+def iter_texpress_records(texpress_response, remove_subsumed=True):
+    """
+    Lazily parses TExpress JSON or doc.JSONx response into records in a single pass, with filtering to remove subsumed
+    hits. Each record is a new dict, the response is not modified
+
+    :param texpress_response: TExpress JSON or doc.JSONx response, or an iterable of documents streamed by
+    TexpressRequestBuilder.execute_stream
+    :param remove_subsumed: boolean
+    :return: generator of TExpress hit records
+    """
+    for overrides, match in _iter_texpress_matches(texpress_response, remove_subsumed=remove_subsumed):
+        yield _record(overrides, match)
+
+
 def json_resp_records(json_resp_texpress, remove_subsumed=True):
     """
     parses JSON RESP_TEXPRESS into records, includes filter to remove subsumed hits.
@@ -397,29 +583,7 @@ def json_resp_records(json_resp_texpress, remove_subsumed=True):
     :param json_resp_texpress: RESP_TEXPRESS of TExpress JSON response
     :return: TExpress hits in records format
     """
-
-    hits = []
-    for docID, patterns in json_resp_texpress.items():
-        for pattern_id, pattern_matches in patterns.items():
-            if len(pattern_matches) is not 0:
-                for pattern_hits in pattern_matches:
-                    for match in pattern_hits['matches']:
-                        match['docID'] = docID
-                        match['patternID'] = pattern_id
-                        for x in pattern_hits:
-                            if x == "matches":
-                                continue
-                            elif x == "meta":
-                                for k, v in pattern_hits[x].items():
-                                    match[k] = v
-                            else:
-                                match[x] = pattern_hits[x]
-                        if remove_subsumed is True and match['subsumed'] is True:
-                            continue
-                        else:
-                            hits.append(match)
-
-    return (hits)
+    return list(iter_texpress_records({'RESP_TEXPRESS': json_resp_texpress}, remove_subsumed=remove_subsumed))
 
 
 def docjsonx_records(docjsonx_response, remove_subsumed=True):
@@ -430,24 +594,7 @@ def docjsonx_records(docjsonx_response, remove_subsumed=True):
     :param remove_subsumed: boolean
     :return: TExpress hits in records format
     """
-
-    hits = []
-    for doc in docjsonx_response:
-        for patternID, pattern_matches in doc['texpressTags'].items():
-            if len(pattern_matches) is not 0:
-                for pattern_hits in pattern_matches:
-                    for match in pattern_hits['matches']:
-                        match['patternID'] = patternID
-                        match.update(pattern_hits)
-                        match.update(doc)
-                        del (match['matches'])
-                        del (match['texpressTags'])
-                        if remove_subsumed is True and match['subsumed'] is True:
-                            continue
-                        else:
-                            hits.append(match)
-
-    return (hits)
+    return list(iter_texpress_records(docjsonx_response, remove_subsumed=remove_subsumed))
 
 
 def texpress_records(texpress_response, remove_subsumed=True):
@@ -458,37 +605,71 @@ def texpress_records(texpress_response, remove_subsumed=True):
     :param remove_subsumed: boolean
     :return: records of TExpress hits
     """
-
-    if 'RESP_TEXPRESS' in texpress_response:
-        records = json_resp_records(texpress_response['RESP_TEXPRESS'], remove_subsumed=remove_subsumed)
-    else:
-        records = docjsonx_records(texpress_response, remove_subsumed=remove_subsumed)
-
-    return (records)
+    return list(iter_texpress_records(texpress_response, remove_subsumed=remove_subsumed))
 
 
 def get_texpress_dataframe(texpress_response, cols_to_add="", remove_subsumed=True):
     """
     Get a dataframe from TEXpress response
+    The response is walked once and only the selected columns are collected, patternID is categorical
 
     :param texpress_response: texpress JSON response
     :param cols_to_add: additional column names to be included
     :param remove_subsumed: remove subsumed pattern hits
     :return:
     """
-
-    texpressRecords = texpress_records(texpress_response, remove_subsumed=remove_subsumed)
-    df = pd.DataFrame(texpressRecords)
-
     cols = ["docID", "patternID", "originalFragment", "matchEntities", "originalSentence",
             "sentence", "subsumed"]
-
     if cols_to_add:
         cols_to_add = cols_to_add.replace(" ", "").split(",")
-        try:
-            cols = cols + cols_to_add
-            return (df[cols])
-        except KeyError as e:
+        cols = cols + [col for col in cols_to_add if col not in cols]
+
+    columns = {col: [] for col in cols}
+    seen = set()
+    n_matches = 0
+    # where each column is read from, per layout of the override fields: (values, layer index, column) for columns
+    # read from the overrides, (values, column) for columns read from the match
+    plans = {}
+    current = None
+    for overrides, match in _iter_texpress_matches(texpress_response, remove_subsumed=remove_subsumed):
+        if overrides is not current:
+            current = overrides
+            layout = tuple(tuple(layer) for layer in overrides)
+            plan = plans.get(layout)
+            if plan is None:
+                from_overrides, from_match = [], []
+                for col, values in columns.items():
+                    for i, layer in enumerate(overrides):
+                        if col in layer and col not in ('matches', 'texpressTags'):
+                            from_overrides.append((values, i, col))
+                            seen.add(col)
+                            break
+                    else:
+                        from_match.append((values, col))
+                plan = plans[layout] = (from_overrides, from_match)
+            from_overrides, from_match = plan
+            fixed = [(values, overrides[i][col]) for values, i, col in from_overrides]
+        n_matches += 1
+        for values, value in fixed:
+            values.append(value)
+        for values, col in from_match:
+            if col in match:
+                values.append(match[col])
+                seen.add(col)
+            else:
+                values.append(None)
+
+    if n_matches == 0:
+        return pd.DataFrame(columns=cols)
+
+    missing = [col for col in cols if col not in seen]
+    if missing:
+        e = KeyError("{} not in index".format(missing))
+        if cols_to_add:
             print("Invalid column selection.", e)
-    else:
-        return (df[cols])
+            return None
+        raise e
+
+    columns['patternID'] = pd.Categorical(columns['patternID'])
+
+    return pd.DataFrame(columns, columns=cols)
@@ -0,0 +1,201 @@
+"""
+
+  ____       _ ____  _ _         _____ _____ ____  __  __ _ _         _____           _ _    _ _
+ / ___|  ___(_) __ )(_) |_ ___  |_   _| ____|  _ \|  \/  (_) |_ ___  |_   _|__   ___ | | | _(_) |_
+ \___ \ / __| |  _ \| | __/ _ \   | | |  _| | |_) | |\/| | | __/ _ \   | |/ _ \ / _ \| | |/ / | __|
+  ___) | (__| | |_) | | ||  __/   | | | |___|  _ <| |  | | | ||  __/   | | (_) | (_) | |   <| | |_
+ |____/ \___|_|____/|_|\__\___|   |_| |_____|_| \_\_|  |_|_|\__\___|   |_|\___/ \___/|_|_|\_\_|\__|
+
+
+
+Upload- stream files to TERMite in chunks instead of loading them into memory.
+
+"""
+
+__author__ = 'SciBite DataScience'
+__version__ = '0.2'
+__copyright__ = '(c) 2019, SciBite Ltd'
+__license__ = 'Creative Commons Attribution-NonCommercial-ShareAlike 4.0 International License'
+
+import mimetypes
+import os
+import uuid
+
+DEFAULT_CHUNK_SIZE = 65536
+
+
+class UploadSource():
+    """
+    A file to be uploaded: a path on disk, an open binary file-like object or an iterable of bytes chunks.
+
+    Paths are only opened while the upload is running and are always closed afterwards, so a request builder can hold
+    on to an UploadSource without holding a file descriptor. File-like objects are read from their current position
+    and left open, their lifetime belongs to the caller. Iterables can only be read once, so requests uploading them
+    are never cached nor retried.
+    """
+
+    def __init__(self, source, file_name=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        :param source: file path, binary file-like object or iterable of bytes
+        :param file_name: name the file is sent under, defaults to the base name of the path or file object
+        :param chunk_size: number of bytes read from disk at a time
+        """
+        self.source = source
+        self.chunk_size = chunk_size
+        self._start = None
+        if isinstance(source, (str, os.PathLike)):
+            self.kind = 'path'
+            default_name = os.path.basename(source)
+        elif hasattr(source, 'read'):
+            self.kind = 'file'
+            default_name = os.path.basename(getattr(source, 'name', '') or 'binary')
+            try:
+                self._start = source.tell()
+            except (AttributeError, OSError, ValueError):
+                self._start = None
+        else:
+            self.kind = 'iterable'
+            default_name = 'binary'
+        self.file_name = file_name or default_name
+        self._consumed = False
+
+    @property
+    def rewindable(self):
+        """
+        Can the content be read again, e.g. to retry a failed upload? Always False for iterables, even before they
+        were read, as reading them e.g. to hash them for the cache would leave nothing to send
+        """
+        if self.kind == 'path':
+            return True
+        if self.kind == 'file':
+            return self._start is not None
+        return False
+
+    def size(self):
+        """
+        Number of bytes that will be sent
+
+        :return: integer, or None if it cannot be known in advance
+        """
+        if self.kind == 'path':
+            return os.path.getsize(self.source)
+        if self.kind == 'file' and self._start is not None:
+            try:
+                return os.fstat(self.source.fileno()).st_size - self._start
+            except (AttributeError, OSError, ValueError):
+                pass
+            try:
+                end = self.source.seek(0, os.SEEK_END)
+                self.source.seek(self._start)
+                return end - self._start
+            except (AttributeError, OSError, ValueError):
+                return None
+        return None
+
+    def iter_chunks(self):
+        """
+        Generate the content in chunks of at most chunk_size bytes
+
+        :return: generator of bytes
+        """
+        if self.kind == 'path':
+            with open(self.source, 'rb') as file_obj:
+                for chunk in iter(lambda: file_obj.read(self.chunk_size), b''):
+                    yield chunk
+        elif self.kind == 'file':
+            for chunk in iter(lambda: self.source.read(self.chunk_size), b''):
+                yield chunk
+        else:
+            if self._consumed:
+                raise ValueError("The content of {} has already been sent and cannot be read again".format(
+                    self.file_name))
+            self._consumed = True
+            for chunk in self.source:
+                if chunk:
+                    yield chunk
+
+    def rewind(self):
+        """
+        Go back to the start of the content so it can be read again
+        """
+        if not self.rewindable:
+            raise OSError("{} cannot be rewound".format(self.file_name))
+        if self.kind == 'file':
+            self.source.seek(self._start)
+
+
+class MultipartStream():
+    """
+    multipart/form-data request body generated on the fly from form fields and UploadSources, so that memory use is
+    bounded by the chunk size whatever the size of the files. Pass it as the data of a request together with its
+    content_type header. When the size of every file is known the body has a Content-Length, otherwise it is sent
+    with chunked transfer encoding.
+    """
+
+    def __init__(self, fields, files):
+        """
+        :param fields: dictionary of form fields, e.g. the payload of a request builder
+        :param files: dictionary of field name to UploadSource
+        """
+        self.boundary = uuid.uuid4().hex
+        self.content_type = 'multipart/form-data; boundary={}'.format(self.boundary)
+        self._parts = []
+        for name, value in fields.items():
+            if value is None:
+                continue
+            header = self._part_header('Content-Disposition: form-data; name="{}"'.format(name))
+            self._parts.append((header, str(value).encode('utf-8')))
+        for name, source in files.items():
+            content_type = mimetypes.guess_type(source.file_name)[0] or 'application/octet-stream'
+            header = self._part_header('Content-Disposition: form-data; name="{}"; filename="{}"\r\n'
+                                       'Content-Type: {}'.format(name, source.file_name, content_type))
+            self._parts.append((header, source))
+        self._footer = '--{}--\r\n'.format(self.boundary).encode('utf-8')
+        self.len = self._length()
+
+    def _part_header(self, disposition):
+        return '--{}\r\n{}\r\n\r\n'.format(self.boundary, disposition).encode('utf-8')
+
+    def _length(self):
+        """
+        Total size of the body, or 0 if a file size is unknown (requests then uses chunked transfer encoding)
+        """
+        total = len(self._footer)
+        for header, body in self._parts:
+            size = len(body) if isinstance(body, bytes) else body.size()
+            if size is None:
+                return 0
+            total += len(header) + size + 2
+        return total
+
+    def __iter__(self):
+        for header, body in self._parts:
+            yield header
+            if isinstance(body, bytes):
+                yield body
+            else:
+                for chunk in body.iter_chunks():
+                    yield chunk
+            yield b'\r\n'
+        yield self._footer
+
+    def tell(self):
+        """
+        Position in the body, always 0 as the body is generated on every iteration. Raises OSError if a file cannot
+        be read again, which tells retrying code that the request must not be resent.
+        """
+        for header, body in self._parts:
+            if not isinstance(body, bytes) and not body.rewindable:
+                raise OSError("Upload of {} cannot be repeated".format(body.file_name))
+        return 0
+
+    def seek(self, position, whence=os.SEEK_SET):
+        """
+        Rewind every file so the body can be sent again, only seeking back to the start is supported
+        """
+        if position != 0 or whence != os.SEEK_SET:
+            raise OSError("MultipartStream can only be rewound to its start")
+        for header, body in self._parts:
+            if not isinstance(body, bytes):
+                body.rewind()
+        return 0
@@ -16,7 +16,9 @@ __version__ = '0.2'
 __copyright__ = '(c) 2019, SciBite Ltd'
 __license__ = 'Creative Commons Attribution-NonCommercial-ShareAlike 4.0 International License'
 
-import requests
+from .decoding import decode_response
+from .session import get_default_session
+from .singleflight import get_default_group
 
 
 class UtilitiesRequestBuilder():
@@ -28,6 +30,8 @@ class UtilitiesRequestBuilder():
         self.url = 'http://localhost:9090/termite'
         self.basic_auth = ()
         self.verify_request = True
+        self.session = None
+        self.singleflight = get_default_group()
 
     def set_url(self, url):
         """
@@ -37,6 +41,23 @@ class UtilitiesRequestBuilder():
         """
         self.url = url
 
+    def set_session(self, session):
+        """
+        Send requests through the given TermiteSession instead of the process-wide default one
+
+        :param session: TermiteSession holding the pooled connections to be used
+        """
+        self.session = session
+
+    def set_singleflight(self, group):
+        """
+        Identical entity lookups made concurrently by builders sharing the same SingleFlight group are sent only once,
+        and all of them receive its response. By default all builders share one group.
+
+        :param group: SingleFlight group to be used, None to always send the request
+        """
+        self.singleflight = group
+
     def set_basic_auth(self, username='', password='', verification=True):
         """
         Pass basic authentication credentials.
@@ -59,11 +80,12 @@ class UtilitiesRequestBuilder():
 
         if len(input) < 3:
             return 'Please provide a string longer than 3 chars..'
-        response = requests.post(("%s/toolkit/autocomplete.api" % self.url),
-                                 data={"term": input, "e": vocab, "limit": taxon})
+        session = self.session or get_default_session()
+        response = session.post(("%s/toolkit/autocomplete.api" % self.url),
+                                data={"term": input, "e": vocab, "limit": taxon})
 
         if response.ok:
-            ac_json = response.json()
+            ac_json = decode_response(response)
             return ac_json
 
         else:
@@ -79,10 +101,14 @@ class UtilitiesRequestBuilder():
         :return: request response
         """
         url = ("%s/toolkit/tool.api?t=describe&id=%s:%s" % (self.url, entity_type, entity_id))
-        response = requests.get(url)
+        session = self.session or get_default_session()
+        if self.singleflight is not None:
+            response = self.singleflight.do(('GET', url), session.get, url)
+        else:
+            response = session.get(url)
 
         if response.ok:
-            entity_json = response.json()
+            entity_json = decode_response(response)
             return entity_json
 
         else:
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# run against the checkout, not an installed copy
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scibite'))
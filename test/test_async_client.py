@@ -0,0 +1,137 @@
+import asyncio
+import json
+
+import pytest
+
+aiohttp = pytest.importorskip('aiohttp')
+
+from aiohttp import web
+
+from termite_toolkit.async_client import AsyncTermiteClient
+from termite_toolkit.retry import RetryPolicy
+
+
+class FakeTermite():
+    """
+    Local TERMite stand-in recording the requests it received and how many were in flight at once
+    """
+
+    def __init__(self, statuses=()):
+        self.statuses = list(statuses)
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def handle(self, request):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            form = await request.post()
+            fields = {k: v.file.read().decode('utf-8') if hasattr(v, 'file') else v for k, v in form.items()}
+            self.requests.append({'path': request.path, 'auth': request.headers.get('Authorization'),
+                                  'fields': fields})
+            await asyncio.sleep(0.01)
+            status = self.statuses.pop(0) if self.statuses else 200
+            if status != 200:
+                return web.Response(status=status, text='<html>unavailable</html>')
+            if fields.get('output') == 'json':
+                return web.json_response({'RESP_PAYLOAD': {'text': fields.get('text') or fields.get('binary')}})
+            return web.Response(text='annotated ' + fields.get('text', ''))
+        finally:
+            self.in_flight -= 1
+
+
+def run_with_server(test, statuses=()):
+    """
+    Run the coroutine function test(termite, base_url) against a local server
+    """
+    termite = FakeTermite(statuses)
+
+    async def main():
+        app = web.Application()
+        app.router.add_post('/termite', termite.handle)
+        app.router.add_post('/other', termite.handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        try:
+            await test(termite, 'http://127.0.0.1:{}'.format(port))
+        finally:
+            await runner.cleanup()
+
+    asyncio.run(main())
+    return termite
+
+
+def client_for(base_url, **kwargs):
+    kwargs.setdefault('retry_policy', RetryPolicy(total=0))
+    return AsyncTermiteClient(url=base_url + '/termite', **kwargs)
+
+
+def test_annotate_text_and_settings_changed_after_first_request():
+    async def test(termite, base_url):
+        async with client_for(base_url) as client:
+            assert await client.annotate_text('BRCA1', {'output': 'json'}) == {'RESP_PAYLOAD': {'text': 'BRCA1'}}
+            client.set_basic_auth('alice', 'secret')
+            await client.annotate_text('TP53', {'output': 'json'})
+            client.set_url(base_url + '/other')
+            assert await client.annotate_text('TP53', {'output': 'tsv'}) == 'annotated TP53'
+
+    termite = run_with_server(test)
+    assert [request['auth'] for request in termite.requests] == [
+        None, aiohttp.BasicAuth('alice', 'secret').encode(), aiohttp.BasicAuth('alice', 'secret').encode()]
+    assert [request['path'] for request in termite.requests] == ['/termite', '/termite', '/other']
+
+
+def test_annotate_files_uploads_the_file(tmp_path):
+    path = tmp_path / 'input.txt'
+    path.write_text('BRCA1 is a gene')
+
+    async def test(termite, base_url):
+        async with client_for(base_url) as client:
+            result = await client.annotate_files(str(path), {'output': 'json', 'format': 'txt'})
+            assert result == {'RESP_PAYLOAD': {'text': 'BRCA1 is a gene'}}
+
+    termite = run_with_server(test)
+    assert 'format=txt' in termite.requests[0]['fields']['opts'].split('&')
+
+
+def test_annotate_many_bounds_requests_in_flight():
+    texts = ['text {}'.format(i) for i in range(20)]
+
+    async def test(termite, base_url):
+        async with client_for(base_url, concurrency=4) as client:
+            results = {}
+            async for index, result in client.annotate_many(iter(texts), {'output': 'json'}, concurrency=2):
+                results[index] = result['RESP_PAYLOAD']['text']
+            assert results == dict(enumerate(texts))
+            assert termite.max_in_flight <= 2
+
+            termite.max_in_flight = 0
+            # a concurrency above the client's is capped by it
+            results = [result async for result in client.annotate_many(texts, {'output': 'json'}, concurrency=50)]
+            assert len(results) == 20
+            assert 1 < termite.max_in_flight <= 4
+
+    run_with_server(test)
+
+
+def test_retries_then_raises_the_http_error():
+    async def test(termite, base_url):
+        retry_policy = RetryPolicy(total=1, backoff_factor=0)
+        async with client_for(base_url, retry_policy=retry_policy) as client:
+            # the first 503 is retried
+            assert await client.annotate_text('BRCA1', {'output': 'json'}) == {'RESP_PAYLOAD': {'text': 'BRCA1'}}
+            # retries exhausted: the error page is never returned as a result
+            with pytest.raises(aiohttp.ClientResponseError) as error:
+                await client.annotate_text('TP53', {'output': 'json'})
+            assert error.value.status == 503
+            # errors that are not retried are raised at once
+            with pytest.raises(aiohttp.ClientResponseError) as error:
+                await client.annotate_text('TP53', {'output': 'json'})
+            assert error.value.status == 400
+
+    termite = run_with_server(test, statuses=[503, 200, 503, 503, 400])
+    assert len(termite.requests) == 5
@@ -0,0 +1,149 @@
+import gc
+import time
+
+import pytest
+import requests
+
+from termite_toolkit import balancer, termite
+from termite_toolkit import session as session_module
+from termite_toolkit.balancer import EndpointPool, get_endpoint_pool, send
+from termite_toolkit.batching import TermiteBatcher
+from termite_toolkit.termite import TermiteRequestBuilder
+
+DEAD = 'http://dead:9090/termite'
+LIVE = 'http://live:9090/termite'
+
+
+class FakeResponse():
+    status_code = 200
+    ok = True
+    content = b'{"RESP_PAYLOAD": {}}'
+    encoding = 'utf-8'
+
+    def close(self):
+        pass
+
+
+class FakeSession():
+    """
+    Refuses connections to DEAD and answers every other URL, health probes included
+    """
+
+    def __init__(self):
+        self.urls = []
+        self.probes = []
+
+    def request(self, method, url, **kwargs):
+        self.urls.append(url)
+        if url == DEAD:
+            raise requests.exceptions.ConnectionError('connection refused')
+        return FakeResponse()
+
+    def probe(self, url, **kwargs):
+        self.probes.append((url, kwargs))
+        return FakeResponse()
+
+
+def test_failover_to_next_server():
+    pool = EndpointPool([DEAD, LIVE], eject_after=1, probe_interval=3600)
+    session = FakeSession()
+    for _ in range(3):
+        assert send(session, 'POST', pool).status_code == 200
+    # the dead server is tried at most once, then taken out of rotation
+    assert session.urls.count(DEAD) <= 1
+    assert session.urls.count(LIVE) == 3
+    assert [e.healthy for e in pool.endpoints] == [False, True]
+    pool.close()
+
+
+def test_every_server_failing_raises():
+    pool = EndpointPool([DEAD, DEAD + '2'], probe_interval=3600)
+
+    class Refusing(FakeSession):
+        def request(self, method, url, **kwargs):
+            self.urls.append(url)
+            raise requests.exceptions.ConnectionError('connection refused')
+
+    session = Refusing()
+    with pytest.raises(requests.exceptions.ConnectionError):
+        send(session, 'POST', pool)
+    assert sorted(session.urls) == [DEAD, DEAD + '2']
+    pool.close()
+
+
+def test_lists_of_urls_share_one_pool():
+    pool = get_endpoint_pool([DEAD, LIVE])
+    assert get_endpoint_pool((DEAD, LIVE)) is pool
+    assert get_endpoint_pool([LIVE, DEAD]) is not pool
+
+    t = TermiteRequestBuilder()
+    t.set_url([DEAD, LIVE])
+    assert t.url is pool
+
+    batcher = TermiteBatcher(url=[DEAD, LIVE])
+    assert batcher.url is pool
+    batcher.close()
+
+
+def test_module_level_annotate_keeps_pool_statistics():
+    session = FakeSession()
+    urls = [DEAD, LIVE + '/shared']
+    options = {'output': 'json'}
+    for _ in range(5):
+        termite.annotate_text(urls, 'BRCA1', options, session=session)
+    pool = get_endpoint_pool(urls)
+    assert session.urls.count(DEAD) <= pool.eject_after
+    assert pool.endpoints[1].latency is not None
+    pool.close()
+
+
+def test_prober_stops_when_pool_is_discarded():
+    pool = EndpointPool([DEAD, LIVE], eject_after=1, probe_interval=3600)
+    pool.release(pool.select(), failed=True)
+    prober = pool._prober
+    assert prober.is_alive()
+    del pool
+    gc.collect()
+    prober.join(timeout=5)
+    assert not prober.is_alive()
+
+
+def test_probes_use_the_session_and_credentials_of_the_requests():
+    pool = EndpointPool([DEAD, LIVE], eject_after=1, probe_interval=3600, probe_timeout=2)
+    session = FakeSession()
+    send(session, 'POST', pool, auth=('alice', 'secret'), verify='/etc/ca.pem')
+    assert pool._probe()
+    assert session.probes == [(DEAD, {'timeout': 2, 'auth': ('alice', 'secret'), 'verify': '/etc/ca.pem'})]
+    assert [e.healthy for e in pool.endpoints] == [True, True]
+    assert not pool._probe()
+    pool.close()
+
+
+def test_probes_default_to_the_shared_session(monkeypatch):
+    session = FakeSession()
+    monkeypatch.setattr(session_module, '_default_session', session)
+    pool = EndpointPool([DEAD, LIVE], eject_after=1, probe_interval=3600)
+    pool.release(pool.select(exclude=[LIVE]), failed=True)
+    pool._probe()
+    assert session.probes == [(DEAD, {'timeout': 5})]
+    pool.close()
+
+
+def test_unused_pools_are_released(monkeypatch):
+    monkeypatch.setattr(balancer, 'MAX_RECENT_POOLS', 2)
+    pool = get_endpoint_pool([DEAD, LIVE + '/old'])
+    for _ in range(pool.eject_after):
+        pool.release(pool.select(exclude=[LIVE + '/old']), failed=True)
+    prober = pool._prober
+    for i in range(2):
+        get_endpoint_pool([LIVE + '/{}'.format(i)])
+    # still held by a builder, so still shared
+    assert get_endpoint_pool([DEAD, LIVE + '/old']) is pool
+    for i in range(2):
+        get_endpoint_pool([LIVE + '/{}'.format(i)])
+    del pool
+    gc.collect()
+    assert (DEAD, LIVE + '/old') not in balancer._pools
+    prober.join(timeout=5)
+    assert not prober.is_alive()
+    assert len(balancer._recent_pools) == 2
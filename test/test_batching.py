@@ -0,0 +1,121 @@
+import io
+import json
+import threading
+import time
+import zipfile
+
+import pytest
+import requests
+
+from termite_toolkit.batching import TermiteBatcher, annotate_batch, batch_doc_index, split_batch_response
+from termite_toolkit.retry import RetryPolicy
+from termite_toolkit.session import TermiteSession
+
+
+class FakeResponse():
+    encoding = 'utf-8'
+    headers = {}
+
+    def __init__(self, body, status_code=200):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.content = json.dumps(body).encode('utf-8')
+        self.text = self.content.decode('utf-8')
+
+    def close(self):
+        pass
+
+    def raise_for_status(self):
+        raise requests.exceptions.HTTPError('%d Server Error' % self.status_code, response=self)
+
+
+class ZipTermite():
+    """
+    Unpacks the uploaded zip archive and answers with one hit per document, named after the document's text
+    """
+
+    def __init__(self, output='json', status_code=200):
+        self.output = output
+        self.status_code = status_code
+        self.batches = []
+        self._lock = threading.Lock()
+
+    def request(self, method, url, **kwargs):
+        body = b''.join(kwargs['data'])
+        archive = body[body.index(b'PK\x03\x04'):body.rindex(b'\r\n--')]
+        with zipfile.ZipFile(io.BytesIO(archive)) as z:
+            docs = {name: z.read(name).decode('utf-8') for name in z.namelist()}
+        with self._lock:
+            self.batches.append(sorted(docs.values()))
+        if self.status_code != 200:
+            return FakeResponse({}, self.status_code)
+        if self.output == 'json':
+            return FakeResponse({'RESP_META': {'batch': True}, 'RESP_MULTIDOC_PAYLOAD': {
+                'batch/' + name: {'GENE$' + text: [{'hitID': text}]} for name, text in docs.items()}})
+        return FakeResponse([{'docID': name, 'body': text} for name, text in docs.items()])
+
+
+def session_for(transport):
+    session = TermiteSession(retry_policy=RetryPolicy(total=0), breaker_threshold=None)
+    session._get_session = lambda: transport
+    return session
+
+
+def test_batches_are_split_by_size_and_back_by_docid():
+    transport = ZipTermite()
+    texts = ['T{}'.format(i) for i in range(7)]
+    results = annotate_batch('http://termite/api', texts, {'output': 'json'}, max_docs=3,
+                             session=session_for(transport))
+    assert [list(result['RESP_PAYLOAD']) for result in results] == [['GENE$' + text] for text in texts]
+    assert all(result['RESP_META'] == {'batch': True} for result in results)
+    assert sorted(len(batch) for batch in transport.batches) == [1, 3, 3]
+
+    # max_bytes closes a batch before a text would push it over the limit
+    transport = ZipTermite(output='doc.jsonx')
+    results = annotate_batch('http://termite/api', ['aaaa', 'bbbb', 'cc', 'd'], {'output': 'doc.jsonx'},
+                             max_bytes=6, session=session_for(transport))
+    assert [[doc['body'] for doc in result] for result in results] == [['aaaa'], ['bbbb'], ['cc'], ['d']]
+    assert sorted(transport.batches) == [['aaaa'], ['bbbb', 'cc'], ['d']]
+
+
+def test_partial_batches_are_flushed():
+    transport = ZipTermite()
+    with TermiteBatcher('http://termite/api', max_wait=60, session=session_for(transport)) as batcher:
+        first = batcher.submit('A')
+        batcher.flush()
+        assert list(first.result(timeout=5)['RESP_PAYLOAD']) == ['GENE$A']
+        second = batcher.submit('B')
+        third = batcher.submit('C')
+    # closing sends what is left
+    assert [second.done(), third.done()] == [True, True]
+    assert transport.batches == [['A'], ['B', 'C']]
+
+    # and a batch that does not fill up is sent once max_wait has passed
+    transport = ZipTermite()
+    with TermiteBatcher('http://termite/api', max_wait=0.05, session=session_for(transport)) as batcher:
+        start = time.monotonic()
+        assert list(batcher.submit('A').result(timeout=5)['RESP_PAYLOAD']) == ['GENE$A']
+        assert time.monotonic() - start < 5
+    with pytest.raises(RuntimeError):
+        batcher.submit('B')
+
+
+def test_failed_batches_fail_every_future():
+    transport = ZipTermite(status_code=500)
+    with TermiteBatcher('http://termite/api', max_docs=2, session=session_for(transport)) as batcher:
+        futures = [batcher.submit(text) for text in ['A', 'B']]
+        for future in futures:
+            with pytest.raises(requests.exceptions.HTTPError):
+                future.result(timeout=5)
+
+
+def test_split_batch_response():
+    assert [batch_doc_index(doc_id) for doc_id in ['12.txt', 'batch/3', 'x/other.txt', '']] == [12, 3, None, None]
+    response = {'RESP_MULTIDOC_PAYLOAD': {'0.txt': {'GENE$G1': []}, 'other.txt': {}, '5.txt': {}}}
+    assert split_batch_response(response, 2) == [{'RESP_PAYLOAD': {'GENE$G1': []}}, {'RESP_PAYLOAD': {}}]
+    # a batch of one may be answered with a single document payload
+    assert split_batch_response({'RESP_PAYLOAD': {'GENE$G1': []}}, 1) == [{'RESP_PAYLOAD': {'GENE$G1': []}}]
+    assert split_batch_response([{'docID': '1.txt'}, {'docID': '1.txt'}], 3) == \
+        [[], [{'docID': '1.txt'}, {'docID': '1.txt'}], []]
+    with pytest.raises(ValueError):
+        TermiteBatcher(options_dict={'output': 'tsv'})
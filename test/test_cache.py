@@ -0,0 +1,96 @@
+import json
+
+from termite_toolkit.cache import DiskCache, MemoryCache, ResponseCache, request_key
+from termite_toolkit.termite import TermiteRequestBuilder
+from termite_toolkit.texpress import TexpressRequestBuilder
+
+
+class FakeResponse():
+    def __init__(self, body):
+        self.content = json.dumps(body).encode('utf-8')
+        self.text = self.content.decode('utf-8')
+        self.encoding = 'utf-8'
+        self.apparent_encoding = 'utf-8'
+        self.status_code = 200
+        self.ok = True
+
+
+class FakeSession():
+    """
+    Answers every request with a response naming the credentials it was sent with
+    """
+
+    def __init__(self):
+        self.calls = 0
+
+    def request(self, method, url, **kwargs):
+        self.calls += 1
+        return FakeResponse({'auth': list(kwargs.get('auth', ())), 'call': self.calls})
+
+
+def builder(cls, cache, session, auth=None):
+    t = cls()
+    t.set_url('http://termite/api')
+    t.set_session(session)
+    t.set_cache(cache)
+    t.set_singleflight(None)
+    t.set_text('BRCA1 is a gene')
+    if auth:
+        t.set_basic_auth(*auth)
+    return t
+
+
+def test_memory_cache_round_trip_and_eviction():
+    cache = MemoryCache(max_entries=2)
+    cache.set('a', (b'1', 'utf-8'))
+    cache.set('b', (b'2', 'utf-8'))
+    assert cache.get('a') == (b'1', 'utf-8')
+    cache.set('c', (b'3', 'utf-8'))
+    assert cache.get('b') is None
+    assert len(cache) == 2
+
+
+def test_disk_cache_round_trip(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    cache = DiskCache(path)
+    cache.set('a', (b'{"x": 1}' * 100, 'utf-8'))
+    cache.close()
+    assert DiskCache(path).get('a') == (b'{"x": 1}' * 100, 'utf-8')
+
+
+def test_response_cache_promotes_disk_hits(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    ResponseCache(path=path).set('a', b'body', 'utf-8')
+    cache = ResponseCache(path=path)
+    assert cache.get('a') == (b'body', 'utf-8')
+    assert cache.get('a') == (b'body', 'utf-8')
+    assert cache.get('b') is None
+    assert (cache.disk_hits, cache.memory_hits, cache.misses) == (1, 1, 1)
+
+
+def test_request_key_ignores_option_order():
+    payload = {'output': 'json', 'text': 'BRCA1', 'opts': 'subsume=true&fuzzy=false'}
+    reordered = {'opts': 'fuzzy=false&subsume=true', 'text': 'BRCA1', 'output': 'json'}
+    assert request_key('http://termite/api', payload) == request_key('http://termite/api', reordered)
+
+
+def test_request_key_isolates_url_payload_and_credentials():
+    payload = {'output': 'json', 'text': 'BRCA1'}
+    key = request_key('http://termite/api', payload, auth=('alice', 'secret'))
+    assert key != request_key('http://other/api', payload, auth=('alice', 'secret'))
+    assert key != request_key('http://termite/api', dict(payload, text='TP53'), auth=('alice', 'secret'))
+    assert key != request_key('http://termite/api', payload, auth=('bob', 'secret'))
+    assert key != request_key('http://termite/api', payload, auth=('alice', 'wrong'))
+    assert key != request_key('http://termite/api', payload)
+    assert request_key('http://termite/api', payload, auth=()) == request_key('http://termite/api', payload)
+
+
+def test_execute_serves_cached_responses_per_credentials():
+    for cls in (TermiteRequestBuilder, TexpressRequestBuilder):
+        cache = ResponseCache()
+        session = FakeSession()
+        assert builder(cls, cache, session, ('alice', 'secret')).execute()['auth'] == ['alice', 'secret']
+        assert builder(cls, cache, session, ('alice', 'secret')).execute()['call'] == 1
+        assert builder(cls, cache, session).execute()['auth'] == []
+        assert builder(cls, cache, session, ('bob', 'other')).execute()['auth'] == ['bob', 'other']
+        assert session.calls == 3
@@ -0,0 +1,79 @@
+import pandas as pd
+
+from termite_toolkit import termite
+from termite_toolkit.compact import FALLBACK, CompactHits
+
+
+def entity_hit(entity_type, hit_id, hit_count=1, **fields):
+    hit = {'entityType': entity_type, 'hitID': hit_id, 'name': hit_id.lower(), 'score': 3, 'hitCount': hit_count,
+           'nonambigsyns': 1, 'totnosyns': 1, 'realSynList': [hit_id.lower()], 'frag_vector_array': ['1#0#5#x'],
+           'exact_array': [{'sentence': 1, 'start': 0, 'end': 5, 'subsumed': False}], 'subsume': [False]}
+    hit.update(fields)
+    return hit
+
+
+def json_response():
+    return {'RESP_MULTIDOC_PAYLOAD': {
+        'D1': {'GENE$G1': [entity_hit('GENE', 'G1', 5, docID='D1')], 'DRUG$X1': [entity_hit('DRUG', 'X1', 2)]},
+        'D2': {'GENE$G2': [entity_hit('GENE', 'G2', 3, nonambigsyns=0)],
+               'INDICATION$I1': [entity_hit('INDICATION', 'I1', 4, exact_array=[{'fls': [1, 2, 3]}],
+                                            subsume=[True])]}}}
+
+
+def docjsonx_response():
+    return [{'docID': 'D1', 'body': 'BRCA1', 'termiteTags': [entity_hit('GENE', 'G1', extra={'a': 1})]},
+            {'docID': 'D2', 'body': 'TP53', 'termiteTags': [entity_hit('GENE', 'G2'), entity_hit('DRUG', 'X1')]}]
+
+
+def test_compact_hits_round_trip():
+    for response in (json_response(), docjsonx_response()):
+        compact = CompactHits(reject_ambig=False, remove_subsumed=False).add_response(response)
+        assert compact.to_records() == termite.payload_records(response, reject_ambig=False, remove_subsumed=False)
+        pd.testing.assert_frame_equal(compact.to_dataframe(cols_to_add='exact_array'),
+                                      termite.get_termite_dataframe(response, cols_to_add='exact_array',
+                                                                    reject_ambig=False, remove_subsumed=False))
+    compact = CompactHits().add_response(json_response())
+    assert [hit['hitID'] for hit in compact.to_records()] == ['G1', 'X1']
+
+
+def test_fractional_scores_are_stored_compactly():
+    scores = [2.5, 0.87, 3.14159, 4, 1.0]
+    response = {'RESP_MULTIDOC_PAYLOAD': {'D1': {
+        'GENE$G{}'.format(i): [entity_hit('GENE', 'G{}'.format(i), score=score)] for i, score in enumerate(scores)}}}
+    compact = CompactHits().add_response(response)
+    assert not (compact.hits['flags'] & FALLBACK).any()
+    decoded = [hit['score'] for hit in compact.to_records()]
+    assert decoded == scores
+    assert [type(score) for score in decoded] == [float, float, float, int, float]
+    assert compact.to_records() == termite.payload_records(response)
+
+    # a score float32 cannot give back is kept whole rather than rounded
+    response = {'RESP_PAYLOAD': {'GENE$G1': [entity_hit('GENE', 'G1', score=0.1234567891234)]}}
+    compact = CompactHits().add_response(response)
+    assert compact.hits['flags'][0] & FALLBACK
+    assert compact.to_records()[0]['score'] == 0.1234567891234
+
+
+def test_documents_keep_their_boundaries():
+    single = {'RESP_PAYLOAD': {'GENE$G1': [entity_hit('GENE', 'G1')], 'DRUG$X1': [entity_hit('DRUG', 'X1')]}}
+    compact = CompactHits()
+    for _ in range(3):
+        compact.add_response(single)
+    assert compact.doc_ids == ['', '', '']
+    assert compact.hits['doc'].tolist() == [0, 0, 1, 1, 2, 2]
+    assert len(list(compact._iter_documents())) == 3
+
+    # streamed documents sharing a docID, and doc.JSONx documents without one, are not merged either
+    stream = [('D1', {'GENE$G1': [entity_hit('GENE', 'G1')]}), ('D1', {'GENE$G1': [entity_hit('GENE', 'G1')]})]
+    assert CompactHits().add_response(stream).hits['doc'].tolist() == [0, 1]
+    docs = [{'body': 'a', 'termiteTags': [entity_hit('GENE', 'G1')]}, {'body': 'b', 'termiteTags': [entity_hit('GENE', 'G2')]}]
+    compact = CompactHits().add_response(docs)
+    assert compact.hits['doc'].tolist() == [0, 1]
+    assert [record['body'] for record in compact.to_records()] == ['a', 'b']
+
+
+def test_compact_hits_are_smaller_than_the_records():
+    compact = CompactHits().add_response(json_response())
+    assert compact.hits.dtype['score'].name == 'float32'
+    assert compact.nbytes < 1000
+    assert compact.locations['sentence'].tolist() == [1, 1]
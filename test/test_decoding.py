@@ -0,0 +1,89 @@
+import importlib
+import json
+import math
+import sys
+
+import pytest
+
+from termite_toolkit import decoding
+from termite_toolkit.retry import RetryPolicy
+from termite_toolkit.session import TermiteSession
+from termite_toolkit.termite import TermiteRequestBuilder
+
+
+class FakeResponse():
+    ok = True
+    status_code = 200
+    encoding = 'utf-8'
+    headers = {}
+
+    def __init__(self, content):
+        self.content = content
+
+    def close(self):
+        pass
+
+
+class FakeTransport():
+    def __init__(self, content):
+        self.content = content
+
+    def request(self, method, url, **kwargs):
+        return FakeResponse(self.content)
+
+
+def execute(content):
+    session = TermiteSession(retry_policy=RetryPolicy(total=0), breaker_threshold=None)
+    session._get_session = lambda: FakeTransport(content)
+    t = TermiteRequestBuilder()
+    t.set_url('http://termite/api')
+    t.set_session(session)
+    t.set_text('BRCA1')
+    t.set_output_format('json')
+    return t.execute()
+
+
+@pytest.fixture
+def restore_decoder():
+    yield
+    decoding.set_json_decoder(None)
+
+
+def test_orjson_is_used_when_installed():
+    orjson = pytest.importorskip('orjson')
+    assert decoding.get_json_decoder() is decoding._orjson_loads
+    body = {'RESP_PAYLOAD': {'GENE$G1': [{'hitID': 'G1', 'name': 'BRCA1 é', 'score': 2.5}]}}
+    assert decoding.loads(orjson.dumps(body)) == body
+    # input orjson rejects still decodes like the standard library would
+    assert math.isnan(decoding.loads(b'{"score": NaN}')['score'])
+    assert decoding.loads('{"a": 1}'.encode('utf-16')) == {'a': 1}
+    with pytest.raises(ValueError):
+        decoding.loads(b'{"a": ')
+
+
+def test_standard_library_without_orjson(monkeypatch):
+    monkeypatch.setitem(sys.modules, 'orjson', None)
+    try:
+        importlib.reload(decoding)
+        assert decoding.orjson is None
+        assert decoding.get_json_decoder() is json.loads
+        assert execute(b'{"RESP_PAYLOAD": {}}') == {'RESP_PAYLOAD': {}}
+    finally:
+        monkeypatch.undo()
+        importlib.reload(decoding)
+
+
+def test_decoder_can_be_replaced(restore_decoder):
+    calls = []
+
+    def decoder(data):
+        calls.append(data)
+        return json.loads(data)
+
+    decoding.set_json_decoder(decoder)
+    assert decoding.get_json_decoder() is decoder
+    assert execute(b'{"RESP_PAYLOAD": {}}') == {'RESP_PAYLOAD': {}}
+    # responses are decoded straight from their bytes
+    assert calls == [b'{"RESP_PAYLOAD": {}}']
+    decoding.set_json_decoder(None)
+    assert decoding.get_json_decoder() is decoding._default_decoder
@@ -0,0 +1,104 @@
+import os
+
+import pytest
+
+pa = pytest.importorskip('pyarrow')
+pq = pytest.importorskip('pyarrow.parquet')
+
+from termite_toolkit import export, texpress
+from termite_toolkit.termite import get_termite_dataframe
+
+
+def entity_hit(doc_id, entity_type, hit_id, score=3):
+    name = hit_id.lower()
+    return {'docID': doc_id, 'entityType': entity_type, 'hitID': hit_id, 'name': name, 'score': score, 'realSynList': [name],
+            'totnosyns': 1, 'nonambigsyns': 1, 'frag_vector_array': ['1#0#5#' + name], 'hitCount': 1,
+            'exact_array': [{'sentence': 1, 'start': 0, 'end': 5, 'subsumed': False}]}
+
+
+def json_response():
+    return {'RESP_MULTIDOC_PAYLOAD': {
+        'D1': {'GENE$G1': [entity_hit('D1', 'GENE', 'G1')], 'DRUG$X1': [entity_hit('D1', 'DRUG', 'X1', 5)]},
+        'D2': {'GENE$G2': [entity_hit('D2', 'GENE', 'G2')],
+               'GENE$G3': [dict(entity_hit('D2', 'GENE', 'G3'), nonambigsyns=0)]}}}
+
+
+def texpress_response():
+    match = {'originalFragment': 'G1 and X1', 'matchEntities': ['GENE#G1', 'DRUG#X1'],
+             'originalSentence': 'G1 and X1 interact', 'sentence': 1, 'subsumed': False, 'start': 0}
+    return {'RESP_TEXPRESS': {
+        'D1': {'USR_1': [{'matches': [match, dict(match, subsumed=True)], 'hitCount': 2,
+                          'meta': {'patternName': 'interaction', 'version': 1}}]},
+        'D2': {'USR_2': [{'matches': [dict(match, sentence=3)], 'hitCount': 1, 'meta': {'patternName': 'p2'}}]}}}
+
+
+def test_termite_record_batches_match_dataframe():
+    table = pa.Table.from_batches(list(export.termite_record_batches(json_response(), batch_size=2)))
+    expected = get_termite_dataframe(json_response())
+    assert table.num_rows == 3
+    assert table.column('docID').to_pylist() == list(expected['docID'])
+    assert table.column('hitID').to_pylist() == list(expected['hitID'].astype(str))
+    assert table.column('realSynList').to_pylist() == list(expected['realSynList'])
+    assert table.schema.equals(export.TERMITE_SCHEMA)
+
+
+def test_fractional_scores_are_not_truncated(tmp_path):
+    response = {'RESP_MULTIDOC_PAYLOAD': {'D1': {'GENE$G1': [entity_hit('D1', 'GENE', 'G1', score=2.5)],
+                                                 'DRUG$X1': [entity_hit('D1', 'DRUG', 'X1', score=4)]}}}
+    table = pa.Table.from_batches(list(export.termite_record_batches(response)))
+    assert table.column('score').to_pylist() == [2.5, 4.0]
+    path = str(tmp_path / 'hits.parquet')
+    with export.TermiteParquetExporter(path) as exporter:
+        exporter.add_response(response)
+    assert pq.read_table(path).column('score').to_pylist() == [2.5, 4.0]
+
+
+def test_termite_locations_column():
+    schema = export.termite_schema(include_locations=True)
+    rows = list(export.iter_termite_rows(json_response(), schema.names))
+    assert rows[0][-1] == [{'sentence': 1, 'start': 0, 'end': 5, 'subsumed': False}]
+
+
+def test_texpress_record_batches_match_dataframe():
+    table = pa.Table.from_batches(list(export.texpress_record_batches(texpress_response())))
+    expected = texpress.get_texpress_dataframe(texpress_response())
+    assert table.column('docID').to_pylist() == list(expected['docID'])
+    assert table.column('patternID').to_pylist() == list(expected['patternID'].astype(str))
+    assert table.column('sentence').to_pylist() == [1, 3]
+
+
+def test_parquet_round_trip(tmp_path):
+    path = str(tmp_path / 'hits.parquet')
+    with export.TermiteParquetExporter(path, row_group_size=2) as exporter:
+        assert exporter.add_response(json_response()) == 3
+        assert exporter.add_response(json_response()) == 3
+    table = pq.read_table(path)
+    assert table.num_rows == 6
+    assert pq.ParquetFile(path).metadata.num_row_groups == 3
+    assert table.column('score').to_pylist() == [3, 5, 3] * 2
+
+
+def test_partitioned_parquet_dataset(tmp_path):
+    path = str(tmp_path / 'dataset')
+    with export.TermiteParquetExporter(path, partition_cols=['entityType']) as exporter:
+        exporter.add_response(json_response())
+    assert sorted(os.listdir(path)) == ['entityType=DRUG', 'entityType=GENE']
+    gene = pq.read_table(os.path.join(path, 'entityType=GENE'))
+    assert sorted(gene.column('hitID').to_pylist()) == ['G1', 'G2']
+    assert 'entityType' not in gene.schema.names
+
+
+def test_texpress_parquet_and_empty_export(tmp_path):
+    path = str(tmp_path / 'matches.parquet')
+    with export.TexpressParquetExporter(path) as exporter:
+        exporter.add_response(texpress_response())
+    assert pq.read_table(path).column('originalFragment').to_pylist() == ['G1 and X1'] * 2
+
+    empty = str(tmp_path / 'empty.parquet')
+    export.TermiteParquetExporter(empty).close()
+    assert pq.read_table(empty).num_rows == 0
+
+
+def test_unknown_partition_column(tmp_path):
+    with pytest.raises(ValueError):
+        export.TermiteParquetExporter(str(tmp_path / 'x'), partition_cols=['nope'])
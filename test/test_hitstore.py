@@ -0,0 +1,84 @@
+import os
+
+import pytest
+
+from termite_toolkit.hitstore import HitStore
+
+
+def entity_hit(entity_type, hit_id, score=3, **fields):
+    hit = {'entityType': entity_type, 'hitID': hit_id, 'name': hit_id.lower(), 'score': score, 'hitCount': 1,
+           'nonambigsyns': 1, 'totnosyns': 1, 'subsume': [False]}
+    hit.update(fields)
+    return hit
+
+
+def json_response(docs):
+    return {'RESP_MULTIDOC_PAYLOAD': {doc_id: {hit['entityType'] + '$' + hit['hitID']: [hit] for hit in hits}
+                                      for doc_id, hits in docs.items()}}
+
+
+def test_add_response_commits_and_reopens(tmp_path):
+    path = str(tmp_path / 'store')
+    with HitStore(path, mode='a') as store:
+        assert store.add_response(json_response({'D1': [entity_hit('GENE', 'G1'), entity_hit('DRUG', 'X1')],
+                                                 'D2': [entity_hit('GENE', 'G2', score=5)]})) == 3
+        assert store.add_response(json_response({'D3': [entity_hit('GENE', 'G1')]})) == 1
+
+    store = HitStore(path)
+    assert len(store) == 4
+    assert store.n_docs == 3
+    df = store.to_dataframe()
+    assert list(df['docID']) == ['D1', 'D1', 'D2', 'D3']
+    assert list(df['hitID']) == ['G1', 'X1', 'G2', 'G1']
+    assert list(store.select(entity_types='GENE', min_score=4)) == [2]
+    assert list(store.document_hits('D1')) == [0, 1]
+    assert store.hit(3)['hitID'] == 'G1'
+
+
+def test_recover_drops_uncommitted_writes(tmp_path):
+    path = str(tmp_path / 'store')
+    with HitStore(path, mode='a') as store:
+        store.add_response(json_response({'D1': [entity_hit('GENE', 'G1')]}))
+    # an interrupted writer leaves bytes past the commit
+    for name in ('doc.bin', 'hits.jsonl', 'names.jsonl'):
+        with open(os.path.join(path, name), 'ab') as f:
+            f.write(b'partial')
+
+    with HitStore(path, mode='a') as store:
+        store.add_response(json_response({'D2': [entity_hit('DRUG', 'X1')]}))
+        assert list(store.to_dataframe()['name']) == ['g1', 'x1']
+        assert store.hit(1)['hitID'] == 'X1'
+
+
+def test_failed_batch_is_rolled_back(tmp_path):
+    path = str(tmp_path / 'store')
+    store = HitStore(path, mode='a')
+    store.add_response(json_response({'D1': [entity_hit('GENE', 'G1')]}))
+    sizes = {name: os.path.getsize(os.path.join(path, name)) for name in os.listdir(path)}
+
+    malformed = entity_hit('DRUG', 'X1')
+    del malformed['hitCount']
+    with pytest.raises(KeyError):
+        store.add_response(json_response({'D2': [entity_hit('INDICATION', 'I1'), malformed]}))
+    assert len(store) == 1
+    assert {name: os.path.getsize(os.path.join(path, name)) for name in os.listdir(path)} == sizes
+
+    store.add_response(json_response({'D3': [entity_hit('DRUG', 'X2'), entity_hit('GENE', 'G1')]}))
+    df = store.to_dataframe()
+    assert list(df['entityType']) == ['GENE', 'DRUG', 'GENE']
+    assert list(df['hitID']) == ['G1', 'X2', 'G1']
+    assert list(HitStore(path).to_dataframe()['name']) == ['g1', 'x2', 'g1']
+
+
+def test_read_only_store_rejects_writes(tmp_path):
+    path = str(tmp_path / 'store')
+    HitStore(path, mode='a').close()
+    with pytest.raises(IOError):
+        HitStore(path).add_response(json_response({'D1': [entity_hit('GENE', 'G1')]}))
+
+
+def test_fractional_scores_are_kept(tmp_path):
+    with HitStore(str(tmp_path / 'store'), mode='a') as store:
+        store.add_response(json_response({'D1': [entity_hit('GENE', 'G1', score=2.5), entity_hit('GENE', 'G2')]}))
+        assert list(store.to_dataframe()['score']) == [2.5, 3]
+        assert list(store.select(min_score=2.6)) == [1]
@@ -0,0 +1,87 @@
+import pytest
+
+pytest.importorskip('scipy')
+
+from termite_toolkit.matrix import CooccurrenceBuilder, EntityMatrixBuilder, termite_entity_matrix
+
+
+def entity_hit(entity_type, hit_id, sentences=(1,)):
+    return {'entityType': entity_type, 'hitID': hit_id, 'name': hit_id.lower(), 'score': 3, 'hitCount': len(sentences),
+            'nonambigsyns': 1, 'totnosyns': 1,
+            'exact_array': [{'sentence': s, 'start': 0, 'end': 5, 'subsumed': False} for s in sentences]}
+
+
+def doc(doc_id, *hits):
+    document = {'body': 'text', 'termiteTags': list(hits)}
+    if doc_id is not None:
+        document['docID'] = doc_id
+    return document
+
+
+def counts(builder):
+    return {(row.entity_a, row.entity_b): row.count for row in builder.to_dataframe().itertuples()}
+
+
+def test_document_cooccurrence():
+    response = [doc('D1', entity_hit('GENE', 'G1'), entity_hit('DRUG', 'X1')),
+                doc('D2', entity_hit('GENE', 'G1'), entity_hit('DRUG', 'X1'), entity_hit('GENE', 'G2'))]
+    builder = CooccurrenceBuilder().add_response(response)
+    assert counts(builder) == {('GENE$G1', 'DRUG$X1'): 2, ('GENE$G1', 'GENE$G2'): 1, ('DRUG$X1', 'GENE$G2'): 1}
+    assert builder.to_csr().diagonal().tolist() == [2, 2, 1]
+
+
+@pytest.mark.parametrize('doc_id', ['D1', None])
+def test_documents_sharing_a_docid_are_not_merged(doc_id):
+    response = [doc(doc_id, entity_hit('GENE', 'G1')), doc(doc_id, entity_hit('DRUG', 'X1')),
+                doc(doc_id, entity_hit('GENE', 'G1'), entity_hit('DRUG', 'X1'))]
+    builder = CooccurrenceBuilder().add_response(response)
+    assert counts(builder) == {('GENE$G1', 'DRUG$X1'): 1}
+    assert builder.n_units == 3
+
+
+def test_streamed_json_documents_sharing_a_docid_are_not_merged():
+    stream = [('D1', {'GENE$G1': [entity_hit('GENE', 'G1')]}), ('D1', {'DRUG$X1': [entity_hit('DRUG', 'X1')]})]
+    assert counts(CooccurrenceBuilder().add_response(stream)) == {}
+
+
+def test_sentence_cooccurrence():
+    response = [doc('D1', entity_hit('GENE', 'G1', sentences=(1, 2)), entity_hit('DRUG', 'X1', sentences=(2, 0)),
+                    entity_hit('INDICATION', 'I1', sentences=(3,)))]
+    builder = CooccurrenceBuilder(level='sentence').add_response(response)
+    assert counts(builder) == {('GENE$G1', 'DRUG$X1'): 1}
+    assert builder.n_units == 3
+
+
+def test_entity_matrix_sums_counts_per_document():
+    response = {'RESP_MULTIDOC_PAYLOAD': {
+        'D1': {'GENE$G1': [entity_hit('GENE', 'G1', sentences=(1, 2))]},
+        'D2': {'GENE$G1': [entity_hit('GENE', 'G1')], 'DRUG$X1': [entity_hit('DRUG', 'X1')]}}}
+    builder = EntityMatrixBuilder().add_response(response)
+    assert builder.to_csr().toarray().tolist() == [[2, 0], [1, 1]]
+
+
+def test_entity_matrix_appends_batches_with_stable_vocabularies():
+    builder = EntityMatrixBuilder()
+    builder.add_response([doc('D1', entity_hit('GENE', 'G1'), entity_hit('DRUG', 'X1'))])
+    first = builder.to_csr()
+    builder.add_response([doc('D2', entity_hit('GENE', 'G2'), entity_hit('GENE', 'G1', sentences=(1, 2, 3))),
+                          doc('D1', entity_hit('DRUG', 'X1'))])
+    assert builder.doc_ids == ['D1', 'D2']
+    assert builder.entity_ids == ['GENE$G1', 'DRUG$X1', 'GENE$G2']
+    assert builder.to_csr()[:first.shape[0], :first.shape[1]].toarray().tolist() == [[1, 2]]
+    # a docID seen in several batches keeps its row and its counts are summed
+    assert builder.to_csr().toarray().tolist() == [[1, 2, 0], [3, 0, 1]]
+
+
+def test_entity_matrix_values_and_filters():
+    response = [doc('D1', dict(entity_hit('GENE', 'G1'), score=4), entity_hit('DRUG', 'X1'),
+                    dict(entity_hit('GENE', 'G9'), nonambigsyns=0))]
+    matrix, doc_ids, entity_ids = termite_entity_matrix(response, value='score', filter_entity_types='GENE')
+    assert (doc_ids, entity_ids) == (['D1'], ['GENE$G1'])
+    assert matrix.toarray().tolist() == [[4]]
+    matrix, doc_ids, entity_ids = termite_entity_matrix(response, response, reject_ambig=False)
+    assert entity_ids == ['GENE$G1', 'DRUG$X1', 'GENE$G9']
+    assert matrix.toarray().tolist() == [[2, 2, 2]]
+    assert EntityMatrixBuilder().to_csr().shape == (0, 0)
+    with pytest.raises(ValueError):
+        EntityMatrixBuilder(value='name')
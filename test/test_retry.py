@@ -0,0 +1,215 @@
+import asyncio
+import io
+
+import pytest
+import requests
+
+from termite_toolkit.async_client import AsyncTermiteClient, aiohttp
+from termite_toolkit.cache import ResponseCache
+from termite_toolkit.retry import CircuitBreaker, CircuitOpenError, RetryPolicy
+from termite_toolkit.session import TermiteSession
+from termite_toolkit.termite import TermiteRequestBuilder
+from termite_toolkit.texpress import TexpressRequestBuilder
+
+
+class FakeResponse():
+    def __init__(self, status_code=200):
+        self.status_code = status_code
+        self.headers = {}
+
+    def close(self):
+        pass
+
+
+class FakeTransport():
+    """
+    Stands in for the requests.Session of a TermiteSession, raising or returning the given outcomes in turn
+    """
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def request(self, method, url, **kwargs):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+
+def session_with(*outcomes, threshold=2):
+    session = TermiteSession(retry_policy=RetryPolicy(total=0), breaker_threshold=threshold,
+                             breaker_reset_timeout=0)
+    transport = FakeTransport(*outcomes)
+    session._get_session = lambda: transport
+    return session, transport
+
+
+def test_breaker_opens_after_threshold_and_recovers():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    breaker.before_request()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+
+    breaker.reset_timeout = 0
+    breaker.before_request()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # a single trial request, every other caller is turned away
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    breaker.before_request()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.failures == 0
+
+
+def test_success_resets_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=2)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_aborted_trial_lets_a_new_trial_through():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    breaker.before_request()
+    breaker.record_abort()
+    assert breaker.state == CircuitBreaker.OPEN
+    breaker.before_request()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+
+def test_abort_does_not_count_as_failure():
+    breaker = CircuitBreaker(failure_threshold=1)
+    breaker.record_abort()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.failures == 0
+
+
+@pytest.mark.parametrize('error', [requests.exceptions.ChunkedEncodingError('broken body'),
+                                   requests.exceptions.ContentDecodingError('bad gzip')])
+def test_half_open_trial_failing_with_other_error_reopens_circuit(error):
+    session, transport = session_with(requests.exceptions.ConnectionError(), requests.exceptions.ConnectionError(),
+                                      error, FakeResponse())
+    breaker = session.get_breaker('http://termite/api')
+    for _ in range(2):
+        with pytest.raises(requests.exceptions.ConnectionError):
+            session.get('http://termite/api')
+    assert breaker.state == CircuitBreaker.OPEN
+
+    with pytest.raises(type(error)):
+        session.get('http://termite/api')
+    assert breaker.state == CircuitBreaker.OPEN
+
+    assert session.get('http://termite/api').status_code == 200
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert transport.calls == 4
+
+
+def test_interrupted_half_open_trial_does_not_block_endpoint():
+    session, transport = session_with(requests.exceptions.Timeout(), KeyboardInterrupt(), FakeResponse(),
+                                      threshold=1)
+    breaker = session.get_breaker('http://termite/api')
+    with pytest.raises(requests.exceptions.Timeout):
+        session.get('http://termite/api')
+    with pytest.raises(KeyboardInterrupt):
+        session.get('http://termite/api')
+    assert breaker.state == CircuitBreaker.OPEN
+    assert session.get('http://termite/api').status_code == 200
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_retryable_status_is_retried_then_returned():
+    session = TermiteSession(retry_policy=RetryPolicy(total=2, backoff_factor=0), breaker_threshold=5)
+    transport = FakeTransport(FakeResponse(503), FakeResponse(503), FakeResponse(200))
+    session._get_session = lambda: transport
+    assert session.post('http://termite/api').status_code == 200
+    assert transport.calls == 3
+    assert session.get_breaker('http://termite/api').state == CircuitBreaker.CLOSED
+
+
+class FakeAsyncResponse():
+    """
+    Stands in for a released aiohttp.ClientResponse
+    """
+
+    def __init__(self, status):
+        self.status = status
+        self.headers = {}
+
+    def raise_for_status(self):
+        assert self.status < 400
+
+    def get_encoding(self):
+        return 'utf-8'
+
+
+@pytest.mark.skipif(aiohttp is None, reason='requires aiohttp')
+def test_async_half_open_trial_resolves():
+    for error in (aiohttp.ClientPayloadError('truncated'), asyncio.CancelledError()):
+        client = AsyncTermiteClient(url='http://termite/api', retry_policy=RetryPolicy(total=0), breaker_threshold=1,
+                                    breaker_reset_timeout=0)
+        outcomes = [aiohttp.ClientConnectionError(), error, (FakeAsyncResponse(200), b'{}')]
+
+        async def post_once(payload, file_path=None):
+            outcome = outcomes.pop(0)
+            if isinstance(outcome, BaseException):
+                raise outcome
+            return outcome
+
+        client._post_once = post_once
+
+        async def run():
+            with pytest.raises(aiohttp.ClientConnectionError):
+                await client._post({'output': 'json'})
+            with pytest.raises(type(error)):
+                await client._post({'output': 'json'})
+            assert client.breaker.state == CircuitBreaker.OPEN
+            assert await client._post({'output': 'json'}) == {}
+            assert client.breaker.state == CircuitBreaker.CLOSED
+
+        asyncio.run(run())
+
+
+def http_response(status_code, body=b'{}'):
+    response = requests.Response()
+    response.status_code = status_code
+    response.reason = 'Service Unavailable' if status_code == 503 else 'OK'
+    response.url = 'http://termite/api'
+    response.encoding = 'utf-8'
+    response._content = body
+    response.raw = io.BytesIO(body)
+    return response
+
+
+@pytest.mark.parametrize('cls', [TermiteRequestBuilder, TexpressRequestBuilder])
+def test_execute_raises_once_retries_are_exhausted(cls):
+    session = TermiteSession(retry_policy=RetryPolicy(total=2, backoff_factor=0), breaker_threshold=None)
+    transport = FakeTransport(*[http_response(503, b'{}') for _ in range(6)] + [http_response(200, b'{"ok": 1}')])
+    session._get_session = lambda: transport
+    cache = ResponseCache()
+    t = cls()
+    t.set_url('http://termite/api')
+    t.set_session(session)
+    t.set_cache(cache)
+    t.set_text('BRCA1')
+    with pytest.raises(requests.exceptions.HTTPError) as error:
+        t.execute()
+    assert error.value.response.status_code == 503
+    assert transport.calls == 3
+    with pytest.raises(requests.exceptions.HTTPError):
+        t.execute(return_text=True)
+    # the error body was never cached
+    assert len(cache.memory) == 0
+    assert t.execute() == {'ok': 1}
+
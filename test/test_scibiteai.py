@@ -0,0 +1,193 @@
+import random
+
+import pytest
+
+from termite_toolkit import scibiteai
+
+VOCABS = ['GENE', 'DRUG', 'INDICATION']
+
+
+def legacy_get_hits(termiteTags, hierarchy=None, vocabs=None):
+    """
+    get_hits before overlaps were resolved by priority order
+    """
+    hits = []
+    for hit in termiteTags:
+        if not vocabs:
+            if hit['entityType'] not in hierarchy:
+                hierarchy[hit['entityType']] = len(hierarchy)
+        elif hit['entityType'] not in vocabs:
+            continue
+        if 'fls' in hit['exact_array'][0]:
+            hitLocs, subsumeStates = hit['exact_array'], hit['subsume']
+        else:
+            hitLocs = [{'fls': [loc['sentence'], loc['start'], loc['end']]} for loc in hit['exact_array']]
+            subsumeStates = [loc['subsumed'] for loc in hit['exact_array']]
+        for idx, hitLoc in enumerate(hitLocs):
+            if hitLoc['fls'][0] < 1:
+                continue
+            hitInfo = {'entityType': hit['entityType'], 'entityID': hit['hitID'], 'entityName': hit['name'],
+                       'startLoc': hitLoc['fls'][1], 'endLoc': hitLoc['fls'][2]}
+            breakBool = False
+            if subsumeStates[idx] == False:
+                for hitIdx, hit_ in enumerate(hits):
+                    if ((hit_['endLoc'] >= hitInfo['startLoc'] and hit_['endLoc'] <= hitInfo['endLoc']) or
+                            (hit_['startLoc'] >= hitInfo['startLoc'] and hit_['startLoc'] <= hitInfo['endLoc'])):
+                        if hierarchy[hit_['entityType']] >= hierarchy[hitInfo['entityType']]:
+                            del hits[hitIdx]
+                            break
+                        else:
+                            breakBool = True
+                            break
+            if not breakBool:
+                hits.append(hitInfo)
+    return hits
+
+
+def legacy_markup(docjsonx, normalisation='id', substitute=True, wrap=False, wrapChars=('{!', '!}'), vocabs=None,
+                  replacementDict=None):
+    """
+    markup before the text was rewritten in one pass, rebuilding the text for every substitution
+    """
+    results = {}
+    hierarchy = {vocab: idx for idx, vocab in enumerate(vocabs or [])}
+    for docIdx, doc in enumerate(docjsonx):
+        text = doc['body']
+        substitutions = sorted(scibiteai.get_hits(doc['termiteTags'], hierarchy=hierarchy, vocabs=vocabs),
+                               key=lambda x: x['startLoc'])
+        prefix, postfix = wrapChars if wrap else ('', '')
+        for sub in reversed(substitutions):
+            if replacementDict:
+                subText = replacementDict[sub['entityType']].replace(
+                    '~TYPE~', sub['entityType']).replace('~ID~', sub['entityID']).replace('~NAME~', sub['entityName'])
+            else:
+                subText = {'id': '_'.join([sub['entityType'], sub['entityID']]),
+                           'type': sub['entityType'],
+                           'name': sub['entityName'],
+                           'typeplusname': '%s %s' % (sub['entityType'], sub['entityName']),
+                           'typeplusid': '%s %s' % (sub['entityType'], '_'.join([sub['entityType'],
+                                                                                  sub['entityID']]))}[normalisation]
+                if not substitute:
+                    subText += ' %s' % text[sub['startLoc']:sub['endLoc']]
+            text = text[:sub['startLoc']] + prefix + subText + postfix + text[sub['endLoc']:]
+        results[docIdx] = {'termited_text': text}
+    return results
+
+
+def location(start, end, sentence=1, subsumed=False):
+    return {'sentence': sentence, 'start': start, 'end': end, 'subsumed': subsumed}
+
+
+def entity_hit(entity_type, hit_id, *locations):
+    return {'entityType': entity_type, 'hitID': hit_id, 'name': hit_id.lower(), 'exact_array': list(locations)}
+
+
+def spans(hits):
+    return [(hit['entityID'], hit['startLoc'], hit['endLoc']) for hit in hits]
+
+
+def random_document(seed, n_hits=60, length=3000):
+    rng = random.Random(seed)
+    body = ''.join(rng.choice('abcdefgh {}') for _ in range(length))
+    tags = []
+    for i in range(n_hits):
+        start = rng.randrange(length - 30)
+        tags.append(entity_hit(rng.choice(VOCABS), 'E%d' % i,
+                               location(start, start + rng.randrange(1, 30), sentence=rng.randrange(0, 4),
+                                        subsumed=rng.random() < 0.1)))
+    return {'body': body, 'termiteTags': tags}
+
+
+def test_get_hits_matches_legacy_without_overlaps():
+    tags = [entity_hit(VOCABS[i % 3], 'E%d' % i, location(i * 10, i * 10 + 5), location(i * 10 + 500, i * 10 + 505))
+            for i in range(20)]
+    tags.append(entity_hit('GENE', 'S0', location(900, 905, sentence=0)))
+    expected = sorted(legacy_get_hits(tags, vocabs=VOCABS), key=lambda hit: hit['startLoc'])
+    assert scibiteai.get_hits(tags, hierarchy={v: i for i, v in enumerate(VOCABS)}, vocabs=VOCABS) == expected
+
+
+def test_get_hits_reads_termite_63_locations():
+    tags = [{'entityType': 'GENE', 'hitID': 'G1', 'name': 'g1', 'exact_array': [{'fls': [1, 0, 4]}, {'fls': [2, 10, 14]}],
+             'subsume': [False, True]}]
+    assert spans(scibiteai.get_hits(tags, vocabs=['GENE'])) == [('G1', 0, 4), ('G1', 10, 14)]
+
+
+def test_get_hits_resolves_overlaps_by_priority():
+    tags = [entity_hit('DRUG', 'X1', location(0, 10)),
+            entity_hit('GENE', 'G1', location(2, 5), location(10, 12)),
+            entity_hit('GENE', 'G2', location(20, 30)),
+            entity_hit('GENE', 'G3', location(22, 25)),
+            entity_hit('INDICATION', 'I1', location(40, 45, subsumed=True)),
+            entity_hit('INDICATION', 'I2', location(41, 43))]
+    # vocab order first, touching spans do not overlap, a span inside another is an overlap
+    assert spans(scibiteai.get_hits(tags, vocabs=['GENE', 'DRUG', 'INDICATION'])) == [
+        ('G1', 2, 5), ('G1', 10, 12), ('G2', 20, 30), ('I2', 41, 43)]
+    assert spans(scibiteai.get_hits(tags, vocabs=['DRUG', 'GENE', 'INDICATION'])) == [
+        ('X1', 0, 10), ('G1', 10, 12), ('G2', 20, 30), ('I2', 41, 43)]
+
+
+def test_get_hits_ties_are_deterministic():
+    tags = [entity_hit('GENE', 'G1', location(0, 5)), entity_hit('GENE', 'G2', location(3, 8)),
+            entity_hit('GENE', 'G3', location(3, 8))]
+    assert spans(scibiteai.get_hits(tags, vocabs=['GENE'])) == [('G1', 0, 5)]
+    assert spans(scibiteai.get_hits(tags[1:], vocabs=['GENE'])) == [('G2', 3, 8)]
+
+
+def test_get_hits_fills_hierarchy_without_vocabs():
+    hierarchy = {}
+    tags = [entity_hit('DRUG', 'X1', location(0, 10)), entity_hit('GENE', 'G1', location(2, 5))]
+    assert spans(scibiteai.get_hits(tags, hierarchy=hierarchy)) == [('X1', 0, 10)]
+    assert hierarchy == {'DRUG': 0, 'GENE': 1}
+
+
+def test_get_hits_never_returns_overlaps():
+    for seed in range(20):
+        hits = scibiteai.get_hits(random_document(seed)['termiteTags'], vocabs=VOCABS)
+        for previous, hit in zip(hits, hits[1:]):
+            assert previous['endLoc'] <= hit['startLoc']
+
+
+def test_get_hits_keeps_touching_spans():
+    # the previous implementation treated spans sharing an end point as overlapping and dropped one of them
+    tags = [entity_hit('GENE', 'G1', location(0, 5)), entity_hit('DRUG', 'X1', location(5, 10))]
+    hierarchy = {'GENE': 0, 'DRUG': 1}
+    assert spans(legacy_get_hits(tags, hierarchy=dict(hierarchy), vocabs=['GENE', 'DRUG'])) == [('G1', 0, 5)]
+    assert spans(scibiteai.get_hits(tags, vocabs=['GENE', 'DRUG'])) == [('G1', 0, 5), ('X1', 5, 10)]
+
+
+def test_get_hits_drops_overlapping_subsumed_hits():
+    # the previous implementation kept every subsumed location, even inside a hit it kept
+    tags = [entity_hit('GENE', 'G1', location(0, 10)), entity_hit('DRUG', 'X1', location(2, 5, subsumed=True)),
+            entity_hit('DRUG', 'X2', location(20, 25, subsumed=True))]
+    hierarchy = {'GENE': 0, 'DRUG': 1}
+    assert spans(legacy_get_hits(tags, hierarchy=dict(hierarchy), vocabs=['GENE', 'DRUG'])) == [
+        ('G1', 0, 10), ('X1', 2, 5), ('X2', 20, 25)]
+    # subsumed hits are still kept where nothing else is
+    assert spans(scibiteai.get_hits(tags, vocabs=['GENE', 'DRUG'])) == [('G1', 0, 10), ('X2', 20, 25)]
+
+
+@pytest.mark.parametrize('normalisation', ['id', 'type', 'name', 'typeplusname', 'typeplusid'])
+def test_markup_matches_legacy(normalisation):
+    docs = [random_document(seed) for seed in range(5)]
+    for substitute in (True, False):
+        for wrap in (True, False):
+            for vocabs in (VOCABS, None):
+                kwargs = dict(normalisation=normalisation, substitute=substitute, wrap=wrap, vocabs=vocabs)
+                assert scibiteai.markup(docs, **kwargs) == legacy_markup(docs, **kwargs)
+
+
+def test_markup_replacement_dict_matches_legacy():
+    docs = [random_document(seed) for seed in range(5)]
+    replacementDict = {vocab: '{ENTITY}_~TYPE~_~ID~ (~NAME~)' for vocab in VOCABS}
+    assert (scibiteai.markup(docs, vocabs=VOCABS, replacementDict=replacementDict, wrap=True) ==
+            legacy_markup(docs, vocabs=VOCABS, replacementDict=replacementDict, wrap=True))
+
+
+def test_markup_example():
+    doc = {'body': 'BRCA1 mutations in breast cancer', 'termiteTags': [
+        entity_hit('GENE', 'BRCA1', location(0, 5)), entity_hit('INDICATION', 'D001943', location(19, 32))]}
+    assert scibiteai.markup([doc], vocabs=['GENE', 'INDICATION'])[0]['termited_text'] == \
+        'GENE_BRCA1 mutations in INDICATION_D001943'
+    assert scibiteai.markup([doc], vocabs=['GENE'], normalisation='type', substitute=False, wrap=True)[0][
+        'termited_text'] == '{!GENE BRCA1!} mutations in breast cancer'
+    assert scibiteai.markup([{'body': 'no hits'}])[0]['termited_text'] == 'no hits'
@@ -0,0 +1,110 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from termite_toolkit import session as session_module
+from termite_toolkit import termite, texpress
+from termite_toolkit.retry import RetryPolicy
+from termite_toolkit.session import TermiteSession, get_default_session, set_default_session
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        # the client's port tells connections apart
+        self.server.connections.append(self.client_address)
+        body = json.dumps({'RESP_PAYLOAD': {}}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), KeepAliveHandler)
+    httpd.daemon_threads = True
+    httpd.connections = []
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def default_session():
+    previous = session_module._default_session
+    session = TermiteSession(retry_policy=RetryPolicy(total=0))
+    set_default_session(session)
+    yield session
+    session.close()
+    set_default_session(previous)
+
+
+def url_of(httpd):
+    return 'http://127.0.0.1:{}/termite'.format(httpd.server_address[1])
+
+
+def test_builders_share_one_keep_alive_connection(server, default_session):
+    url = url_of(server)
+    for _ in range(3):
+        assert termite.annotate_text(url, 'BRCA1', {'output': 'json'}) == {'RESP_PAYLOAD': {}}
+        t = texpress.TexpressRequestBuilder()
+        t.set_url(url)
+        t.set_text('BRCA1')
+        t.set_output_format('json')
+        assert t.execute() == {'RESP_PAYLOAD': {}}
+    assert len(server.connections) == 6
+    assert len(set(server.connections)) == 1
+
+
+def test_keep_alive_can_be_disabled(server):
+    with TermiteSession(keep_alive=False, retry_policy=RetryPolicy(total=0)) as session:
+        for _ in range(3):
+            assert session.post(url_of(server), data={'text': 'x'}).status_code == 200
+    assert len(set(server.connections)) == 3
+
+
+def test_default_session_is_created_once():
+    previous = session_module._default_session
+    try:
+        set_default_session(None)
+        sessions = []
+        threads = [threading.Thread(target=lambda: sessions.append(get_default_session())) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(set(map(id, sessions))) == 1
+        assert get_default_session() is sessions[0]
+    finally:
+        set_default_session(previous)
+
+
+def test_threads_get_their_own_session_on_shared_pools():
+    session = TermiteSession(verify=False)
+    own = session._get_session()
+    assert session._get_session() is own
+    others = []
+    thread = threading.Thread(target=lambda: others.append(session._get_session()))
+    thread.start()
+    thread.join()
+    assert others[0] is not own
+    assert others[0].get_adapter('http://termite') is own.get_adapter('https://termite') is session._adapter
+    assert own.verify is False and others[0].verify is False
+    assert len(session._sessions) == 2
+
+    session.close()
+    assert session._sessions == []
+    renewed = session._get_session()
+    assert renewed is not own
+    assert renewed.get_adapter('http://termite') is session._adapter
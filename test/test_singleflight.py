@@ -0,0 +1,135 @@
+import json
+import threading
+
+import pytest
+
+from termite_toolkit.singleflight import SingleFlight
+from termite_toolkit.termite import TermiteRequestBuilder
+
+
+def run_concurrently(group, key, fn, n_followers=3):
+    """
+    Start a leader running fn, then n_followers callers with the same key while it is still in flight
+
+    :return: list of results or exceptions, one per caller
+    """
+    outcomes = []
+
+    def call():
+        try:
+            outcomes.append(group.do(key, fn))
+        except Exception as e:
+            outcomes.append(e)
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    while group.in_flight() == 0:
+        threading.Event().wait(0.01)
+    followers = [threading.Thread(target=call) for _ in range(n_followers)]
+    for follower in followers:
+        follower.start()
+    while group.coalesced < n_followers:
+        threading.Event().wait(0.01)
+    return leader, followers, outcomes
+
+
+def test_singleflight_coalesces_concurrent_calls():
+    group = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        release.wait(5)
+        return 'result'
+
+    leader, followers, results = run_concurrently(group, 'key', slow)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(5)
+    assert results == ['result'] * 4
+    assert len(calls) == 1
+    assert group.in_flight() == 0
+    # nothing is cached once the call returned
+    assert group.do('key', lambda: 'again') == 'again'
+
+
+def test_singleflight_shares_errors_with_waiting_callers():
+    group = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def failing():
+        calls.append(1)
+        release.wait(5)
+        raise ZeroDivisionError('boom')
+
+    leader, followers, outcomes = run_concurrently(group, 'key', failing)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(5)
+    assert len(calls) == 1
+    assert len(outcomes) == 4
+    assert all(isinstance(outcome, ZeroDivisionError) for outcome in outcomes)
+    assert group.in_flight() == 0
+    # the error is not remembered either
+    assert group.do('key', lambda: 'recovered') == 'recovered'
+
+
+def test_singleflight_keeps_different_keys_apart():
+    group = SingleFlight()
+    assert group.do('a', lambda: 1) == 1
+    assert group.do('b', lambda: 2) == 2
+    assert group.coalesced == 0
+
+
+class FakeResponse():
+    status_code = 200
+    ok = True
+    encoding = 'utf-8'
+
+    def __init__(self, body):
+        self.content = json.dumps(body).encode('utf-8')
+        self.text = self.content.decode('utf-8')
+
+
+class SlowSession():
+    """
+    Holds every request until released and counts the requests that reached it
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.release = threading.Event()
+
+    def request(self, method, url, **kwargs):
+        self.calls += 1
+        self.release.wait(5)
+        return FakeResponse({'RESP_PAYLOAD': {'text': kwargs['data']['text']}})
+
+
+def test_identical_builder_requests_are_sent_once():
+    group = SingleFlight()
+    session = SlowSession()
+    results = []
+
+    def annotate(text):
+        t = TermiteRequestBuilder()
+        t.set_url('http://termite/api')
+        t.set_session(session)
+        t.set_cache(None)
+        t.set_singleflight(group)
+        t.set_text(text)
+        results.append(t.execute())
+
+    threads = [threading.Thread(target=annotate, args=('BRCA1',)) for _ in range(4)]
+    threads.append(threading.Thread(target=annotate, args=('TP53',)))
+    for thread in threads:
+        thread.start()
+    while group.coalesced < 3 or group.in_flight() < 2:
+        threading.Event().wait(0.01)
+    session.release.set()
+    for thread in threads:
+        thread.join(5)
+    assert session.calls == 2
+    assert sorted(result['RESP_PAYLOAD']['text'] for result in results) == ['BRCA1'] * 4 + ['TP53']
@@ -0,0 +1,72 @@
+import io
+import json
+
+import pytest
+
+from termite_toolkit.streaming import iter_documents
+from termite_toolkit.termite import TermiteRequestBuilder
+
+MULTIDOC = {'RESP_META': {'version': '6.4'}, 'RESP_MULTIDOC_PAYLOAD': {
+    'D1': {'GENE$G1': [{'hitID': 'G1', 'name': 'g "1"é', 'score': 2.5, 'subsume': [False, True]}]},
+    'D2': {}}}
+DOCJSONX = [{'docID': 'D1', 'body': 'a [b] {c}', 'termiteTags': [{'hitID': 'G1', 'exact_array': []}]},
+            {'docID': 'D2', 'body': '', 'termiteTags': []}]
+
+
+def chunked(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 7, 4096])
+def test_iter_documents_matches_json(chunk_size):
+    body = json.dumps(MULTIDOC).encode('utf-8')
+    assert list(iter_documents(chunked(body, chunk_size))) == list(MULTIDOC['RESP_MULTIDOC_PAYLOAD'].items())
+    body = json.dumps(DOCJSONX, indent=2).encode('utf-8')
+    assert list(iter_documents(chunked(body, chunk_size))) == DOCJSONX
+    assert list(iter_documents(io.BytesIO(body), chunk_size=chunk_size)) == DOCJSONX
+
+
+def test_iter_documents_single_payload_and_empty():
+    assert list(iter_documents(b'{"RESP_PAYLOAD": {"GENE$G1": []}}')) == [('', {'GENE$G1': []})]
+    assert list(iter_documents(b'[]')) == []
+    with pytest.raises(ValueError):
+        list(iter_documents(b'"text"'))
+
+
+class StreamedResponse():
+    status_code = 200
+    ok = True
+    headers = {}
+
+    def __init__(self, body):
+        self.body = body
+        self.closed = False
+
+    def iter_content(self, chunk_size=1):
+        return iter(chunked(self.body, chunk_size))
+
+    def close(self):
+        self.closed = True
+
+
+class StreamingSession():
+    def __init__(self, body):
+        self.response = StreamedResponse(body)
+        self.kwargs = None
+
+    def request(self, method, url, **kwargs):
+        self.kwargs = kwargs
+        return self.response
+
+
+def test_execute_stream_yields_documents_and_closes_response():
+    session = StreamingSession(json.dumps(MULTIDOC).encode('utf-8'))
+    t = TermiteRequestBuilder()
+    t.set_url('http://termite/api')
+    t.set_session(session)
+    t.set_text('BRCA1')
+    documents = t.execute_stream(chunk_size=5)
+    assert session.kwargs is None
+    assert list(documents) == list(MULTIDOC['RESP_MULTIDOC_PAYLOAD'].items())
+    assert session.kwargs['stream'] is True
+    assert session.response.closed
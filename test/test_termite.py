@@ -0,0 +1,225 @@
+import json
+
+import pandas as pd
+
+from termite_toolkit import termite
+from termite_toolkit.termite import EntityHitAggregator, TopHits
+
+
+def entity_hit(entity_type, hit_id, hit_count=1, **fields):
+    hit = {'entityType': entity_type, 'hitID': hit_id, 'name': hit_id.lower(), 'score': 3, 'hitCount': hit_count,
+           'nonambigsyns': 1, 'totnosyns': 1, 'realSynList': [hit_id.lower()], 'frag_vector_array': [],
+           'subsume': [False]}
+    hit.update(fields)
+    return hit
+
+
+def json_response():
+    return {'RESP_MULTIDOC_PAYLOAD': {
+        'D1': {'GENE$G1': [entity_hit('GENE', 'G1', 5)], 'DRUG$X1': [entity_hit('DRUG', 'X1', 2)]},
+        'D2': {'GENE$G2': [entity_hit('GENE', 'G2', 3)], 'INDICATION$I1': [entity_hit('INDICATION', 'I1', 4)]}}}
+
+
+def test_lazy_top_hits_accepts_entity_subset_list():
+    response = termite.TermiteResponse(json.dumps(json_response()).encode('utf-8'))
+    for entity_subset in (['GENE', 'DRUG'], ('GENE', 'DRUG'), 'GENE,DRUG'):
+        lazy = response.top_hits(selection=2, entity_subset=entity_subset)
+        eager = termite.top_hits_df(json_response(), selection=2, entity_subset=entity_subset)
+        pd.testing.assert_frame_equal(lazy, eager)
+        assert list(lazy['hitID']) == ['G1', 'G2']
+    assert list(termite.top_hits_df(response, entity_subset=['INDICATION'])['hitID']) == ['I1']
+
+
+def docjsonx_response():
+    return [{'docID': 'D1', 'title': 'T1', 'body': 'BRCA1 and aspirin',
+             'termiteTags': [entity_hit('GENE', 'G1', 2), entity_hit('DRUG', 'X1', nonambigsyns=0)]},
+            {'docID': 'D2', 'title': 'T2', 'body': 'TP53', 'termiteTags': [entity_hit('GENE', 'G2')]},
+            {'docID': 'D3', 'title': 'T3', 'body': 'nothing'}]
+
+
+def test_records_do_not_modify_docjsonx_response():
+    response = docjsonx_response()
+    snapshot = json.dumps(response, sort_keys=True)
+    records = termite.payload_records(response)
+    assert [(record['docID'], record['hitID'], record['body']) for record in records] == [
+        ('D1', 'G1', 'BRCA1 and aspirin'), ('D2', 'G2', 'TP53')]
+    termite.docjsonx_payload_records(response)
+    termite.docjsonx_payload_tables(response)
+    termite.get_termite_dataframe(response)
+    termite.get_termite_tables(response)
+    termite.all_entities_df(response)
+    assert json.dumps(response, sort_keys=True) == snapshot
+
+
+def test_docjsonx_tables_hold_document_fields_once():
+    documents, hits = termite.docjsonx_payload_tables(docjsonx_response())
+    assert documents == [{'docID': 'D1', 'title': 'T1', 'body': 'BRCA1 and aspirin'},
+                         {'docID': 'D2', 'title': 'T2', 'body': 'TP53'},
+                         {'docID': 'D3', 'title': 'T3', 'body': 'nothing'}]
+    assert [(hit['docID'], hit['hitID']) for hit in hits] == [('D1', 'G1'), ('D2', 'G2')]
+    assert not any('body' in hit or 'title' in hit for hit in hits)
+
+    documents, hits = termite.get_termite_tables(docjsonx_response(), reject_ambig=False)
+    assert list(documents['docID']) == ['D1', 'D2', 'D3']
+    assert 'body' not in hits.columns
+    joined = hits.merge(documents, on='docID')
+    assert list(zip(joined['hitID'], joined['body'])) == [('G1', 'BRCA1 and aspirin'), ('X1', 'BRCA1 and aspirin'),
+                                                          ('G2', 'TP53')]
+
+
+
+def filtered_response():
+    return {'RESP_MULTIDOC_PAYLOAD': {
+        'D1': {'GENE$G1': [entity_hit('GENE', 'G1', 5, docID='D1')],
+               'GENE$G9': [entity_hit('GENE', 'G9', docID='D1', nonambigsyns=0)],
+               'DRUG$X1': [entity_hit('DRUG', 'X1', 2, docID='D1', score=1)]},
+        'D2': {'GENE$G2': [entity_hit('GENE', 'G2', 3, docID='D2', subsume=[False, True], exact_array=[])],
+               'INDICATION$I1': [entity_hit('INDICATION', 'I1', 4, docID='D2')]}}}
+
+
+def test_termite_dataframe_matches_records_frame():
+    cols = ['docID', 'entityType', 'hitID', 'name', 'score', 'realSynList', 'totnosyns', 'nonambigsyns',
+            'frag_vector_array', 'hitCount']
+    for options in ({}, {'reject_ambig': False}, {'score_cutoff': 2}, {'remove_subsumed': False}):
+        frame = termite.get_termite_dataframe(filtered_response(), **options)
+        expected = pd.DataFrame(termite.payload_records(filtered_response(), **options))[cols]
+        assert list(frame.columns) == cols
+        for col in cols:
+            assert list(frame[col]) == list(expected[col])
+    frame = termite.get_termite_dataframe(filtered_response(), cols_to_add='exact_array', remove_subsumed=False)
+    assert list(frame['exact_array']) == [None, None, [], None]
+    assert list(termite.get_termite_dataframe(filtered_response())['hitID']) == ['G1', 'X1', 'I1']
+    assert list(termite.get_termite_dataframe(filtered_response(), score_cutoff=2)['hitID']) == ['G1', 'I1']
+    assert 'G2' in list(termite.get_termite_dataframe(filtered_response(), remove_subsumed=False)['hitID'])
+    assert 'G9' in list(termite.get_termite_dataframe(filtered_response(), reject_ambig=False)['hitID'])
+
+
+def test_termite_dataframe_types_and_edge_cases():
+    frame = termite.get_termite_dataframe(filtered_response())
+    assert isinstance(frame['entityType'].dtype, pd.CategoricalDtype)
+    assert isinstance(frame['hitID'].dtype, pd.CategoricalDtype)
+    assert list(frame['entityType'].cat.categories) == ['DRUG', 'GENE', 'INDICATION']
+    assert list(frame['hitCount']) == [5, 2, 4]
+
+    empty = termite.get_termite_dataframe({'RESP_MULTIDOC_PAYLOAD': {}})
+    assert len(empty) == 0 and list(empty.columns)[:3] == ['docID', 'entityType', 'hitID']
+    assert termite.get_termite_dataframe(filtered_response(), cols_to_add='nope') is None
+
+
+def test_payload_records_match_per_document_records():
+    response = filtered_response()
+    for options in ({}, {'reject_ambig': False}, {'score_cutoff': 2}, {'remove_subsumed': False}):
+        expected = []
+        for payload in response['RESP_MULTIDOC_PAYLOAD'].values():
+            expected = expected + termite.json_payload_records(payload, **options)
+        assert termite.payload_records(response, **options) == expected
+        assert list(termite.iter_payload_records(response, **options)) == expected
+    assert [hit['hitID'] for hit in termite.json_payload_records(response['RESP_MULTIDOC_PAYLOAD']['D1'])] == [
+        'G1', 'X1']
+
+
+def test_iter_payload_records_stops_early():
+    def documents():
+        yield 'D1', filtered_response()['RESP_MULTIDOC_PAYLOAD']['D1']
+        raise AssertionError('read past the first record')
+
+    records = termite.iter_payload_records(documents())
+    assert next(records)['hitID'] == 'G1'
+
+
+def test_entity_hit_aggregator_merges_responses():
+    first = EntityHitAggregator().add_response(json_response())
+    second = EntityHitAggregator().add_response({'RESP_MULTIDOC_PAYLOAD': {
+        'D3': {'GENE$G1': [entity_hit('GENE', 'G1', 2, score=5)]}}})
+    summary = first.merge(second).to_dict()
+    assert summary['GENE$G1']['hit_count'] == 7
+    assert summary['GENE$G1']['max_relevance_score'] == 5
+    assert summary['GENE$G1']['doc_id'] == ['D1', 'D3']
+    assert summary['GENE$G1']['doc_count'] == 2
+    assert set(summary) == {'GENE$G1', 'DRUG$X1', 'GENE$G2', 'INDICATION$I1'}
+
+
+def test_entity_hit_aggregator_counts_single_document_responses():
+    single = {'RESP_PAYLOAD': {'GENE$G1': [entity_hit('GENE', 'G1', 2)]}}
+    aggregator = EntityHitAggregator()
+    for i in range(5):
+        aggregator.add_response(single, doc_id='text-{}'.format(i))
+    summary = aggregator.to_dict()['GENE$G1']
+    assert summary['doc_count'] == 5
+    assert summary['doc_id'] == ['text-0', 'text-1', 'text-2', 'text-3', 'text-4']
+    assert summary['hit_count'] == 10
+
+    # documents with their own docID keep it
+    summary = EntityHitAggregator().add_response(json_response(), doc_id='ignored').to_dict()
+    assert summary['GENE$G1']['doc_id'] == ['D1']
+    # without a doc_id single-document responses are one document, as in get_entity_hits_from_json
+    summary = EntityHitAggregator().add_response(single).add_response(single).to_dict()
+    assert summary['GENE$G1']['doc_id'] == [''] and summary['GENE$G1']['hit_count'] == 4
+    assert termite.get_entity_hits_from_json(single, 'GENE')['GENE$G1']['doc_id'] == ['']
+
+
+def test_entity_hit_aggregator_matches_docjsonx_summary_and_filters():
+    aggregator = EntityHitAggregator('GENE').add_response(docjsonx_response())
+    assert set(aggregator.to_dict()) == {'GENE$G1', 'GENE$G2'}
+    assert aggregator.to_dict() == termite.get_entity_hits_from_docjsonx(docjsonx_response(), 'GENE')
+    frame = aggregator.to_dataframe()
+    assert list(frame.index) == ['GENE$G1', 'GENE$G2']
+    assert list(frame['doc_count']) == [1, 1]
+
+
+def counted_responses(n_docs=20, n_entities=6):
+    """
+    Responses of one document each, every hit with a distinct hitCount
+    """
+    responses = []
+    for doc in range(n_docs):
+        payload = {}
+        for entity in range(n_entities):
+            entity_type = ('GENE', 'DRUG', 'INDICATION')[entity % 3]
+            hit_id = '{}{}_{}'.format(entity_type[0], entity, doc)
+            payload[entity_type + '$' + hit_id] = [entity_hit(entity_type, hit_id, (doc * 37 + entity * 11) % 997 + 1,
+                                                              docID='D{}'.format(doc))]
+        responses.append({'RESP_MULTIDOC_PAYLOAD': {'D{}'.format(doc): payload}})
+    return responses
+
+
+def test_top_hits_match_sorted_frame():
+    responses = counted_responses()
+    combined = {'RESP_MULTIDOC_PAYLOAD': {}}
+    for response in responses:
+        combined['RESP_MULTIDOC_PAYLOAD'].update(response['RESP_MULTIDOC_PAYLOAD'])
+    frame = termite.get_termite_dataframe(combined).sort_values(by=['hitCount'], ascending=False)
+    for entity_subset in (None, 'GENE,DRUG'):
+        expected = frame if entity_subset is None else frame[frame['entityType'].isin(entity_subset.split(','))]
+        top = termite.top_hits_df(combined, selection=5, entity_subset=entity_subset, include_docs=True)
+        assert list(top['hitID']) == list(expected['hitID'][:5])
+        assert list(top.columns) == ['name', 'realSynList', 'totnosyns', 'hitID', 'entityType']
+        assert list(top.index) == list(expected.index[:5])
+
+        # the same top hits kept across a stream of responses, in bounded memory
+        streamed = TopHits(selection=5, entity_subset=entity_subset)
+        for response in responses:
+            streamed.add_response(response)
+            assert sum(len(heap) for heap in streamed.heaps.values()) <= 5
+        assert list(streamed.to_dataframe()['hitID']) == list(top['hitID'])
+
+
+def test_top_hits_per_entity_type():
+    top_hits = TopHits(selection=2, entity_subset='GENE,DRUG', per_entity_type=True)
+    for response in counted_responses():
+        top_hits.add_response(response)
+    top = top_hits.to_dataframe(include_docs=True)
+    frame = pd.concat([termite.get_termite_dataframe(response) for response in counted_responses()])
+    for entity_type in ('GENE', 'DRUG'):
+        expected = frame[frame['entityType'] == entity_type].sort_values(by=['hitCount'], ascending=False)
+        assert list(top[top['entityType'] == entity_type]['hitID']) == list(expected['hitID'][:2])
+    assert set(top['entityType']) == {'GENE', 'DRUG'}
+    assert len(top) == 4
+
+
+def test_top_hits_ties_keep_the_first_added():
+    response = {'RESP_MULTIDOC_PAYLOAD': {'D1': {
+        'GENE$G1': [entity_hit('GENE', 'G1', 2)], 'GENE$G2': [entity_hit('GENE', 'G2', 3)],
+        'GENE$G3': [entity_hit('GENE', 'G3', 2)], 'GENE$G4': [entity_hit('GENE', 'G4', 2)]}}}
+    assert list(TopHits(selection=3).add_response(response).to_dataframe()['hitID']) == ['G2', 'G1', 'G3']
+    assert TopHits(selection=0).add_response(response).to_dataframe().empty
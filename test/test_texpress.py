@@ -0,0 +1,112 @@
+import copy
+import json
+
+import pandas as pd
+
+from termite_toolkit import texpress
+
+
+def legacy_records(texpress_response, remove_subsumed=True):
+    """
+    texpress_records before records were built without modifying the response, run on a copy
+    """
+    texpress_response = copy.deepcopy(texpress_response)
+    hits = []
+    if 'RESP_TEXPRESS' in texpress_response:
+        for docID, patterns in texpress_response['RESP_TEXPRESS'].items():
+            for pattern_id, pattern_matches in patterns.items():
+                for pattern_hits in pattern_matches:
+                    for match in pattern_hits['matches']:
+                        match['docID'] = docID
+                        match['patternID'] = pattern_id
+                        for x in pattern_hits:
+                            if x == "matches":
+                                continue
+                            elif x == "meta":
+                                for k, v in pattern_hits[x].items():
+                                    match[k] = v
+                            else:
+                                match[x] = pattern_hits[x]
+                        if remove_subsumed is True and match['subsumed'] is True:
+                            continue
+                        hits.append(match)
+    else:
+        for doc in texpress_response:
+            for patternID, pattern_matches in doc['texpressTags'].items():
+                for pattern_hits in pattern_matches:
+                    for match in pattern_hits['matches']:
+                        match['patternID'] = patternID
+                        match.update(pattern_hits)
+                        match.update(doc)
+                        del (match['matches'])
+                        del (match['texpressTags'])
+                        if remove_subsumed is True and match['subsumed'] is True:
+                            continue
+                        hits.append(match)
+    return hits
+
+
+def match(fragment, sentence=1, subsumed=False, **fields):
+    result = {'originalFragment': fragment, 'matchEntities': ['GENE#G1', 'DRUG#X1'],
+              'originalSentence': fragment + ' interact', 'sentence': sentence, 'subsumed': subsumed, 'start': 0}
+    result.update(fields)
+    return result
+
+
+def json_response():
+    return {'RESP_TEXPRESS': {
+        'D1': {'USR_1': [{'matches': [match('a'), match('b', subsumed=True)], 'hitCount': 2,
+                          'meta': {'patternName': 'interaction', 'version': 1}},
+                         # a pattern hit with another layout: no meta, a field overriding its matches
+                         {'matches': [match('c', sentence=2)], 'hitCount': 1, 'start': 7}],
+               'USR_2': []},
+        'D2': {'USR_1': [{'matches': [match('d', sentence=3)], 'hitCount': 1,
+                          'meta': {'patternName': 'interaction', 'version': 2}}],
+               'USR_3': [{'matches': [match('e', extra='x')], 'hitCount': 1, 'meta': {'patternName': 'other'}}]}}}
+
+
+def docjsonx_response():
+    return [{'docID': 'D1', 'body': 'a b c', 'texpressTags': {
+        'USR_1': [{'matches': [match('a'), match('b', subsumed=True)], 'hitCount': 2}],
+        'USR_2': [{'matches': [match('c', sentence=2)], 'hitCount': 1, 'sentence': 9}]}},
+            {'docID': 'D2', 'body': 'd', 'sentence': 5, 'texpressTags': {
+                'USR_1': [{'matches': [match('d')], 'hitCount': 1}]}}]
+
+
+def test_records_match_legacy_and_leave_the_response_untouched():
+    for response in (json_response(), docjsonx_response()):
+        snapshot = json.dumps(response, sort_keys=True)
+        for remove_subsumed in (True, False):
+            assert texpress.texpress_records(response, remove_subsumed=remove_subsumed) == \
+                legacy_records(response, remove_subsumed=remove_subsumed)
+        texpress.get_texpress_dataframe(response, cols_to_add='hitCount')
+        assert json.dumps(response, sort_keys=True) == snapshot
+    assert texpress.json_resp_records(json_response()['RESP_TEXPRESS']) == legacy_records(json_response())
+    assert texpress.docjsonx_records(docjsonx_response()) == legacy_records(docjsonx_response())
+    records = texpress.iter_texpress_records(docjsonx_response())
+    assert next(records)['originalFragment'] == 'a'
+
+
+def values(column):
+    return [None if not isinstance(v, list) and pd.isna(v) else v for v in column]
+
+
+def test_dataframe_matches_records_for_every_layout():
+    for response, cols_to_add in ((json_response(), 'hitCount,start,patternName,version,extra'),
+                                  (docjsonx_response(), 'hitCount,start,body')):
+        frame = texpress.get_texpress_dataframe(response, cols_to_add=cols_to_add)
+        expected = pd.DataFrame(legacy_records(response))
+        for col in frame.columns:
+            assert values(frame[col]) == values(expected[col]), col
+        assert isinstance(frame['patternID'].dtype, pd.CategoricalDtype)
+    frame = texpress.get_texpress_dataframe(json_response(), cols_to_add='start,version')
+    # pattern fields override their matches, whichever layout the plan of the pattern hit was built for
+    assert list(frame['start']) == [0, 7, 0, 0]
+    assert values(frame['version']) == [1, None, 2, None]
+    assert list(texpress.get_texpress_dataframe(docjsonx_response())['sentence']) == [1, 9, 5]
+
+
+def test_dataframe_edge_cases():
+    empty = texpress.get_texpress_dataframe({'RESP_TEXPRESS': {}})
+    assert len(empty) == 0 and list(empty.columns)[:2] == ['docID', 'patternID']
+    assert texpress.get_texpress_dataframe(json_response(), cols_to_add='nope') is None
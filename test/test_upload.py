@@ -0,0 +1,150 @@
+import io
+import json
+
+import pytest
+import requests
+
+from termite_toolkit.cache import ResponseCache, request_key
+from termite_toolkit.retry import RetryPolicy, body_positions
+from termite_toolkit.session import TermiteSession
+from termite_toolkit.termite import TermiteRequestBuilder
+from termite_toolkit.upload import MultipartStream, UploadSource
+
+
+class FakeResponse():
+    ok = True
+    encoding = 'utf-8'
+    headers = {}
+
+    def __init__(self, body, status_code=200):
+        self.status_code = status_code
+        self.content = json.dumps(body).encode('utf-8')
+        self.text = self.content.decode('utf-8')
+
+    def close(self):
+        pass
+
+
+class ReadingTransport():
+    """
+    Reads the whole request body like a real connection would, then returns or raises the given outcomes in turn
+    """
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.bodies = []
+
+    def request(self, method, url, **kwargs):
+        self.bodies.append(b''.join(kwargs['data']))
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+
+def session_with(*outcomes):
+    session = TermiteSession(retry_policy=RetryPolicy(total=2, backoff_factor=0), breaker_threshold=None)
+    transport = ReadingTransport(*outcomes)
+    session._get_session = lambda: transport
+    return session, transport
+
+
+def test_multipart_stream_can_be_resent(tmp_path):
+    path = tmp_path / 'input.txt'
+    path.write_bytes(b'x' * 10000)
+    stream = MultipartStream({'output': 'json', 'opts': None}, {'binary': UploadSource(str(path), chunk_size=1000)})
+    body = b''.join(stream)
+    assert len(body) == stream.len
+    assert b'name="output"\r\n\r\njson\r\n' in body
+    assert b'filename="input.txt"' in body and b'x' * 10000 in body
+    assert b'name="opts"' not in body
+    assert stream.tell() == 0
+    stream.seek(0)
+    assert b''.join(stream) == body
+
+
+def test_multipart_stream_reads_paths_in_chunks(tmp_path):
+    path = tmp_path / 'input.txt'
+    path.write_bytes(b'0123456789')
+    source = UploadSource(str(path), chunk_size=4)
+    assert list(source.iter_chunks()) == [b'0123', b'4567', b'89']
+    stream = MultipartStream({'output': 'json'}, {'binary': source})
+    assert max(len(chunk) for chunk in stream) < 200
+
+
+def test_iterable_upload_cannot_be_resent():
+    source = UploadSource(iter([b'abc', b'def']), file_name='data.txt')
+    assert not source.rewindable
+    stream = MultipartStream({}, {'binary': source})
+    assert stream.len == 0
+    # never rewindable, not even before it has been read
+    with pytest.raises(OSError):
+        stream.tell()
+    assert body_positions({'data': stream}) is None
+    assert b'abcdef' in b''.join(stream)
+    with pytest.raises(ValueError):
+        b''.join(stream)
+
+
+def test_file_upload_is_read_from_its_position():
+    file_obj = io.BytesIO(b'headerbody')
+    file_obj.seek(6)
+    source = UploadSource(file_obj)
+    assert source.size() == 4
+    assert b''.join(source.iter_chunks()) == b'body'
+    source.rewind()
+    assert b''.join(source.iter_chunks()) == b'body'
+
+
+def test_iterable_upload_is_not_cached():
+    session, transport = session_with(FakeResponse({'RESP_PAYLOAD': {}}), FakeResponse({'RESP_PAYLOAD': {}}))
+    cache = ResponseCache()
+    for _ in range(2):
+        t = TermiteRequestBuilder()
+        t.set_url('http://termite/api')
+        t.set_session(session)
+        t.set_cache(cache)
+        t.set_binary_content(iter([b'BRCA1 ', b'is a gene']), file_name='x.txt')
+        assert request_key(t.url, t.payload, t.binary_content) is None
+        assert t.execute() == {'RESP_PAYLOAD': {}}
+    assert len(transport.bodies) == 2
+    assert all(b'BRCA1 is a gene' in body for body in transport.bodies)
+
+
+def test_file_upload_is_cached(tmp_path):
+    path = tmp_path / 'x.txt'
+    path.write_bytes(b'BRCA1 is a gene')
+    session, transport = session_with(FakeResponse({'RESP_PAYLOAD': {}}))
+    cache = ResponseCache()
+    for _ in range(2):
+        t = TermiteRequestBuilder()
+        t.set_url('http://termite/api')
+        t.set_session(session)
+        t.set_cache(cache)
+        t.set_binary_content(str(path))
+        assert t.execute() == {'RESP_PAYLOAD': {}}
+    assert len(transport.bodies) == 1
+
+
+def test_iterable_upload_is_not_retried():
+    session, transport = session_with(requests.exceptions.ConnectionError('reset'), FakeResponse({}))
+    stream = MultipartStream({}, {'binary': UploadSource(iter([b'abc']), file_name='x.txt')})
+    # the connection error is raised, not an error about rewinding the body
+    with pytest.raises(requests.exceptions.ConnectionError):
+        session.post('http://termite/api', data=stream)
+    assert len(transport.bodies) == 1
+
+    session, transport = session_with(FakeResponse({}, status_code=503), FakeResponse({}))
+    stream = MultipartStream({}, {'binary': UploadSource(iter([b'abc']), file_name='x.txt')})
+    assert session.post('http://termite/api', data=stream).status_code == 503
+    assert len(transport.bodies) == 1
+
+
+def test_file_upload_is_retried(tmp_path):
+    path = tmp_path / 'x.txt'
+    path.write_bytes(b'abc')
+    session, transport = session_with(requests.exceptions.ConnectionError('reset'), FakeResponse({}))
+    stream = MultipartStream({}, {'binary': UploadSource(str(path))})
+    assert session.post('http://termite/api', data=stream).status_code == 200
+    assert len(transport.bodies) == 2
+    assert transport.bodies[0] == transport.bodies[1]